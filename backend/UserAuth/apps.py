@@ -5,3 +5,6 @@ class UserauthConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'UserAuth'
     verbose_name = 'Пользователи'
+
+    def ready(self):
+        from . import signals  # noqa: F401
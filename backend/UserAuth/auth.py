@@ -1,3 +1,7 @@
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
 from rest_framework.authentication import BaseAuthentication, get_authorization_header
 from rest_framework import exceptions
 from django.contrib.auth import get_user_model
@@ -5,6 +9,57 @@ from .token_store import get_username_by_token
 
 User = get_user_model()
 
+USER_CACHE_SIZE = getattr(settings, "AUTH_USER_CACHE_SIZE", 1024)
+# Saves in this process evict immediately; the TTL bounds how long another
+# worker may keep serving a user object changed elsewhere.
+USER_CACHE_TTL = getattr(settings, "AUTH_USER_CACHE_TTL", 60)
+
+
+# Only the field values are cached: every get() builds a fresh User, so
+# whatever one request sets or caches on its user never reaches another.
+class UserCache:
+    def __init__(self, size=USER_CACHE_SIZE, ttl=USER_CACHE_TTL):
+        self.size = size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._users = OrderedDict()
+
+    def get(self, username):
+        with self._lock:
+            entry = self._users.get(username)
+            if entry is None:
+                return None
+            if entry[2] <= time.monotonic():
+                del self._users[username]
+                return None
+            self._users.move_to_end(username)
+        model, db, names, values = entry[1]
+        return model.from_db(db, names, values)
+
+    def put(self, user):
+        if self.size <= 0:
+            return
+        names = tuple(f.attname for f in user._meta.concrete_fields)
+        snapshot = (type(user), user._state.db, names, tuple(getattr(user, name) for name in names))
+        with self._lock:
+            self._users[user.get_username()] = (user.pk, snapshot, time.monotonic() + self.ttl)
+            self._users.move_to_end(user.get_username())
+            while len(self._users) > self.size:
+                self._users.popitem(last=False)
+
+    def invalidate(self, user):
+        with self._lock:
+            for username in [u for u, (pk, _s, _t) in self._users.items() if pk == user.pk]:
+                del self._users[username]
+
+    def clear(self):
+        with self._lock:
+            self._users.clear()
+
+
+user_cache = UserCache()
+
+
 class InMemoryTokenAuthentication(BaseAuthentication):
     keyword = b"Token"
 
@@ -25,8 +80,11 @@ class InMemoryTokenAuthentication(BaseAuthentication):
         username = get_username_by_token(token)
         if not username:
             raise exceptions.AuthenticationFailed("Invalid or expired token.")
-        try:
-            user = User.objects.get(username=username)
-        except User.DoesNotExist:
-            raise exceptions.AuthenticationFailed("User not found for token.")
+        user = user_cache.get(username)
+        if user is None:
+            try:
+                user = User.objects.get(username=username)
+            except User.DoesNotExist:
+                raise exceptions.AuthenticationFailed("User not found for token.")
+            user_cache.put(user)
         return (user, token)
@@ -0,0 +1,52 @@
+import time
+import uuid
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from rest_framework.test import APIRequestFactory
+from UserAuth.auth import InMemoryTokenAuthentication, user_cache
+from UserAuth.token_store import create_token_for, delete_token, get_backend
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Измеряет накладные расходы InMemoryTokenAuthentication на запрос (мкс и SQL-запросы) "
+        "с холодным и тёплым кэшем пользователей. Тестовый пользователь откатывается."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=20_000)
+
+    def handle(self, *args, **opts):
+        n = opts["requests"]
+        self.stdout.write(f"хранилище токенов: {type(get_backend()).__name__}")
+        try:
+            with transaction.atomic():
+                user = get_user_model().objects.create_user(f"bench-{uuid.uuid4().hex[:8]}")
+                token = create_token_for(user.get_username())
+                request = APIRequestFactory().get("/", HTTP_AUTHORIZATION=f"Token {token}")
+                auth = InMemoryTokenAuthentication()
+                for label, warm in (("холодный кэш", False), ("тёплый кэш", True)):
+                    user_cache.clear()
+                    if warm:
+                        auth.authenticate(request)
+                    queries = []
+                    with connection.execute_wrapper(lambda execute, *a: queries.append(1) or execute(*a)):
+                        started = time.perf_counter()
+                        for _ in range(n):
+                            if not warm:
+                                user_cache.clear()
+                            auth.authenticate(request)
+                        elapsed = time.perf_counter() - started
+                    self.stdout.write(
+                        f"{label}: {elapsed / n * 1e6:.1f} мкс/запрос, {len(queries) / n:.2f} SQL-запросов/запрос"
+                    )
+                delete_token(token)
+                raise _Rollback
+        except _Rollback:
+            pass
+        user_cache.clear()
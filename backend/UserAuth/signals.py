@@ -0,0 +1,42 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from .auth import user_cache
+from .token_store import clear_tokens_for_user
+
+User = get_user_model()
+
+
+# Deactivated or deleted users lose their tokens in the shared store, so
+# every worker stops accepting them at once, whatever its user cache holds.
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, **kwargs):
+    user_cache.invalidate(instance)
+    if not instance.is_active:
+        clear_tokens_for_user(instance.get_username())
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    user_cache.invalidate(instance)
+    clear_tokens_for_user(instance.get_username())
+
+
+# A group or permission change may concern any number of cached users.
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def group_changed(sender, **kwargs):
+    user_cache.clear()
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+@receiver(m2m_changed, sender=User.user_permissions.through)
+@receiver(m2m_changed, sender=Group.permissions.through)
+def permissions_changed(sender, instance, action, reverse, **kwargs):
+    if not action.startswith("post_"):
+        return
+    if isinstance(instance, User) and not reverse:
+        user_cache.invalidate(instance)
+    else:
+        user_cache.clear()
@@ -1,3 +1,173 @@
-from django.test import TestCase
+import os
+import time
+from types import SimpleNamespace
+from unittest import mock, skipUnless
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group, Permission
+from django.test import SimpleTestCase, TestCase
+from rest_framework.test import APIClient
+from . import token_store
+from .auth import UserCache, user_cache
+from .token_store import InMemoryTokenBackend, RedisTokenBackend
 
-# Create your tests here.
+REDIS_URL = os.environ.get("REDIS_URL", "")
+
+
+class InMemoryTokenBackendTests(SimpleTestCase):
+    def setUp(self):
+        self.now = 1000.0
+        self.enterContext(mock.patch("UserAuth.token_store.time.monotonic", lambda: self.now))
+
+    def test_expiry(self):
+        backend = InMemoryTokenBackend(ttl=10, sliding=False)
+        token = backend.create("ann")
+        self.now += 9
+        self.assertEqual(backend.get_username(token), "ann")
+        self.now += 2
+        self.assertIsNone(backend.get_username(token))
+        self.assertEqual(backend._by_user, {})
+
+    def test_sliding_refresh(self):
+        backend = InMemoryTokenBackend(ttl=10, sliding=True)
+        token = backend.create("ann")
+        for _ in range(5):
+            self.now += 9
+            self.assertEqual(backend.get_username(token), "ann")
+        self.now += 11
+        self.assertIsNone(backend.get_username(token))
+
+    def test_clear_user(self):
+        backend = InMemoryTokenBackend(ttl=10)
+        tokens = [backend.create("ann"), backend.create("ann")]
+        other = backend.create("bob")
+        backend.clear_user("ann")
+        self.assertEqual([backend.get_username(t) for t in tokens], [None, None])
+        self.assertEqual(backend.get_username(other), "bob")
+
+
+@skipUnless(REDIS_URL, "Needs REDIS_URL")
+class RedisTokenBackendTests(SimpleTestCase):
+    def setUp(self):
+        self.backend = RedisTokenBackend(ttl=2, url=REDIS_URL)
+        self.backend.PREFIX = "test:auth:token:"
+        self.backend.USER_PREFIX = "test:auth:user:"
+        self.addCleanup(self.backend.clear_user, "ann")
+
+    def test_expiry(self):
+        self.backend.sliding = False
+        token = self.backend.create("ann")
+        self.assertEqual(self.backend.get_username(token), "ann")
+        time.sleep(2.2)
+        self.assertIsNone(self.backend.get_username(token))
+
+    # The index must outlive the tokens sliding expiry keeps alive.
+    def test_sliding_refresh_keeps_index(self):
+        token = self.backend.create("ann")
+        for _ in range(3):
+            time.sleep(0.8)
+            self.assertEqual(self.backend.get_username(token), "ann")
+        self.assertEqual(self.backend.redis.ttl(self.backend.USER_PREFIX + "ann"), -1)
+        self.backend.clear_user("ann")
+        self.assertIsNone(self.backend.get_username(token))
+
+    def test_create_drops_expired_members(self):
+        first = self.backend.create("ann")
+        self.backend.redis.delete(self.backend.PREFIX + first)
+        second = self.backend.create("ann")
+        self.assertEqual(self.backend.redis.smembers(self.backend.USER_PREFIX + "ann"), {second.encode()})
+
+
+class UserCacheTests(SimpleTestCase):
+    def user(self, pk, name):
+        return get_user_model()(pk=pk, username=name)
+
+    def test_lru_eviction(self):
+        cache = UserCache(size=2, ttl=60)
+        a, b, c = self.user(1, "a"), self.user(2, "b"), self.user(3, "c")
+        cache.put(a)
+        cache.put(b)
+        self.assertEqual(cache.get("a").pk, 1)
+        cache.put(c)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual((cache.get("a").pk, cache.get("c").pk), (1, 3))
+
+    def test_ttl(self):
+        cache = UserCache(size=2, ttl=60)
+        cache.put(self.user(1, "a"))
+        with mock.patch("UserAuth.auth.time.monotonic", return_value=time.monotonic() + 61):
+            self.assertIsNone(cache.get("a"))
+
+    # Each request gets its own instance; changes to one stay with it.
+    def test_get_returns_a_new_user(self):
+        cache = UserCache(size=2, ttl=60)
+        user = self.user(1, "a")
+        cache.put(user)
+        first = cache.get("a")
+        self.assertIsNot(first, user)
+        first.is_staff = True
+        first._perm_cache = {"web.view_callrecord"}
+        second = cache.get("a")
+        self.assertIsNot(second, first)
+        self.assertFalse(second.is_staff or hasattr(second, "_perm_cache"))
+        self.assertFalse(second._state.adding)
+
+
+class TokenSignalTests(TestCase):
+    def backends(self):
+        yield InMemoryTokenBackend()
+        if REDIS_URL:
+            backend = RedisTokenBackend(url=REDIS_URL)
+            backend.PREFIX = "test:auth:token:"
+            backend.USER_PREFIX = "test:auth:user:"
+            yield backend
+
+    def setUp(self):
+        user_cache.clear()
+        self.user = get_user_model().objects.create_user("ann", password="x")
+
+    def authenticated(self, token):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Token {token}")
+        return client.get("/api/calls/").status_code == 200
+
+    def test_deactivate_and_delete_revoke_tokens(self):
+        for backend in self.backends():
+            with self.subTest(backend=type(backend).__name__), mock.patch.object(token_store, "_backend", backend):
+                self.user.is_active = True
+                self.user.save()
+                token = backend.create("ann")
+                self.assertTrue(self.authenticated(token))
+                self.assertIsNotNone(user_cache.get("ann"))
+
+                self.user.is_active = False
+                self.user.save()
+                self.assertIsNone(user_cache.get("ann"))
+                self.assertIsNone(backend.get_username(token))
+                self.assertFalse(self.authenticated(token))
+
+                token = backend.create("ann")
+                get_user_model().objects.filter(pk=self.user.pk).first().delete()
+                self.assertIsNone(backend.get_username(token))
+                self.user = get_user_model().objects.create_user("ann", password="x")
+
+
+class UserCacheSignalTests(TestCase):
+    def setUp(self):
+        user_cache.clear()
+        self.user = get_user_model().objects.create_user("ann", password="x")
+        self.group = Group.objects.create(name="operators")
+        self.perm = Permission.objects.get(codename="view_callrecord")
+
+    def assertEvicted(self, change):
+        user_cache.put(self.user)
+        change()
+        self.assertIsNone(user_cache.get("ann"))
+
+    def test_permission_changes_evict(self):
+        self.assertEvicted(lambda: self.user.user_permissions.add(self.perm))
+        self.assertEvicted(lambda: self.user.groups.add(self.group))
+        self.assertEvicted(lambda: self.group.user_set.remove(self.user))
+        self.assertEvicted(lambda: self.group.permissions.add(self.perm))
+        self.assertEvicted(lambda: self.perm.group_set.clear())
+        self.assertEvicted(lambda: self.group.save())
+        self.assertEvicted(lambda: self.group.delete())
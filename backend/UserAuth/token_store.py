@@ -1,29 +1,166 @@
-import uuid
 import threading
+import time
+import uuid
 from typing import Optional
+from django.conf import settings
+from django.utils.module_loading import import_string
 
-_LOCK = threading.Lock()
-_TOKEN_MAP: dict[str, str] = {} 
+TOKEN_TTL = getattr(settings, "AUTH_TOKEN_TTL", 8 * 24 * 60 * 60)
+# Sliding expiry: every successful lookup pushes the expiry TTL seconds out.
+TOKEN_SLIDING = getattr(settings, "AUTH_TOKEN_SLIDING", True)
 
-def create_token_for(username: str) -> str:
-    with _LOCK:
+
+# Tokens live in this process only: fine for a single worker and for tests.
+# Expired tokens are dropped when looked up and by a sweep every
+# SWEEP_EVERY new tokens; the user index makes per-user logout O(tokens).
+class InMemoryTokenBackend:
+    SWEEP_EVERY = 1000
+
+    def __init__(self, ttl=TOKEN_TTL, sliding=TOKEN_SLIDING):
+        self.ttl = ttl
+        self.sliding = sliding
+        self._lock = threading.Lock()
+        self._tokens: dict[str, list] = {}
+        self._by_user: dict[str, set] = {}
+        self._created = 0
+
+    def _drop(self, token):
+        entry = self._tokens.pop(token, None)
+        if entry is None:
+            return
+        tokens = self._by_user.get(entry[0])
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._by_user[entry[0]]
+
+    def _sweep(self, now):
+        for token in [t for t, (_u, expires) in self._tokens.items() if expires <= now]:
+            self._drop(token)
+
+    def create(self, username: str) -> str:
         token = uuid.uuid4().hex
-        _TOKEN_MAP[token] = username
+        now = time.monotonic()
+        with self._lock:
+            self._created += 1
+            if self._created % self.SWEEP_EVERY == 0:
+                self._sweep(now)
+            self._tokens[token] = [username, now + self.ttl]
+            self._by_user.setdefault(username, set()).add(token)
         return token
 
+    def get_username(self, token: str) -> Optional[str]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._tokens.get(token)
+            if entry is None:
+                return None
+            if entry[1] <= now:
+                self._drop(token)
+                return None
+            if self.sliding:
+                entry[1] = now + self.ttl
+            return entry[0]
+
+    def delete(self, token: str) -> None:
+        with self._lock:
+            self._drop(token)
+
+    def clear_user(self, username: str) -> None:
+        with self._lock:
+            for token in list(self._by_user.get(username, ())):
+                self._drop(token)
+
+
+# Shared between all workers. Each token is a key with a TTL; a set per user
+# indexes the user's tokens for logout-everywhere. With sliding expiry the
+# lookup is a single GETEX round trip. The index has no TTL of its own (a
+# sliding token can outlive any TTL given to it); members whose token has
+# expired are dropped when the user logs in again.
+class RedisTokenBackend:
+    PREFIX = "auth:token:"
+    USER_PREFIX = "auth:user:"
+
+    def __init__(self, ttl=TOKEN_TTL, sliding=TOKEN_SLIDING, url=None):
+        import redis
+
+        self.ttl = ttl
+        self.sliding = sliding
+        self.redis = redis.Redis.from_url(url or getattr(settings, "AUTH_TOKEN_REDIS_URL", settings.REDIS_URL))
+
+    def create(self, username: str) -> str:
+        token = uuid.uuid4().hex
+        user_key = self.USER_PREFIX + username
+        members = [m.decode() for m in self.redis.smembers(user_key)]
+        with self.redis.pipeline() as pipe:
+            for member in members:
+                pipe.exists(self.PREFIX + member)
+            alive = pipe.execute()
+        with self.redis.pipeline() as pipe:
+            pipe.set(self.PREFIX + token, username, ex=self.ttl)
+            pipe.sadd(user_key, token)
+            dead = [m for m, exists in zip(members, alive) if not exists]
+            if dead:
+                pipe.srem(user_key, *dead)
+            pipe.persist(user_key)
+            pipe.execute()
+        return token
+
+    def get_username(self, token: str) -> Optional[str]:
+        key = self.PREFIX + token
+        value = self.redis.getex(key, ex=self.ttl) if self.sliding else self.redis.get(key)
+        return value.decode() if value is not None else None
+
+    def delete(self, token: str) -> None:
+        key = self.PREFIX + token
+        username = self.redis.getdel(key)
+        if username is not None:
+            self.redis.srem(self.USER_PREFIX + username.decode(), token)
+
+    def clear_user(self, username: str) -> None:
+        user_key = self.USER_PREFIX + username
+        tokens = self.redis.smembers(user_key)
+        with self.redis.pipeline() as pipe:
+            for token in tokens:
+                pipe.delete(self.PREFIX + token.decode())
+            pipe.delete(user_key)
+            pipe.execute()
+
+
+BACKENDS = {
+    "memory": InMemoryTokenBackend,
+    "redis": RedisTokenBackend,
+}
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+# AUTH_TOKEN_BACKEND is "memory", "redis", a dotted path, or "auto" (redis
+# when REDIS_URL is set).
+def get_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                name = getattr(settings, "AUTH_TOKEN_BACKEND", "auto")
+                if name == "auto":
+                    name = "redis" if getattr(settings, "REDIS_URL", "") else "memory"
+                cls = BACKENDS.get(name) or import_string(name)
+                _backend = cls()
+    return _backend
+
+
+def create_token_for(username: str) -> str:
+    return get_backend().create(username)
+
 def get_username_by_token(token: str) -> Optional[str]:
     if not token:
         return None
-    with _LOCK:
-        return _TOKEN_MAP.get(token)
+    return get_backend().get_username(token)
 
 def delete_token(token: str) -> None:
-    with _LOCK:
-        if token in _TOKEN_MAP:
-            del _TOKEN_MAP[token]
+    get_backend().delete(token)
 
 def clear_tokens_for_user(username: str) -> None:
-    with _LOCK:
-        to_delete = [t for t, u in _TOKEN_MAP.items() if u == username]
-        for t in to_delete:
-            del _TOKEN_MAP[t]
+    get_backend().clear_user(username)
@@ -1,15 +1,39 @@
+import hashlib
 import os
+import tempfile
+from functools import partial
 from io import BytesIO
 from typing import List, Optional, Tuple
 from PIL import Image
+from django.conf import settings
 from django.core.files.base import ContentFile
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+# Encoded results keyed by source hash and target size, so saving the same
+# upload again costs one file read. Empty string turns the cache off.
+WEBP_CACHE_DIR = getattr(settings, "IMAGE_WEBP_CACHE_DIR", os.path.join(tempfile.gettempdir(), "webp-cache"))
+WEBP_CACHE_MAX_FILES = getattr(settings, "IMAGE_WEBP_CACHE_MAX_FILES", 256)
+# Deferred mode saves the original upload as is and queues the encode; the
+# queue is a dotted path to enqueue(instance, entries).
+DEFERRED = getattr(settings, "IMAGE_PROCESSING_DEFERRED", False)
+QUEUE = getattr(settings, "IMAGE_PROCESSING_QUEUE", "web.images.enqueue")
 
 class ImageOptimizationMixin:
     class Meta:
         abstract = True
 
+    # Only the bounds of WEBP_QUALITIES are used: the search tries any
+    # quality between them and stops within WEBP_QUALITY_STEP of the best.
     WEBP_QUALITIES = (95, 85, 75, 65, 55, 40, 30)
     WEBP_FALLBACK_QUALITY = 20
+    WEBP_QUALITY_STEP = 2
+    WEBP_PROBE_METHOD = 0
+    WEBP_FINAL_METHOD = 6
+    WEBP_PROXY_SIDE = 512
+    WEBP_SIZE_MARGIN = 0.97
+    WEBP_CACHE_VERSION = 1
+    IMAGE_DEFERRED = DEFERRED
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -20,6 +44,56 @@ class ImageOptimizationMixin:
                 self._orig_file_names[f] = field_val.name if getattr(field_val, "name", None) else None
             except Exception:
                 self._orig_file_names[f] = None
+        self._deferred_images = []
+        self._encoded_fields = []
+        self._replaced_files = []
+
+    # The row and its queued image jobs are committed together: a worker
+    # never sees a job for an unsaved row, and a failed enqueue rolls the
+    # save back. Encoded files only get their names here and are written
+    # once the row commits, so a failed or rolled-back save leaves none.
+    def save(self, *args, **kwargs):
+        using = kwargs.get("using")
+        with transaction.atomic(using=using):
+            staged = self._stage_encoded_files()
+            replaced, self._replaced_files = self._replaced_files, []
+            super().save(*args, **kwargs)
+            deferred, self._deferred_images = self._deferred_images, []
+            if deferred:
+                import_string(QUEUE)(self, deferred)
+            if staged or replaced:
+                transaction.on_commit(partial(self._store_files, staged, replaced), using=using)
+        for f in getattr(self, "_image_field_names", []):
+            self._orig_file_names[f] = getattr(getattr(self, f, None), "name", None) or None
+
+    # Swaps the files made by _process_pair for names reserved in their
+    # storage; returns (field, name, content) for _store_files().
+    def _stage_encoded_files(self):
+        staged = []
+        names, self._encoded_fields = self._encoded_fields, []
+        for name in names:
+            file = getattr(self, name, None)
+            if not file or getattr(file, "_committed", True):
+                continue
+            field = self._meta.get_field(name)
+            target = field.storage.get_available_name(
+                field.generate_filename(self, file.name), max_length=field.max_length
+            )
+            staged.append((name, target, file.file))
+            setattr(self, name, target)
+        return staged
+
+    # Writes the staged files and deletes the (field, name) files they
+    # replaced. A name taken since it was reserved is fixed up in the row.
+    def _store_files(self, staged, replaced) -> None:
+        for name, target, content in staged:
+            content.seek(0)
+            stored = self._meta.get_field(name).storage.save(target, content)
+            if stored != target:
+                type(self)._default_manager.filter(pk=self.pk).update(**{name: stored})
+                setattr(self, name, stored)
+        for name, file_name in replaced:
+            self._meta.get_field(name).storage.delete(file_name)
 
     def _base_name(self, field) -> str:
         name = getattr(field, "name", "") or "image"
@@ -45,35 +119,165 @@ class ImageOptimizationMixin:
         name = getattr(field, "name", "") or ""
         return name.lower().endswith(".webp")
 
-    def _encode_webp_best_fit(self, img: Image.Image, max_kb: int) -> Optional[bytes]:
+    def _encode_webp(self, img: Image.Image, quality: int, method: int) -> bytes:
         buf = BytesIO()
-        for q in self.WEBP_QUALITIES:
-            buf.seek(0)
-            buf.truncate()
-            img.save(buf, format="WEBP", quality=q, method=6)
-            if buf.tell() / 1024.0 <= max_kb:
-                return buf.getvalue()
-        buf.seek(0)
-        buf.truncate()
-        img.save(buf, format="WEBP", quality=self.WEBP_FALLBACK_QUALITY, method=6)
+        img.save(buf, format="WEBP", quality=quality, method=method)
         return buf.getvalue()
 
+    # Highest quality expected to fit the budget after the final encode, or
+    # None. Probes are fast encodes: the downscaled proxy gives the shape of
+    # size(quality), each full-size probe rescales it, and the next probe is
+    # the quality the rescaled curve predicts. The gap between the fast and
+    # the final method is measured on the proxy, with WEBP_SIZE_MARGIN slack.
+    def _webp_search_quality(self, img: Image.Image, budget: float) -> Optional[int]:
+        low, top = min(self.WEBP_QUALITIES), max(self.WEBP_QUALITIES)
+        fast = self.WEBP_PROBE_METHOD
+        proxy = img.reduce(max(2, max(img.size) // self.WEBP_PROXY_SIDE))
+        proxy_sizes = {}
+
+        def proxy_size(q):
+            if q not in proxy_sizes:
+                proxy_sizes[q] = len(self._encode_webp(proxy, q, fast))
+            return proxy_sizes[q]
+
+        def predict(lo, hi, scale, target):
+            while hi - lo > 1:
+                mid = (lo + hi) // 2
+                if proxy_size(mid) * scale <= target:
+                    lo = mid
+                else:
+                    hi = mid
+            return lo
+
+        def final_ratio(q):
+            return len(self._encode_webp(proxy, q, self.WEBP_FINAL_METHOD)) / proxy_size(q) / self.WEBP_SIZE_MARGIN
+
+        size = len(self._encode_webp(img, top, fast))
+        if size * final_ratio(top) <= budget:
+            return top
+        scale = size / proxy_size(top)
+        seed = max(predict(low - 1, top, scale, budget), low)
+        target = budget / final_ratio(seed)
+        lo, hi = low - 1, top
+        while hi - lo > self.WEBP_QUALITY_STEP:
+            probe = min(max(predict(lo, hi, scale, target), lo + 1), hi - 1)
+            size = len(self._encode_webp(img, probe, fast))
+            if size <= target:
+                lo = probe
+            else:
+                hi = probe
+            scale = size / proxy_size(probe)
+        return lo if lo >= low else None
+
+    # The quality bounds are part of the key, so models with different
+    # settings never share an entry.
+    def _webp_cache_path(self, source_hash: Optional[str], max_kb: int) -> Optional[str]:
+        if not source_hash or not WEBP_CACHE_DIR:
+            return None
+        qualities = f"q{min(self.WEBP_QUALITIES)}-{max(self.WEBP_QUALITIES)}-{self.WEBP_FALLBACK_QUALITY}"
+        return os.path.join(WEBP_CACHE_DIR, f"{source_hash}-{max_kb}-{qualities}-v{self.WEBP_CACHE_VERSION}.webp")
+
+    def _webp_cache_read(self, path: Optional[str]) -> Optional[bytes]:
+        if not path:
+            return None
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _webp_cache_store(self, path: str, data: bytes) -> None:
+        try:
+            os.makedirs(WEBP_CACHE_DIR, exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+            entries = [e for e in os.scandir(WEBP_CACHE_DIR) if e.name.endswith(".webp")]
+            if len(entries) > WEBP_CACHE_MAX_FILES:
+                entries.sort(key=lambda e: e.stat().st_mtime)
+                for e in entries[: len(entries) - WEBP_CACHE_MAX_FILES]:
+                    os.remove(e.path)
+        except OSError:
+            pass
+
+    # Final encode at the searched quality. If it still overshoots the
+    # budget, bisect the qualities below it with final encodes, again
+    # stopping within WEBP_QUALITY_STEP of the best; None if even the lowest
+    # does not fit.
+    def _encode_webp_final(self, img: Image.Image, quality: int, budget: float) -> Optional[bytes]:
+        data = self._encode_webp(img, quality, self.WEBP_FINAL_METHOD)
+        if len(data) <= budget:
+            return data
+        best = None
+        lo, hi = min(self.WEBP_QUALITIES) - 1, quality
+        while hi - lo > (1 if best is None else self.WEBP_QUALITY_STEP):
+            mid = (lo + hi + 1) // 2
+            data = self._encode_webp(img, mid, self.WEBP_FINAL_METHOD)
+            if len(data) <= budget:
+                lo, best = mid, data
+            else:
+                hi = mid
+        return best
+
+    def _encode_webp_best_fit(self, img: Image.Image, max_kb: int, source_hash: Optional[str] = None) -> Optional[bytes]:
+        path = self._webp_cache_path(source_hash, max_kb)
+        cached = self._webp_cache_read(path)
+        if cached:
+            return cached
+        budget = max_kb * 1024
+        quality = self._webp_search_quality(img, budget)
+        data = None if quality is None else self._encode_webp_final(img, quality, budget)
+        if data is None:
+            data = self._encode_webp(img, self.WEBP_FALLBACK_QUALITY, self.WEBP_FINAL_METHOD)
+        if path:
+            self._webp_cache_store(path, data)
+        return data
+
+    # LANCZOS on the full image is the slow part of a thumbnail; with
+    # reducing_gap PIL first shrinks by an integer factor with reduce() and
+    # only filters the last, at most 2x, step.
+    def _resize_to_width(self, img: Image.Image, width: int) -> Image.Image:
+        aspect = img.width / img.height if img.height else 1
+        height = max(1, int(width / (aspect if aspect else 1)))
+        return img.resize((width, height), Image.Resampling.LANCZOS, reducing_gap=2.0)
+
     def _make_thumbnail_bytes(self, img: Image.Image, width: int, quality: int = 85) -> Optional[bytes]:
         try:
             if img.height == 0:
                 return None
-            aspect = img.width / img.height if img.height else 1
-            height = max(1, int(width / (aspect if aspect else 1)))
-            thumb = img.resize((width, height), Image.Resampling.LANCZOS)
             buf = BytesIO()
-            thumb.save(buf, format="WEBP", quality=quality, method=6)
+            self._resize_to_width(img, width).save(buf, format="WEBP", quality=quality, method=6)
             return buf.getvalue()
         except Exception:
             return None
 
-    def _image_to_pil(self, src_bytes: bytes) -> Optional[Image.Image]:
+    # Widest first; each rendition is resized from the smallest image already
+    # made that is still at least twice as wide, not from the full source.
+    def _make_renditions(self, img: Image.Image, widths, quality: int = 85) -> dict:
+        out = {}
+        made = []
+        for width in sorted(set(widths), reverse=True):
+            base = min((m for m in made if m.width >= 2 * width), key=lambda m: m.width, default=img)
+            try:
+                if base.height == 0:
+                    continue
+                thumb = self._resize_to_width(base, width)
+                buf = BytesIO()
+                thumb.save(buf, format="WEBP", quality=quality, method=6)
+            except Exception:
+                continue
+            out[width] = buf.getvalue()
+            made.append(thumb)
+        return out
+
+    # With draft_width set, JPEG sources are decoded by libjpeg at the
+    # smallest 1/2, 1/4 or 1/8 scale that is still at least that wide.
+    def _image_to_pil(self, src_bytes: bytes, draft_width: Optional[int] = None) -> Optional[Image.Image]:
         try:
             img = Image.open(BytesIO(src_bytes))
+            if draft_width and img.format == "JPEG" and img.width > draft_width:
+                img.draft("RGB", (draft_width, max(1, draft_width * img.height // img.width)))
             if img.mode not in ("RGB", "RGBA"):
                 img = img.convert("RGB")
             return img
@@ -83,6 +287,8 @@ class ImageOptimizationMixin:
     def _should_process(self, image_field_name: str) -> bool:
         cur = getattr(self, image_field_name, None)
         cur_name = getattr(cur, "name", None) if cur else None
+        if cur_name and not getattr(cur, "_committed", True):
+            return True
         orig = self._orig_file_names.get(image_field_name)
         if cur_name and cur_name != orig:
             return True
@@ -90,54 +296,104 @@ class ImageOptimizationMixin:
             return True
         return False
 
-    def _process_pair(self, image_field_name: str, thumb_field_name: Optional[str], max_kb: int, thumb_w: int) -> None:
+    # The second config item is a thumbnail field name (with thumb_w as its
+    # width) or a sequence of (field name, width) renditions.
+    def _renditions(self, thumb_field_name, thumb_w: int) -> List[Tuple[str, int]]:
+        if not thumb_field_name:
+            return []
+        if isinstance(thumb_field_name, str):
+            return [(thumb_field_name, thumb_w)]
+        return [(name, width) for name, width in thumb_field_name]
+
+    # (encode_main, missing renditions), or None when the field needs nothing.
+    # force treats an unchanged non-WebP image as a new upload.
+    def _plan(self, image_field_name: str, renditions, force: bool = False):
         img_field = getattr(self, image_field_name, None)
         if not img_field:
-            return
-        if not self._should_process(image_field_name):
-            if thumb_field_name and self._is_webp_name(img_field) and not getattr(self, thumb_field_name, None):
-                src = self._read_bytes_once(img_field)
-                if src:
-                    pil = self._image_to_pil(src)
-                    if pil:
-                        tb = self._make_thumbnail_bytes(pil, thumb_w, quality=85)
-                        if tb:
-                            setattr(self, thumb_field_name, ContentFile(tb, name=f"thumb_{self._base_name(img_field)}.webp"))
-            return
+            return None
+        changed = force or self._should_process(image_field_name)
+        # Renditions of a replaced source are all made again.
+        missing = renditions if changed else [(name, width) for name, width in renditions if not getattr(self, name, None)]
+        is_webp = self._is_webp_name(img_field)
+        encode_main = changed and not is_webp
+        if not encode_main and (not missing or not is_webp):
+            return None
+        return encode_main, missing
 
-        src_bytes = self._read_bytes_once(img_field)
-        if not src_bytes:
+    # One read and one decode per field. A new non-WebP upload is encoded to
+    # WebP and all renditions are regenerated from the decoded source; for a
+    # WebP image only the missing renditions are made. Only encoding the main
+    # image needs the full-size decode: when its WebP is already cached (the
+    # same upload saved again), a JPEG is decoded at the smallest scale the
+    # widest rendition allows.
+    def _process_pair(
+        self, image_field_name: str, thumb_field_name, max_kb: int, thumb_w: int,
+        force: bool = False, src_bytes: Optional[bytes] = None,
+    ) -> None:
+        renditions = self._renditions(thumb_field_name, thumb_w)
+        plan = self._plan(image_field_name, renditions, force)
+        if plan is None:
             return
-
-        if self._is_webp_name(img_field):
-            if thumb_field_name and not getattr(self, thumb_field_name, None):
-                pil = self._image_to_pil(src_bytes)
-                if pil:
-                    tb = self._make_thumbnail_bytes(pil, thumb_w, quality=85)
-                    if tb:
-                        setattr(self, thumb_field_name, ContentFile(tb, name=f"thumb_{self._base_name(img_field)}.webp"))
+        encode_main, missing = plan
+        img_field = getattr(self, image_field_name)
+        src_bytes = src_bytes or self._read_bytes_once(img_field)
+        if not src_bytes:
             return
-
-        pil = self._image_to_pil(src_bytes)
+        targets = renditions if encode_main else missing
+        source_hash = hashlib.sha256(src_bytes).hexdigest() if encode_main else None
+        webp_bytes = self._webp_cache_read(self._webp_cache_path(source_hash, max_kb)) if encode_main else None
+        full_size = encode_main and not webp_bytes
+        draft_width = None if full_size or not targets else max(w for _, w in targets)
+        pil = self._image_to_pil(src_bytes, draft_width=draft_width)
         if not pil:
             return
 
-        webp_bytes = self._encode_webp_best_fit(pil, max_kb)
-        if webp_bytes:
-            webp_name = f"{self._base_name(img_field)}.webp"
-            setattr(self, image_field_name, ContentFile(webp_bytes, name=webp_name))
-            pil_for_thumb = self._image_to_pil(webp_bytes) or pil
-            thumb_bytes = self._make_thumbnail_bytes(pil_for_thumb, thumb_w, quality=85)
-            if thumb_bytes and thumb_field_name:
-                setattr(self, thumb_field_name, ContentFile(thumb_bytes, name=f"thumb_{self._base_name(img_field)}.webp"))
-        else:
-            thumb_bytes = self._make_thumbnail_bytes(pil, thumb_w, quality=85)
-            if thumb_bytes and thumb_field_name and not getattr(self, thumb_field_name, None):
-                setattr(self, thumb_field_name, ContentFile(thumb_bytes, name=f"thumb_{self._base_name(img_field)}.webp"))
+        base = self._base_name(img_field)
+        if encode_main:
+            webp_bytes = webp_bytes or self._encode_webp_best_fit(pil, max_kb, source_hash)
+            if webp_bytes:
+                setattr(self, image_field_name, ContentFile(webp_bytes, name=f"{base}.webp"))
+                self._encoded_fields.append(image_field_name)
+            else:
+                targets = missing
+        rendered = self._make_renditions(pil, [w for _, w in targets], quality=85)
+        for name, width in targets:
+            if width in rendered:
+                previous = getattr(self, name, None)
+                if previous and getattr(previous, "_committed", False) and previous.name:
+                    self._replaced_files.append((name, previous.name))
+                setattr(self, name, ContentFile(rendered[width], name=self._rendition_name(base, name, renditions)))
+                self._encoded_fields.append(name)
+
+    # Fields that need work are only hashed here; save() stores the original
+    # and hands them to the queue as (field, renditions, max_kb, thumb_w,
+    # sha256 of the upload).
+    def _defer_images(self, config) -> None:
+        self._deferred_images = []
+        for image_field_name, thumb_field_name, max_kb, thumb_w in config:
+            if self._plan(image_field_name, self._renditions(thumb_field_name, thumb_w)) is None:
+                continue
+            digest = hashlib.sha256()
+            try:
+                for chunk in getattr(self, image_field_name).chunks():
+                    digest.update(chunk)
+            except Exception:
+                continue
+            self._deferred_images.append(
+                (image_field_name, thumb_field_name, max_kb, thumb_w, digest.hexdigest())
+            )
+
+    def _rendition_name(self, base: str, field_name: str, renditions) -> str:
+        if len(renditions) == 1:
+            return f"thumb_{base}.webp"
+        return f"{field_name}_{base}.webp"
 
     def process_images_config(self, config: List[Tuple[str, Optional[str], int, int]]) -> None:
+        if self.IMAGE_DEFERRED:
+            self._defer_images(config)
+            return
         for image_field_name, thumb_field_name, max_kb, thumb_w in config:
             try:
                 self._process_pair(image_field_name, thumb_field_name, max_kb, thumb_w)
             except Exception:
-                continue
\ No newline at end of file
+                continue
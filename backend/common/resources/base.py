@@ -2,6 +2,11 @@ import json
 from import_export import resources
 from import_export import fields as ie_fields
 from django.conf import settings
+from django.db.models import QuerySet
+from parler import appsettings as parler_settings
+from parler.cache import cache as parler_cache, get_translation_cache_key
+
+TRANSLATION_BATCH_SIZE = getattr(settings, "IMPORT_TRANSLATION_BATCH_SIZE", 500)
 
 def _safe_setattr(o, n, v):
     try:
@@ -60,6 +65,7 @@ class TranslatableResource(resources.ModelResource):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self._translations_map = {}
+        self._pending_translations = []
         try:
             self._languages = [c for c, _ in getattr(settings, "LANGUAGES", [("en", "English")])]
         except Exception:
@@ -71,9 +77,24 @@ class TranslatableResource(resources.ModelResource):
         except Exception:
             return None
 
+    def _parler_root(self):
+        meta = getattr(self._meta.model, "_parler_meta", None)
+        return meta.root if meta is not None else None
+
+    # Exports walk the queryset in chunks with the translations prefetched,
+    # one extra query per chunk instead of one per object and language.
+    def iter_queryset(self, queryset):
+        root = self._parler_root()
+        if root is None or not isinstance(queryset, QuerySet):
+            yield from super().iter_queryset(queryset)
+            return
+        queryset = queryset.prefetch_related(root.rel_name)
+        yield from queryset.iterator(chunk_size=self.get_chunk_size())
+
     def get_translations_dict(self, obj, fields):
         out = {}
         mgr = getattr(obj, "translations", None)
+        prefetched = "translations" in getattr(obj, "_prefetched_objects_cache", {})
 
         if mgr is not None:
             try:
@@ -89,6 +110,8 @@ class TranslatableResource(resources.ModelResource):
                     out[lang] = data
                 if out:
                     return out
+            if prefetched:
+                return out
 
         for lang in self._languages:
             data = {}
@@ -151,11 +174,73 @@ class TranslatableResource(resources.ModelResource):
             translations = self._translations_map.pop(str(alt), None)
         if not translations:
             return
+        values = {}
         for lang, payload in translations.items():
             try:
-                self.apply_translation(instance, lang, payload)
+                data = self.apply_translation(instance, lang, payload)
             except Exception:
                 continue
+            if data:
+                values[lang] = data
+        if not values:
+            return
+        self._pending_translations.append((instance, values))
+        if len(self._pending_translations) >= TRANSLATION_BATCH_SIZE:
+            self.flush_translations()
+
+    def after_import(self, dataset, result, **kwargs):
+        super().after_import(dataset, result, **kwargs)
+        if not kwargs.get("dry_run", False):
+            self.flush_translations()
+
+    # Writes the collected translations: one query for the existing rows of
+    # the batch, then bulk_create/bulk_update. With use_bulk the instances
+    # get their pk only when the resource flushes them, so those wait for
+    # the next call.
+    def flush_translations(self):
+        root = self._parler_root()
+        ready = [(i, t) for i, t in self._pending_translations if i.pk is not None]
+        self._pending_translations = [(i, t) for i, t in self._pending_translations if i.pk is None]
+        if root is None or not ready:
+            return
+        model = root.model
+        names = set(self.TRANSLATION_FIELDS or root.get_translated_fields())
+        existing = {
+            (tr.master_id, tr.language_code): tr
+            for tr in model.objects.filter(master_id__in={i.pk for i, _ in ready}, language_code__in={
+                lang for _, t in ready for lang in t
+            })
+        }
+        created, updated, fields = [], {}, set()
+        for instance, translations in ready:
+            for lang, payload in translations.items():
+                if not isinstance(payload, dict):
+                    continue
+                values = {k: v or "" for k, v in payload.items() if k in names}
+                if not values:
+                    continue
+                tr = existing.get((instance.pk, lang))
+                if tr is None:
+                    tr = model(master_id=instance.pk, language_code=lang, **values)
+                    existing[(instance.pk, lang)] = tr
+                    created.append(tr)
+                else:
+                    for k, v in values.items():
+                        setattr(tr, k, v)
+                    if tr.pk is not None:
+                        updated[tr.pk] = tr
+                fields.update(values)
+                instance._translations_cache[model].pop(lang, None)
+        model.objects.bulk_create(created, batch_size=TRANSLATION_BATCH_SIZE)
+        if updated:
+            model.objects.bulk_update(list(updated.values()), sorted(fields), batch_size=TRANSLATION_BATCH_SIZE)
+        if parler_settings.PARLER_ENABLE_CACHING:
+            parler_cache.delete_many([
+                get_translation_cache_key(model, tr.master_id, tr.language_code) for tr in created + list(updated.values())
+            ])
 
+    # Returns the translated values to store for one language; they are
+    # written in batches by flush_translations(). Subclasses override it to
+    # map or clean the payload and return None to skip the language.
     def apply_translation(self, instance, lang_code, payload):
-        raise NotImplementedError
+        return payload if isinstance(payload, dict) else None
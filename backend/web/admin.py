@@ -1,17 +1,61 @@
 from django.contrib import admin
+from django.contrib.admin.views.main import ORDER_VAR
+from django.db.models import Q
+from django.http import QueryDict
 from parler.admin import TranslatableAdmin
 from unfold.admin import ModelAdmin
 from import_export.admin import ImportExportModelAdmin
 from django.utils.translation import gettext_lazy as _
-from .models import CallRecord
+from .cache import ALL as CACHE_ALL, cached
+from .export import CSV, NDJSON, export_response
+from .models import CallRecord, ImageJob, IngestJob, UploadLedger
+from .pagination import EstimatedCountPaginator
+from .resources import CallRecordResource
+
+
+# Facet counts are an aggregate over the whole filtered changelist; they
+# are kept in the response cache keyed by the other active filters and
+# recomputed only after new data comes in.
+class CachedFacetsMixin:
+    def get_facet_queryset(self, changelist):
+        params = QueryDict(mutable=True)
+        for key, values in changelist.filter_params.items():
+            if key not in self.expected_parameters() and key != ORDER_VAR:
+                params.setlist(key, values)
+        params["_field"] = self.field_path
+        parent = super().get_facet_queryset
+        return cached("admin-facets", params, lambda: (parent(changelist), [CACHE_ALL]))
+
+
+class CachedChoicesFilter(CachedFacetsMixin, admin.ChoicesFieldListFilter):
+    pass
+
+
+class CachedBooleanFilter(CachedFacetsMixin, admin.BooleanFieldListFilter):
+    pass
+
 
 @admin.register(CallRecord)
 class CallRecordAdmin(ModelAdmin, ImportExportModelAdmin):
     list_display = ("id", "__str__", "calldate", "src", "dst", "disposition", "answered")
     list_display_links = ("id", "__str__")
-    search_fields = ("src", "dst", "disposition")
-    list_filter = ("disposition", "answered", "created_at")
+    # Search is by number prefix ("=" for an exact number) or by disposition,
+    # see get_search_results; unanchored substring search is not offered.
+    search_fields = ("src", "dst")
+    search_help_text = _("Начало номера src/dst, «=номер» для точного совпадения или статус")
+    list_filter = (("disposition", CachedChoicesFilter), ("answered", CachedBooleanFilter))
+    date_hierarchy = "calldate"
+    # Base for import-export's changelist template; swaps in the rollup-backed
+    # date hierarchy.
+    change_list_template = "admin/web/callrecord/change_list.html"
+    ordering = ("-calldate", "-id")
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     readonly_fields = ("created_at", "updated_at")
+    resource_classes = [CallRecordResource]
+    # Imported rows are written in bulk and have no instances to log.
+    skip_admin_log = True
+    actions = ("export_csv_stream", "export_csv_gzip_stream", "export_ndjson_gzip_stream")
 
     fieldsets = (
         (
@@ -21,4 +65,61 @@ class CallRecordAdmin(ModelAdmin, ImportExportModelAdmin):
             },
         ),
         (_("Системное"), {"fields": ("created_at", "updated_at")}), 
-    )
\ No newline at end of file
+    )
+
+    def get_search_results(self, request, queryset, search_term):
+        disposition = " ".join(search_term.split()).upper()
+        if disposition in dict(CallRecord.DISPOSITION_CHOICES):
+            return queryset.filter(disposition=disposition), False
+        for term in search_term.split():
+            if term.startswith("="):
+                queryset = queryset.filter(Q(src=term[1:]) | Q(dst=term[1:]))
+            else:
+                queryset = queryset.filter(Q(src__startswith=term) | Q(dst__startswith=term))
+        return queryset, False
+
+    # With "select all" the admin passes the whole filtered changelist
+    # queryset, so these stream exactly what the changelist shows.
+    @admin.action(description=_("Экспорт в CSV (поток)"))
+    def export_csv_stream(self, request, queryset):
+        return export_response(queryset, CSV)
+
+    @admin.action(description=_("Экспорт в CSV.gz (поток)"))
+    def export_csv_gzip_stream(self, request, queryset):
+        return export_response(queryset, CSV, compress=True)
+
+    @admin.action(description=_("Экспорт в NDJSON.gz (поток)"))
+    def export_ndjson_gzip_stream(self, request, queryset):
+        return export_response(queryset, NDJSON, compress=True)
+
+
+@admin.register(IngestJob)
+class IngestJobAdmin(ModelAdmin):
+    list_display = ("id", "state", "created_by", "processed", "created_rows", "rejected", "created_at", "finished_at")
+    list_filter = ("state",)
+    readonly_fields = (
+        "state", "spool_path", "size", "created_by", "offset", "line", "processed", "created_rows", "rejected",
+        "errors", "detail", "worker", "attempts", "heartbeat_at", "started_at", "finished_at", "created_at", "updated_at",
+    )
+
+
+@admin.register(ImageJob)
+class ImageJobAdmin(ModelAdmin):
+    list_display = ("id", "state", "content_type", "object_id", "field", "attempts", "created_at", "finished_at")
+    list_filter = ("state", "content_type")
+    search_fields = ("=object_id", "source_name")
+    readonly_fields = (
+        "key", "state", "content_type", "object_id", "field", "source_name", "source_hash", "config", "attempts",
+        "detail", "worker", "heartbeat_at", "started_at", "finished_at", "created_at", "updated_at",
+    )
+
+
+@admin.register(UploadLedger)
+class UploadLedgerAdmin(ModelAdmin):
+    list_display = ("id", "name", "sha256", "source", "created_by", "rows_created", "duplicates", "first_id", "last_id", "created_at")
+    list_filter = ("source",)
+    search_fields = ("=sha256", "name")
+    readonly_fields = (
+        "sha256", "size", "name", "source", "created_by", "job", "rows_created", "duplicates", "first_id", "last_id",
+        "created_at",
+    )
@@ -5,3 +5,6 @@ class WebConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'web'
     verbose_name = 'Файлы'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,132 @@
+import calendar
+import hashlib
+import threading
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+
+ENABLED = getattr(settings, "CALLS_CACHE", True)
+ALIAS = getattr(settings, "CALLS_CACHE_ALIAS", "default")
+# Entries are invalidated when the data under them changes; the timeout
+# only bounds how long a lost invalidation can go unnoticed.
+TIMEOUT = getattr(settings, "CALLS_CACHE_TIMEOUT", 3600)
+# How long a stale entry may still be served while it is recomputed in the
+# background. 0 turns stale-while-revalidate off.
+STALE_SECONDS = getattr(settings, "CALLS_CACHE_STALE_SECONDS", 30)
+CLOCK_SKEW_NS = int(getattr(settings, "CALLS_CACHE_CLOCK_SKEW", 0.5) * 1e9)
+
+ALL = "calls:gen:all"
+
+
+def get_cache():
+    return caches[ALIAS]
+
+
+def day_key(day):
+    return f"calls:gen:d:{day.isoformat()}"
+
+
+def month_key(day):
+    return f"calls:gen:m:{day:%Y-%m}"
+
+
+# Generation keys covering [first, last]: whole months by their month
+# counter, the ragged ends day by day, so a year is a few dozen keys.
+def span_keys(first, last):
+    keys = []
+    day = first
+    while day <= last:
+        if day.day == 1:
+            month_end = day.replace(day=calendar.monthrange(day.year, day.month)[1])
+            if month_end <= last:
+                keys.append(month_key(day))
+                day = month_end + timedelta(days=1)
+                continue
+        keys.append(day_key(day))
+        day += timedelta(days=1)
+    return keys
+
+
+# Called after a write commits. A counter is moved to at least the current
+# time (in ns): a response is only stored if every counter it depends on is
+# older than the start of its query, so writes to other days do not stop
+# caching. incr() keeps concurrent bumps from moving a counter backwards.
+# Missing counters start from the current time, so a counter that was
+# evicted never comes back with a value an old entry recorded.
+def bump_days(days):
+    cache = get_cache()
+    keys = {ALL}
+    for day in days:
+        keys.add(day_key(day))
+        keys.add(month_key(day))
+    now = time.time_ns()
+    for key in sorted(keys):
+        value = cache.get(key)
+        try:
+            if value is None:
+                raise ValueError
+            cache.incr(key, max(1, now - value))
+        except ValueError:
+            cache.set(key, now, None)
+
+
+def read_generations(keys, missing=None):
+    cache = get_cache()
+    gens = cache.get_many(keys)
+    for key in keys:
+        if gens.get(key) is None:
+            cache.add(key, missing or time.time_ns(), None)
+            gens[key] = cache.get(key)
+    return gens
+
+
+def make_key(name, params):
+    items = sorted((k, tuple(sorted(params.getlist(k)))) for k in params)
+    digest = hashlib.sha1(repr(items).encode()).hexdigest()
+    return f"calls:resp:{name}:{digest}"
+
+
+# ``compute`` returns (value, generation keys the value depends on). The
+# keys are only known once the query has run; the value is returned but not
+# stored if any of them was bumped after the query started (or within
+# CLOCK_SKEW of it, for writers on other hosts).
+def _compute_and_store(key, compute):
+    started = time.time_ns()
+    value, deps = compute()
+    gens = read_generations(sorted(set(deps)), missing=started - CLOCK_SKEW_NS - 1)
+    if all(gen < started - CLOCK_SKEW_NS for gen in gens.values()):
+        get_cache().set(key, (value, gens, None), TIMEOUT)
+    return value
+
+
+def _refresh(key, compute):
+    try:
+        _compute_and_store(key, compute)
+    finally:
+        get_cache().delete(key + ":lock")
+        connections.close_all()
+
+
+# Fresh entries are returned as is. A stale entry is still returned for up
+# to STALE_SECONDS after it was first seen stale, while one thread
+# recomputes it; after that the caller recomputes synchronously.
+def cached(name, params, compute):
+    if not ENABLED:
+        return compute()[0]
+    cache = get_cache()
+    key = make_key(name, params)
+    entry = cache.get(key)
+    if entry is not None:
+        value, gens, stale_since = entry
+        if read_generations(list(gens)) == gens:
+            return value
+        now = time.time()
+        if STALE_SECONDS and (stale_since is None or now - stale_since < STALE_SECONDS):
+            if stale_since is None:
+                cache.set(key, (value, gens, now), TIMEOUT)
+            if cache.add(key + ":lock", 1, STALE_SECONDS):
+                threading.Thread(target=_refresh, args=(key, compute), daemon=True).start()
+            return value
+    return _compute_and_store(key, compute)
@@ -0,0 +1,145 @@
+import re
+from datetime import datetime, time, timezone as dt_timezone
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+YMD = "ymd"
+MDY = "mdy"
+
+SAMPLE_SIZE = 20
+CACHE_LIMIT = 4096
+
+_fromiso = datetime.fromisoformat
+_mdy_re = re.compile(r"^(\d{1,2})[/\-](\d{1,2})[/\-](\d{4})\s+(\d{1,2}):(\d{2})(?::(\d{2}))?$")
+
+
+# Parses calldate strings from Asterisk exports. A batch is sampled once to
+# detect its layout; the detected layout then gets a fast path and anything
+# that does not fit it goes through the general parser. Naive values are
+# localized with a per-day fixed UTC offset, so the zoneinfo lookup happens
+# once per calendar day instead of once per row.
+class CalldateParser:
+    def __init__(self, tz=None):
+        self.tz = tz or timezone.get_current_timezone()
+        self.layout = YMD
+        self._fast = self._parse_ymd
+        self._day_tz = {}
+        self._prefix_tz = {}
+        self._mdy_prefix = {}
+
+    def detect(self, values):
+        ymd = mdy = 0
+        seen = 0
+        for v in values:
+            if not v or type(v) is not str:
+                continue
+            if self._parse_ymd(v) is not None:
+                ymd += 1
+            elif self._parse_mdy(v) is not None:
+                mdy += 1
+            seen += 1
+            if seen >= SAMPLE_SIZE:
+                break
+        if mdy > ymd:
+            self.layout, self._fast = MDY, self._parse_mdy
+        else:
+            self.layout, self._fast = YMD, self._parse_ymd
+        return self.layout
+
+    def tz_for_day(self, day):
+        tz = self._day_tz.get(day)
+        if tz is None:
+            offset = datetime.combine(day, time.min, self.tz).utcoffset()
+            if offset == datetime.combine(day, time.max, self.tz).utcoffset():
+                tz = dt_timezone(offset)
+            else:
+                tz = self.tz
+            if len(self._day_tz) >= CACHE_LIMIT:
+                self._day_tz.clear()
+            self._day_tz[day] = tz
+        return tz
+
+    def localize(self, dt):
+        if dt.tzinfo is not None:
+            return dt
+        tz = self.tz_for_day(dt.date())
+        if tz is self.tz:
+            return timezone.make_aware(dt, tz)
+        return dt.replace(tzinfo=tz)
+
+    # The first ten characters of any ISO string pin down its date, so they
+    # key the offset cache directly and skip dt.date() on the hot path.
+    def _parse_ymd(self, s):
+        try:
+            dt = _fromiso(s)
+        except ValueError:
+            return None
+        if dt.tzinfo is not None:
+            return dt
+        key = s[:10]
+        tz = self._prefix_tz.get(key)
+        if tz is None:
+            tz = self.tz_for_day(dt.date())
+            if len(self._prefix_tz) >= CACHE_LIMIT:
+                self._prefix_tz.clear()
+            self._prefix_tz[key] = tz
+        if tz is self.tz:
+            return timezone.make_aware(dt, tz)
+        return dt.replace(tzinfo=tz)
+
+    def _parse_mdy(self, s):
+        if len(s) < 16 or s[10] not in " T":
+            return None
+        key = s[:10]
+        prefix = self._mdy_prefix.get(key)
+        if prefix is None:
+            sep = s[2]
+            if sep not in "/-" or s[5] != sep:
+                return None
+            prefix = f"{s[6:10]}-{s[0:2]}-{s[3:5]}"
+            if len(self._mdy_prefix) >= CACHE_LIMIT:
+                self._mdy_prefix.clear()
+            self._mdy_prefix[key] = prefix
+        return self._parse_ymd(prefix + s[10:])
+
+    def parse_general(self, value):
+        try:
+            dt = parse_datetime(value)
+            if dt is None:
+                dt = parse_datetime(str(value).replace(" ", "T"))
+            if dt is None:
+                m = _mdy_re.match(str(value).strip())
+                if m:
+                    month, day, year, hour, minute, second = m.groups()
+                    dt = datetime(int(year), int(month), int(day), int(hour), int(minute), int(second or 0))
+        except (TypeError, ValueError):
+            return None
+        if dt is None:
+            return None
+        return self.localize(dt)
+
+    def parse(self, value):
+        if type(value) is str:
+            dt = self._fast(value)
+            if dt is not None:
+                return dt
+        return self.parse_general(value)
+
+
+_parsers = {}
+
+
+def get_parser(tz=None):
+    tz = tz or timezone.get_current_timezone()
+    parser = _parsers.get(tz)
+    if parser is None:
+        parser = _parsers[tz] = CalldateParser(tz)
+    return parser
+
+
+def parse_calldate(value, tz=None):
+    return get_parser(tz).parse(value)
+
+
+def localize(dt, tz=None):
+    return get_parser(tz).localize(dt)
@@ -0,0 +1,78 @@
+import csv
+import io
+import json
+import zlib
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+EXPORT_FIELDS = ("id", "calldate", "src", "dst", "duration", "billsec", "disposition", "answered")
+CHUNK_SIZE = getattr(settings, "CALLS_EXPORT_CHUNK_SIZE", 2000)
+
+CSV = "csv"
+NDJSON = "ndjson"
+FORMATS = {
+    CSV: ("text/csv", "csv"),
+    NDJSON: ("application/x-ndjson", "ndjson"),
+}
+
+
+# Rows come from a server-side cursor in CHUNK_SIZE batches and each batch
+# is rendered to one string, so memory is bounded by a single batch.
+def _iter_batches(queryset, chunk_size):
+    tz = timezone.get_current_timezone()
+    batch = []
+    for row in queryset.order_by("-calldate", "-id").values_list(*EXPORT_FIELDS).iterator(chunk_size=chunk_size):
+        batch.append((row[0], row[1].astimezone(tz).isoformat(), *row[2:]))
+        if len(batch) >= chunk_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def iter_csv(queryset, chunk_size=CHUNK_SIZE):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(EXPORT_FIELDS)
+    yield buf.getvalue()
+    for batch in _iter_batches(queryset, chunk_size):
+        buf.seek(0)
+        buf.truncate()
+        writer.writerows(batch)
+        yield buf.getvalue()
+
+
+def iter_ndjson(queryset, chunk_size=CHUNK_SIZE):
+    dumps = json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).encode
+    for batch in _iter_batches(queryset, chunk_size):
+        yield "".join(dumps(dict(zip(EXPORT_FIELDS, row))) + "\n" for row in batch)
+
+
+# The gzip header is flushed with the first chunk so the client gets bytes
+# before the query has produced a full batch.
+def gzip_chunks(chunks, level=6):
+    z = zlib.compressobj(level, zlib.DEFLATED, 31)
+    first = True
+    for chunk in chunks:
+        data = z.compress(chunk.encode())
+        if first:
+            data += z.flush(zlib.Z_SYNC_FLUSH)
+            first = False
+        if data:
+            yield data
+    yield z.flush()
+
+
+def export_response(queryset, fmt=CSV, compress=False, filename="calls"):
+    content_type, ext = FORMATS[fmt]
+    chunks = iter_csv(queryset) if fmt == CSV else iter_ndjson(queryset)
+    name = f"{filename}.{ext}"
+    if compress:
+        chunks = gzip_chunks(chunks)
+        content_type = "application/gzip"
+        name += ".gz"
+    response = StreamingHttpResponse(chunks, content_type=content_type)
+    response["Content-Disposition"] = f'attachment; filename="{name}"'
+    response["X-Accel-Buffering"] = "no"
+    return response
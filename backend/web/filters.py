@@ -0,0 +1,15 @@
+from django_filters import rest_framework as filters
+from .models import CallRecord
+
+
+class CallRecordFilter(filters.FilterSet):
+    calldate_from = filters.IsoDateTimeFilter(field_name="calldate", lookup_expr="gte")
+    calldate_to = filters.IsoDateTimeFilter(field_name="calldate", lookup_expr="lt")
+    src = filters.CharFilter(field_name="src")
+    dst = filters.CharFilter(field_name="dst")
+    disposition = filters.ChoiceFilter(field_name="disposition", choices=CallRecord.DISPOSITION_CHOICES)
+    answered = filters.BooleanFilter(field_name="answered")
+
+    class Meta:
+        model = CallRecord
+        fields = ["calldate_from", "calldate_to", "src", "dst", "disposition", "answered"]
@@ -0,0 +1,134 @@
+import hashlib
+from datetime import timedelta
+from functools import partial
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from . import jobs
+from .jobs import worker_name
+from .models import ImageJob
+
+STALE_AFTER = getattr(settings, "IMAGE_JOB_STALE_AFTER", 300)
+MAX_ATTEMPTS = getattr(settings, "IMAGE_JOB_MAX_ATTEMPTS", 3)
+
+
+# Called by ImageOptimizationMixin.save() inside the save's transaction, so
+# the job becomes visible to workers together with the row. A finished job
+# for the same key is re-queued only when the field holds a freshly stored
+# copy of that source (the same file uploaded again).
+def enqueue(instance, entries):
+    content_type = ContentType.objects.get_for_model(instance)
+    queued = []
+    for field, renditions, max_kb, thumb_w, source_hash in entries:
+        source_name = getattr(instance, field).name
+        job, created = ImageJob.objects.get_or_create(
+            key=ImageJob.make_key(instance, field, source_hash),
+            defaults={
+                "content_type": content_type,
+                "object_id": str(instance.pk),
+                "field": field,
+                "source_name": source_name,
+                "source_hash": source_hash,
+                "config": [renditions, max_kb, thumb_w],
+            },
+        )
+        if not created and job.state in (ImageJob.DONE, ImageJob.FAILED) and job.source_name != source_name:
+            job.source_name = source_name
+            job.config = [renditions, max_kb, thumb_w]
+            requeue(job)
+        queued.append(job)
+    return queued
+
+
+def requeue(job):
+    job.state = ImageJob.PENDING
+    job.attempts = 0
+    job.detail = ""
+    job.worker = ""
+    job.heartbeat_at = job.started_at = job.finished_at = None
+    job.save()
+
+
+# Same claiming rules as ingest jobs; a job whose worker died MAX_ATTEMPTS
+# times (an image that kills the process) is failed instead of retried.
+def claim_job(name=None):
+    now = timezone.now()
+    stale = now - timedelta(seconds=STALE_AFTER)
+    with transaction.atomic():
+        ImageJob.objects.filter(state=ImageJob.RUNNING, heartbeat_at__lt=stale, attempts__gte=MAX_ATTEMPTS).update(
+            state=ImageJob.FAILED, detail="Обработчик не завершил задачу", finished_at=now, updated_at=now
+        )
+        job = (
+            ImageJob.objects.select_for_update(skip_locked=True)
+            .filter(Q(state=ImageJob.PENDING) | Q(state=ImageJob.RUNNING, heartbeat_at__lt=stale))
+            .order_by("id")
+            .first()
+        )
+        if job is None:
+            return None
+        job.state = ImageJob.RUNNING
+        job.worker = name or worker_name()
+        job.attempts += 1
+        job.heartbeat_at = now
+        job.started_at = now
+        job.save(update_fields=["state", "worker", "attempts", "heartbeat_at", "started_at", "updated_at"])
+    return job
+
+
+def _finish(job, state, detail=""):
+    job.state = state
+    job.detail = detail[:1000]
+    job.finished_at = timezone.now()
+    job.save(update_fields=["state", "detail", "finished_at", "updated_at"])
+    return job.detail
+
+
+# Encodes outside any transaction. The new files only get their names: one
+# transaction swaps the columns, with an UPDATE that only matches while the
+# image field still names the job's source, and finishes the job; the files
+# are written once it commits and the ones they replace are deleted. If the
+# object was edited meanwhile nothing is written and the newer upload's own
+# job wins. Returns the note left in ``detail``.
+def apply_job(job):
+    model = job.content_type.model_class()
+    instance = model._default_manager.filter(pk=job.object_id).first() if model else None
+    if instance is None:
+        return _finish(job, ImageJob.DONE, "Объект удалён")
+    source = getattr(instance, job.field)
+    if source.name != job.source_name:
+        return _finish(job, ImageJob.DONE, "Изображение уже заменено")
+    src_bytes = instance._read_bytes_once(source)
+    source.close()
+    if not src_bytes or hashlib.sha256(src_bytes).hexdigest() != job.source_hash:
+        return _finish(job, ImageJob.DONE, "Содержимое файла изменилось")
+
+    renditions, max_kb, thumb_w = job.config
+    instance._process_pair(job.field, renditions, max_kb, thumb_w, force=True, src_bytes=src_bytes)
+    staged = instance._stage_encoded_files()
+    if not staged:
+        return _finish(job, ImageJob.DONE, "Нечего обновлять")
+    stored = {name: file_name for name, file_name, _content in staged}
+    replaced = instance._replaced_files
+    if stored.get(job.field, job.source_name) != job.source_name:
+        replaced.append((job.field, job.source_name))
+
+    with transaction.atomic():
+        swapped = model._default_manager.filter(pk=instance.pk, **{job.field: job.source_name}).update(**stored)
+        if not swapped:
+            return _finish(job, ImageJob.DONE, "Изображение заменено во время обработки")
+        transaction.on_commit(partial(instance._store_files, staged, replaced))
+        return _finish(job, ImageJob.DONE)
+
+
+def run_job(job):
+    try:
+        apply_job(job)
+    except Exception as e:
+        _finish(job, ImageJob.FAILED, str(e))
+    return job
+
+
+def work(name=None, once=False, poll=2.0):
+    return jobs.work(name, once=once, poll=poll, claim=claim_job, run=run_job)
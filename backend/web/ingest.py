@@ -0,0 +1,150 @@
+import codecs
+import csv
+import time
+from django.db import transaction
+from . import metrics
+from .rejects import Rejects
+from .validation import RecordValidator
+from .writers import BATCH_SIZE, get_writer
+
+REQUIRED_HEADERS = ("calldate", "src", "dst", "duration", "billsec", "disposition")
+
+
+class CsvHeaderError(ValueError):
+    pass
+
+
+# Reads CSV records straight from a binary stream. ``offset`` is the byte
+# position right after the last record handed out, so a reader can be
+# re-opened on the same file with seek() and continue from there.
+class CsvRecordReader:
+    def __init__(self, stream, encoding="utf-8-sig", header=None):
+        self.stream = stream
+        self.encoding = encoding
+        self.offset = 0
+        self.line = 0
+        self._index = self._read_header() if header is None else self._index_header(header)
+
+    def _lines(self):
+        decoder = codecs.getincrementaldecoder(self.encoding)()
+        for raw in iter(self.stream.readline, b""):
+            self.offset += len(raw)
+            yield decoder.decode(raw)
+        tail = decoder.decode(b"", final=True)
+        if tail:
+            yield tail
+
+    def _read_header(self):
+        reader = csv.reader(self._lines())
+        header = next(reader, None)
+        if not header:
+            raise CsvHeaderError("Файл пустой")
+        self.line = reader.line_num
+        return self._index_header(header)
+
+    def _index_header(self, header):
+        header = [h.strip().lower() for h in header]
+        for req in REQUIRED_HEADERS:
+            if req not in header:
+                raise CsvHeaderError(f"Отсутствует столбец: {req}")
+        self.header = header
+        self._width = len(header)
+        return {h: header.index(h) for h in REQUIRED_HEADERS}
+
+    def seek(self, offset, line):
+        self.stream.seek(offset)
+        self.offset = offset
+        self.line = line
+
+    def __iter__(self):
+        reader = csv.reader(self._lines())
+        base = self.line
+        width = self._width
+        idx = self._index.items()
+        for row in reader:
+            self.line = base + reader.line_num
+            if not row or (len(row) == 1 and not row[0].strip()):
+                continue
+            if len(row) < width:
+                row = row + [""] * (width - len(row))
+            yield self.line, {h: row[i].strip() for h, i in idx}
+
+    # Column-wise variant of __iter__ for RecordValidator.validate_columns:
+    # one list per column per batch instead of a dict per record.
+    def iter_column_batches(self, batch_size):
+        reader = csv.reader(self._lines())
+        base = self.line
+        width = self._width
+        idx = self._index.items()
+        rows, lines = [], []
+        for row in reader:
+            self.line = base + reader.line_num
+            if not row or (len(row) == 1 and not row[0].strip()):
+                continue
+            if len(row) < width:
+                row = row + [""] * (width - len(row))
+            rows.append(row)
+            lines.append(self.line)
+            if len(rows) >= batch_size:
+                yield self._columns(rows, idx), lines
+                rows, lines = [], []
+        if rows:
+            yield self._columns(rows, idx), lines
+
+    def _columns(self, rows, idx):
+        return {h: [r[i].strip() for r in rows] for h, i in idx}
+
+
+def iter_csv_records(stream, encoding="utf-8-sig"):
+    return iter(CsvRecordReader(stream, encoding))
+
+
+# All batches share one transaction: if any line is rejected nothing is kept,
+# same all-or-nothing contract as BulkCallsCreateView. With an accept_valid
+# Rejects the valid rows are kept and only the rejects are reported. Returns
+# (created, first rejected lines); the rest is in ``rejects``.
+def ingest_records(numbered_records, batch_size=BATCH_SIZE, writer=None, validator=None, rejects=None):
+    writer = writer or get_writer()
+    validator = validator or RecordValidator()
+    rejects = rejects if rejects is not None else Rejects()
+    created = 0
+    lines = []
+    batch = []
+
+    # Reading and parsing the records is whatever the loop spends outside
+    # flush(); it is reported as the "parse" stage.
+    def flush():
+        nonlocal created, read_since
+        metrics.add_stage("parse", time.perf_counter() - read_since)
+        result = validator.validate(batch, lines)
+        if result.errors:
+            rejects.add(result.errors, batch, lines)
+        if not rejects.count or rejects.accept_valid:
+            created += writer.write(result.rows())
+        read_since = time.perf_counter()
+
+    read_since = time.perf_counter()
+    report = rejects.report
+    try:
+        with transaction.atomic():
+            for line, rec in numbered_records:
+                lines.append(line)
+                batch.append(rec)
+                if len(batch) >= batch_size:
+                    flush()
+                    lines, batch = [], []
+                    if rejects.should_abort:
+                        rejects.aborted = True
+                        break
+            if batch:
+                flush()
+            if rejects.failed:
+                transaction.set_rollback(True)
+                created = 0
+    except BaseException:
+        if report is not None:
+            report.discard()
+        raise
+    if report is not None:
+        report.close()
+    return created, rejects.errors
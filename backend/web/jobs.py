@@ -0,0 +1,256 @@
+import hashlib
+import os
+import socket
+import time
+import uuid
+from datetime import timedelta
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+from . import metrics
+from .ingest import CsvRecordReader
+from .ledger import ON_DUPLICATE_ALLOW, check_duplicate, record_upload
+from .models import IngestJob, UploadLedger
+from .validation import RecordValidator
+from .writers import BATCH_SIZE, get_writer
+
+SPOOL_DIR = getattr(settings, "CALLS_INGEST_SPOOL_DIR", os.path.join(settings.BASE_DIR, "spool"))
+STALE_AFTER = getattr(settings, "CALLS_INGEST_JOB_STALE_AFTER", 300)
+MAX_ERRORS = getattr(settings, "CALLS_INGEST_JOB_MAX_ERRORS", 1000)
+# A job whose worker died this many times (a file that crashes the worker)
+# is failed instead of being claimed again.
+MAX_ATTEMPTS = getattr(settings, "CALLS_INGEST_JOB_MAX_ATTEMPTS", 3)
+CHUNK_SIZE = 64 * 1024
+
+
+# Another worker claimed the job after this one's heartbeat went stale.
+class JobLost(Exception):
+    pass
+
+
+def worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def spool_upload(chunks, user=None, dedup=False, on_duplicate=ON_DUPLICATE_ALLOW, name=""):
+    os.makedirs(SPOOL_DIR, exist_ok=True)
+    path = os.path.join(SPOOL_DIR, f"{uuid.uuid4().hex}.csv")
+    tmp = path + ".part"
+    size = 0
+    digest = hashlib.sha256()
+    with open(tmp, "wb") as fh:
+        for chunk in chunks:
+            fh.write(chunk)
+            digest.update(chunk)
+            size += len(chunk)
+    try:
+        with open(tmp, "rb") as fh:
+            CsvRecordReader(fh)
+        check_duplicate(digest.hexdigest(), on_duplicate)
+    except Exception:
+        os.remove(tmp)
+        raise
+    os.replace(tmp, path)
+    try:
+        with transaction.atomic():
+            job = IngestJob.objects.create(spool_path=path, size=size, created_by=user, dedup=dedup)
+            record_upload(
+                digest.hexdigest(), size, on_duplicate=on_duplicate, name=name[:255], source=UploadLedger.SOURCE_JOB,
+                created_by=user, job=job,
+            )
+    except Exception:
+        os.remove(path)
+        raise
+    return job
+
+
+def iter_stream_chunks(stream, size=CHUNK_SIZE):
+    return iter(lambda: stream.read(size), b"")
+
+
+# Pending jobs and running jobs whose worker stopped sending heartbeats are
+# both claimable; the latter resume from their last committed batch.
+def claim_job(name=None):
+    now = timezone.now()
+    stale = now - timedelta(seconds=STALE_AFTER)
+    with transaction.atomic():
+        IngestJob.objects.filter(state=IngestJob.RUNNING, heartbeat_at__lt=stale, attempts__gte=MAX_ATTEMPTS).update(
+            state=IngestJob.FAILED, detail="Обработчик не завершил задачу", finished_at=now, updated_at=now
+        )
+        job = (
+            IngestJob.objects.select_for_update(skip_locked=True)
+            .filter(Q(state=IngestJob.PENDING) | Q(state=IngestJob.RUNNING, heartbeat_at__lt=stale))
+            .order_by("id")
+            .first()
+        )
+        if job is None:
+            return None
+        job.state = IngestJob.RUNNING
+        job.worker = name or worker_name()
+        job.attempts += 1
+        job.heartbeat_at = now
+        job.started_at = job.started_at or now
+        job.save(update_fields=["state", "worker", "attempts", "heartbeat_at", "started_at", "updated_at"])
+    return job
+
+
+# A worker that was only slow may still be running when its job has been
+# reclaimed: the batch is written only while the job row still names this
+# worker and the offset the batch starts from.
+def _commit_batch(job, ledger, writer, validator, records, lines, offset, line):
+    result = validator.validate(records, lines)
+    with transaction.atomic():
+        current = IngestJob.objects.select_for_update().only("worker", "offset").get(pk=job.pk)
+        if current.worker != job.worker or current.offset != job.offset:
+            raise JobLost(f"Задачу #{job.pk} забрал {current.worker}")
+        duplicates = writer.duplicates
+        created = writer.write(result.rows()) if result.lines else 0
+        job.processed += len(records)
+        job.created_rows += created
+        job.duplicates += writer.duplicates - duplicates
+        job.rejected += len(result.errors)
+        room = MAX_ERRORS - len(job.errors)
+        if room > 0 and result.errors:
+            job.errors.extend(result.error_dicts()[:room])
+        job.offset = offset
+        job.line = line
+        job.heartbeat_at = timezone.now()
+        job.save(update_fields=[
+            "processed", "created_rows", "duplicates", "rejected", "errors", "offset", "line", "heartbeat_at",
+            "updated_at",
+        ])
+        if ledger is not None:
+            ledger.rows_created = job.created_rows
+            ledger.duplicates = job.duplicates
+            ledger.extend_range(writer.first_id, writer.last_id)
+            ledger.save(update_fields=["rows_created", "duplicates", "first_id", "last_id"])
+
+
+# Every batch is committed together with the job's byte offset, so a job that
+# is picked up again continues exactly after the last batch that made it in.
+# Rejected lines are reported on the job; valid lines are kept.
+def run_job(job, batch_size=BATCH_SIZE):
+    with metrics.track("job") as timings:
+        timings.bytes = job.size
+        _run_job(job, batch_size)
+        timings.status = job.state
+    return job
+
+
+def _run_job(job, batch_size):
+    writer = get_writer(dedup=job.dedup)
+    validator = RecordValidator()
+    ledger = UploadLedger.objects.filter(job=job).first()
+    try:
+        with open(job.spool_path, "rb") as fh:
+            reader = CsvRecordReader(fh)
+            if job.offset:
+                reader.seek(job.offset, job.line)
+            records, lines = [], []
+            for line, rec in reader:
+                records.append(rec)
+                lines.append(line)
+                if len(records) >= batch_size:
+                    _commit_batch(job, ledger, writer, validator, records, lines, reader.offset, reader.line)
+                    records, lines = [], []
+            if records:
+                _commit_batch(job, ledger, writer, validator, records, lines, reader.offset, reader.line)
+    except JobLost:
+        return job
+    except Exception as e:
+        job.state = IngestJob.FAILED
+        job.detail = str(e)[:1000]
+    else:
+        job.state = IngestJob.DONE
+        job.detail = ""
+    job.finished_at = timezone.now()
+    finished = IngestJob.objects.filter(pk=job.pk, worker=job.worker, offset=job.offset).update(
+        state=job.state, detail=job.detail, finished_at=job.finished_at, updated_at=job.finished_at
+    )
+    if finished and job.state == IngestJob.DONE:
+        try:
+            os.remove(job.spool_path)
+        except OSError:
+            pass
+    return job
+
+
+# Lets CsvRecordReader see only the first ``end`` bytes of a spool file.
+class _SpoolPrefix:
+    def __init__(self, fh, end):
+        self.fh = fh
+        self.end = end
+
+    def readline(self):
+        room = self.end - self.fh.tell()
+        return self.fh.readline(room) if room > 0 else b""
+
+    def seek(self, offset):
+        self.fh.seek(offset)
+
+
+def _line_end(fh, start, end):
+    pos = end
+    while pos > start:
+        size = min(CHUNK_SIZE, pos - start)
+        fh.seek(pos - size)
+        i = fh.read(size).rfind(b"\n")
+        if i >= 0:
+            return pos - size + i + 1
+        pos -= size
+    return start
+
+
+def _complete_records(reader, final):
+    prev = None
+    for line, rec in reader:
+        if prev is not None:
+            yield prev
+        prev = (line, rec, reader.offset, reader.line)
+    if prev is not None and final:
+        yield prev
+
+
+# Ingests what an upload session (web.uploads) has received so far, batch by
+# batch like run_job. Only whole lines are read and the last record is held
+# back, since a quoted field may continue in the next chunk; ``final`` takes
+# everything.
+def ingest_spooled(job, final=False, batch_size=BATCH_SIZE):
+    writer = get_writer(dedup=job.dedup)
+    validator = RecordValidator()
+    ledger = UploadLedger.objects.filter(job=job).first()
+    with open(job.spool_path, "rb") as fh:
+        end = job.size if final else _line_end(fh, job.offset, job.size)
+        if end <= job.offset and not final:
+            return job
+        fh.seek(0)
+        reader = CsvRecordReader(_SpoolPrefix(fh, end))
+        if job.offset:
+            reader.seek(job.offset, job.line)
+        records, lines = [], []
+        for line, rec, offset, last in _complete_records(reader, final):
+            records.append(rec)
+            lines.append(line)
+            if len(records) >= batch_size:
+                _commit_batch(job, ledger, writer, validator, records, lines, offset, last)
+                records, lines = [], []
+        if records:
+            _commit_batch(job, ledger, writer, validator, records, lines, offset, last)
+    return job
+
+
+def work(name=None, once=False, poll=2.0, claim=claim_job, run=run_job):
+    name = name or worker_name()
+    while True:
+        try:
+            job = claim(name)
+        except DatabaseError:
+            close_old_connections()
+            job = None
+        if job is not None:
+            run(job)
+            continue
+        if once:
+            return
+        time.sleep(poll)
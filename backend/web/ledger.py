@@ -0,0 +1,110 @@
+import hashlib
+from django.db import connection
+from django.db.models import Q
+from .models import IngestJob, UploadLedger
+
+ON_DUPLICATE_RETURN = "return"
+ON_DUPLICATE_REJECT = "reject"
+ON_DUPLICATE_ALLOW = "allow"
+ON_DUPLICATE_CHOICES = (ON_DUPLICATE_RETURN, ON_DUPLICATE_REJECT, ON_DUPLICATE_ALLOW)
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class DuplicateUpload(Exception):
+    def __init__(self, entry):
+        super().__init__(f"Файл уже загружен ({entry.sha256})")
+        self.entry = entry
+
+
+# Wraps a binary stream and hashes everything read through it.
+class HashingReader:
+    def __init__(self, stream):
+        self.stream = stream
+        self.hash = hashlib.sha256()
+        self.size = 0
+
+    def _seen(self, data):
+        self.hash.update(data)
+        self.size += len(data)
+        return data
+
+    def read(self, *args):
+        return self._seen(self.stream.read(*args))
+
+    def readline(self, *args):
+        return self._seen(self.stream.readline(*args))
+
+    def hexdigest(self):
+        return self.hash.hexdigest()
+
+
+def hash_file(fh):
+    h = hashlib.sha256()
+    size = 0
+    fh.seek(0)
+    for chunk in iter(lambda: fh.read(CHUNK_SIZE), b""):
+        h.update(chunk)
+        size += len(chunk)
+    fh.seek(0)
+    return h.hexdigest(), size
+
+
+# Uploads whose background job failed do not count: the file never made it
+# in. Neither do upload sessions still receiving chunks, whose digest is only
+# the one the client declared.
+def find_duplicate(sha256):
+    if not sha256:
+        return None
+    return (
+        UploadLedger.objects.filter(sha256=sha256)
+        .filter(Q(job__isnull=True) | ~Q(job__state__in=(IngestJob.FAILED, IngestJob.UPLOADING)))
+        .order_by("id")
+        .first()
+    )
+
+
+def check_duplicate(sha256, on_duplicate):
+    if on_duplicate == ON_DUPLICATE_ALLOW:
+        return
+    entry = find_duplicate(sha256)
+    if entry is not None:
+        raise DuplicateUpload(entry)
+
+
+# Two uploads of the same file running side by side would both pass a check
+# made before their rows are in. The final check and the insert therefore run
+# under a transaction-scoped advisory lock on the digest (PostgreSQL; SQLite
+# serializes writers anyway), so the second one sees the first once it
+# commits. Must be called inside the upload's transaction.
+def _lock_digest(sha256):
+    if sha256 and connection.vendor == "postgresql":
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_xact_lock(hashtextextended(%s, 0))", [sha256])
+
+
+def record_upload(sha256, size, writer=None, created=0, on_duplicate=ON_DUPLICATE_ALLOW, **kwargs):
+    if on_duplicate != ON_DUPLICATE_ALLOW:
+        _lock_digest(sha256)
+        check_duplicate(sha256, on_duplicate)
+    entry = UploadLedger(sha256=sha256, size=size, rows_created=created, **kwargs)
+    if writer is not None:
+        entry.duplicates = writer.duplicates
+        entry.extend_range(writer.first_id, writer.last_id)
+    entry.save()
+    return entry
+
+
+def ledger_data(entry):
+    return {
+        "id": entry.pk,
+        "sha256": entry.sha256,
+        "size": entry.size,
+        "name": entry.name,
+        "job": entry.job_id,
+        "created": entry.rows_created,
+        "duplicates": entry.duplicates,
+        "first_id": entry.first_id,
+        "last_id": entry.last_id,
+        "created_at": entry.created_at,
+    }
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from web.models import CallRecord
+
+
+class Command(BaseCommand):
+    help = (
+        "Заполняет fingerprint у существующих CallRecord, чтобы режим dedup видел старые данные. "
+        "Повторы уже сохранённой строки остаются с пустым fingerprint."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=5000)
+
+    def handle(self, *args, **opts):
+        make = CallRecord.make_fingerprint
+        last_id = 0
+        filled = skipped = 0
+        while True:
+            batch = list(
+                CallRecord.objects.filter(id__gt=last_id, fingerprint__isnull=True)
+                .order_by("id")
+                .values_list("id", "calldate", "src", "dst", "duration", "billsec", "disposition")[: opts["batch_size"]]
+            )
+            if not batch:
+                break
+            last_id = batch[-1][0]
+            fps = {}
+            for row in batch:
+                fps.setdefault(make(*row[1:]), row[0])
+            existing = set(CallRecord.objects.filter(fingerprint__in=list(fps)).values_list("fingerprint", flat=True))
+            objs = [CallRecord(id=pk, fingerprint=fp) for fp, pk in fps.items() if fp not in existing]
+            with transaction.atomic():
+                CallRecord.objects.bulk_update(objs, ["fingerprint"])
+            filled += len(objs)
+            skipped += len(batch) - len(objs)
+        self.stdout.write(f"Заполнено: {filled}, дубликатов без fingerprint: {skipped}")
@@ -0,0 +1,207 @@
+import gc
+import json
+import os
+import platform
+import resource
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from io import BytesIO
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from rest_framework.parsers import JSONParser
+from web.models import CallRecord
+from web.synthetic import synthetic_cdr
+from web.validation import RecordValidator
+from web.writers import ROW_FIELDS, WRITERS, get_writer
+
+STAGES = ("parse", "validate", "construct", "write")
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+class _Rollback(Exception):
+    pass
+
+
+def _rss():
+    try:
+        with open("/proc/self/statm") as fh:
+            return int(fh.read().split()[1]) * PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _maxrss():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+# Wall time, queries sent and peak resident memory of the block. RSS is
+# sampled from /proc every few milliseconds; without /proc the process
+# lifetime peak (ru_maxrss) is reported instead.
+@contextmanager
+def measure():
+    stats = {"queries": 0}
+    peak = [_rss() or 0]
+    stop = threading.Event()
+
+    def count(execute, sql, params, many, context):
+        stats["queries"] += 1
+        return execute(sql, params, many, context)
+
+    def sample():
+        while not stop.wait(0.005):
+            peak[0] = max(peak[0], _rss() or 0)
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    started = time.perf_counter()
+    try:
+        with connection.execute_wrapper(count):
+            yield stats
+    finally:
+        stats["seconds"] = time.perf_counter() - started
+        stop.set()
+        sampler.join()
+        rss = _rss()
+        stats["peak_rss_mb"] = round((max(peak[0], rss) if rss is not None else _maxrss()) / 2**20, 1)
+
+
+class Command(BaseCommand):
+    help = (
+        "Замеряет этапы пути POST /api/calls/bulk_create/ (разбор JSON, валидация, создание объектов, запись) на "
+        "синтетических CDR: строк/с, пиковая RSS и число запросов. Записи откатываются. Результат можно "
+        "сохранить в JSON (--output) и сравнить с сохранённым ранее (--baseline)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, action="append", default=[], help="По умолчанию 10k, 100k и 1M.")
+        parser.add_argument("--stage", choices=STAGES, action="append", default=[])
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--bad-rate", type=float, default=0.01, help="Доля строк с ошибками.")
+        parser.add_argument("--writer", choices=sorted(WRITERS) + ["auto"], default=None)
+        parser.add_argument("--repeat", type=int, default=5, help="Не больше стольких повторов этапа; берётся лучший.")
+        parser.add_argument(
+            "--min-time", type=float, default=1.0, help="Этап повторяется, пока суммарно не займёт столько секунд."
+        )
+        parser.add_argument("--output", help="Куда сохранить результаты (JSON).")
+        parser.add_argument("--baseline", help="JSON предыдущего прогона для сравнения.")
+        parser.add_argument(
+            "--tolerance", type=float, default=0.2, help="Допустимое падение строк/с относительно базового."
+        )
+
+    def handle(self, *args, **opts):
+        stages = opts["stage"] or list(STAGES)
+        self.repeat = max(1, opts["repeat"])
+        self.min_time = opts["min_time"]
+        results = []
+        for n in opts["rows"] or [10_000, 100_000, 1_000_000]:
+            results.extend(self.run_size(n, stages, opts))
+            gc.collect()
+        report = {"meta": self.meta(opts), "results": results}
+        if opts["output"]:
+            with open(opts["output"], "w") as fh:
+                json.dump(report, fh, ensure_ascii=False, indent=2)
+            self.stdout.write(f"сохранено: {opts['output']}")
+        if opts["baseline"]:
+            with open(opts["baseline"]) as fh:
+                self.compare(report, json.load(fh), opts["tolerance"])
+
+    def meta(self, opts):
+        return {
+            "created": timezone.now().isoformat(),
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "database": connection.vendor,
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "seed": opts["seed"],
+            "bad_rate": opts["bad_rate"],
+            "repeat": opts["repeat"],
+            "min_time": opts["min_time"],
+        }
+
+    # Short stages are repeated (best run wins) so 10k-row timings are not
+    # noise; a stage that already took min_time runs once.
+    def stage(self, results, size, name, rows, fn, **extra):
+        best = None
+        spent = 0.0
+        for _ in range(self.repeat):
+            with measure() as stats:
+                value = fn()
+            spent += stats["seconds"]
+            if best is None or stats["seconds"] < best["seconds"]:
+                best = dict(stats, peak_rss_mb=max(stats["peak_rss_mb"], best["peak_rss_mb"] if best else 0))
+            if spent >= self.min_time:
+                break
+        seconds = best["seconds"]
+        entry = {
+            "size": size, "stage": name, "rows": rows, "seconds": round(seconds, 4),
+            "rows_per_s": round(rows / seconds) if seconds else 0,
+            "peak_rss_mb": best["peak_rss_mb"], "queries": best["queries"], **extra,
+        }
+        results.append(entry)
+        self.stdout.write(
+            f"{size:>9} {name:<10} {seconds:8.3f} с {entry['rows_per_s']:>12,} строк/с "
+            f"RSS {entry['peak_rss_mb']:>8.1f} МБ, запросов {entry['queries']}"
+        )
+        return value
+
+    def run_size(self, n, stages, opts):
+        results = []
+        body = json.dumps({"records": synthetic_cdr(n, opts["seed"], opts["bad_rate"])}).encode()
+        parse = lambda: JSONParser().parse(BytesIO(body))["records"]
+        records = self.stage(results, n, "parse", n, parse) if "parse" in stages else parse()
+        del body
+
+        validate = lambda: RecordValidator().validate(records)
+        checked = self.stage(results, n, "validate", n, validate) if "validate" in stages else validate()
+        rows = checked.rows()
+        del records
+        if "validate" in stages:
+            results[-1]["rejected"] = len(checked.errors)
+
+        if "construct" in stages:
+            construct = lambda: [CallRecord(**dict(zip(ROW_FIELDS, r))) for r in rows]
+            self.stage(results, n, "construct", len(rows), construct)
+
+        if "write" in stages:
+            writer = get_writer(opts["writer"])
+
+            def write():
+                try:
+                    with transaction.atomic():
+                        writer.write(rows)
+                        raise _Rollback
+                except _Rollback:
+                    pass
+
+            self.stage(results, n, "write", len(rows), write, writer=writer.name)
+        return results
+
+    # Rates are compared per (size, stage); a stage slower than the baseline
+    # by more than the tolerance, or sending more queries, fails the command.
+    def compare(self, report, baseline, tolerance):
+        if baseline.get("meta", {}).get("database") != report["meta"]["database"]:
+            self.stdout.write(f"внимание: базовый прогон на {baseline.get('meta', {}).get('database')}")
+        base = {(r["size"], r["stage"]): r for r in baseline.get("results", [])}
+        regressions = []
+        for r in report["results"]:
+            b = base.get((r["size"], r["stage"]))
+            if not b or not b.get("rows_per_s"):
+                continue
+            ratio = r["rows_per_s"] / b["rows_per_s"]
+            slower = ratio < 1 - tolerance
+            more_queries = r["queries"] > b.get("queries", r["queries"])
+            if slower or more_queries:
+                regressions.append(f"{r['size']} {r['stage']}")
+            self.stdout.write(
+                f"{r['size']:>9} {r['stage']:<10} {ratio:6.2f}x к базовому ({b['rows_per_s']:,} строк/с), "
+                f"RSS {r['peak_rss_mb'] - b.get('peak_rss_mb', 0):+.1f} МБ, "
+                f"запросов {r['queries']} / {b.get('queries')}" + (" — регрессия" if slower or more_queries else "")
+            )
+        if regressions:
+            raise CommandError(f"Регрессия относительно базового прогона: {', '.join(regressions)}")
@@ -0,0 +1,42 @@
+import csv
+import os
+import tempfile
+import time
+from django.core.management.base import BaseCommand
+from web.parallel import iter_file_results
+from web.synthetic import synthetic_cdr
+from web.writers import CopyWriter
+
+
+class Command(BaseCommand):
+    help = "Измеряет скорость параллельного разбора, валидации и кодирования в COPY CSV-файла (без записи в БД) для разного числа процессов."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=1_000_000)
+        parser.add_argument("--chunk-mb", type=int, default=4)
+        parser.add_argument("--max-processes", type=int, default=os.cpu_count() or 1)
+
+    def handle(self, *args, **opts):
+        fd, path = tempfile.mkstemp(suffix=".csv")
+        try:
+            with os.fdopen(fd, "w", newline="") as fh:
+                w = csv.writer(fh)
+                w.writerow(["calldate", "src", "dst", "duration", "billsec", "disposition"])
+                for rec in synthetic_cdr(opts["rows"]):
+                    w.writerow([rec["calldate"], rec["src"], rec["dst"], rec["duration"], rec["billsec"], rec["disposition"]])
+            self.stdout.write(f"файл: {os.path.getsize(path) / 1024 / 1024:.1f} МБ, {opts['rows']} строк")
+            encode = CopyWriter().encode
+            base = None
+            n = 1
+            while n <= opts["max_processes"]:
+                started = time.perf_counter()
+                total = 0
+                for (count, _text, _rollup), rejects in iter_file_results(path, n, opts["chunk_mb"] * 1024 * 1024, encode):
+                    total += count + rejects.count
+                elapsed = time.perf_counter() - started
+                rate = total / elapsed
+                base = base or rate
+                self.stdout.write(f"процессов {n}: {rate:,.0f} строк/с, ускорение {rate / base:.2f}x")
+                n *= 2
+        finally:
+            os.remove(path)
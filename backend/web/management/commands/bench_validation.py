@@ -0,0 +1,109 @@
+import time
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from web.models import CallRecord
+from web.synthetic import synthetic_cdr
+from web.validation import RecordValidator
+
+
+# Verbatim copy of the per-record loop BulkCallsCreateView.post used before
+# web.validation existed; kept only as the reference point for this benchmark.
+def legacy_validate(records):
+    errors = []
+    instances = []
+    for idx, rec in enumerate(records):
+        line = idx + 1
+        line_errors = []
+        calldate = rec.get("calldate")
+        src = rec.get("src")
+        dst = rec.get("dst")
+        duration = rec.get("duration")
+        billsec = rec.get("billsec")
+        disposition = rec.get("disposition", "")
+        if not calldate:
+            line_errors.append("calldate пустой")
+        else:
+            dt = parse_datetime(calldate)
+            if dt is None:
+                dt = parse_datetime(str(calldate).replace(" ", "T"))
+            if dt is None:
+                line_errors.append("Неверный формат calldate")
+            else:
+                if timezone.is_naive(dt):
+                    dt = timezone.make_aware(dt, timezone.get_current_timezone())
+        if not src:
+            line_errors.append("src пустой")
+        elif len(str(src)) > 64:
+            line_errors.append("src слишком длинный")
+        if not dst:
+            line_errors.append("dst пустой")
+        elif len(str(dst)) > 64:
+            line_errors.append("dst слишком длинный")
+        try:
+            d = int(duration)
+            if d < 0:
+                line_errors.append("duration < 0")
+        except Exception:
+            line_errors.append("duration должен быть целым числом")
+        try:
+            b = int(billsec)
+            if b < 0:
+                line_errors.append("billsec < 0")
+        except Exception:
+            line_errors.append("billsec должен быть целым числом")
+        if not disposition:
+            line_errors.append("disposition пустой")
+        if line_errors:
+            errors.append({"line": line, "errors": line_errors})
+        else:
+            disp = str(disposition).strip().lower()
+            if disp == "answered" or "answered" in disp:
+                norm_disp = CallRecord.ANSWERED
+                answered_flag = True
+            elif disp == "no answer" or "no answer" in disp or "noanswer" in disp:
+                norm_disp = CallRecord.NO_ANSWER
+                answered_flag = False
+            else:
+                norm_disp = CallRecord.OTHER
+                answered_flag = False
+            instances.append(
+                CallRecord(
+                    calldate=dt,
+                    src=str(src).strip(),
+                    dst=str(dst).strip(),
+                    duration=int(duration),
+                    billsec=int(billsec),
+                    disposition=norm_disp,
+                    answered=answered_flag,
+                )
+            )
+    return instances, errors
+
+
+def columnar_validate(records):
+    result = RecordValidator().validate(records)
+    return result.rows(), result.error_dicts()
+
+
+class Command(BaseCommand):
+    help = "Сравнивает скорость старого построчного цикла валидации и RecordValidator (строк/с)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=100_000)
+        parser.add_argument("--bad-rate", type=float, default=0.0)
+        parser.add_argument("--repeat", type=int, default=3)
+
+    def handle(self, *args, **opts):
+        records = synthetic_cdr(opts["rows"], bad_rate=opts["bad_rate"])
+        rates = {}
+        for name, fn in (("legacy", legacy_validate), ("columnar", columnar_validate)):
+            best = None
+            for _ in range(opts["repeat"]):
+                started = time.perf_counter()
+                ok, errors = fn(records)
+                elapsed = time.perf_counter() - started
+                best = elapsed if best is None else min(best, elapsed)
+            rates[name] = len(records) / best
+            self.stdout.write(f"{name}: {len(ok)} ок, {len(errors)} ошибок, {best:.3f} с — {rates[name]:,.0f} строк/с")
+        self.stdout.write(f"ускорение: {rates['columnar'] / rates['legacy']:.1f}x")
@@ -0,0 +1,87 @@
+import time
+from contextlib import contextmanager
+from io import BytesIO
+from django.core.management.base import BaseCommand
+from PIL import Image, ImageFilter
+from common.optimized.image import ImageOptimizationMixin
+
+
+def synthetic_photo(width, height):
+    shapes = Image.effect_noise((max(1, width // 8), max(1, height // 8)), 60).convert("L")
+    shapes = shapes.resize((width, height), Image.Resampling.BICUBIC)
+    sky = Image.linear_gradient("L").resize((width, height))
+    grain = Image.effect_noise((width, height), 20).convert("L").filter(ImageFilter.GaussianBlur(1))
+    return Image.merge("RGB", (sky, shapes, grain))
+
+
+# Verbatim copy of ImageOptimizationMixin._encode_webp_best_fit before the
+# quality search; kept only as the reference point for this benchmark.
+def legacy_best_fit(img, max_kb, qualities=(95, 85, 75, 65, 55, 40, 30), fallback=20):
+    buf = BytesIO()
+    for q in qualities:
+        buf.seek(0)
+        buf.truncate()
+        img.save(buf, format="WEBP", quality=q, method=6)
+        if buf.tell() / 1024.0 <= max_kb:
+            return buf.getvalue()
+    buf.seek(0)
+    buf.truncate()
+    img.save(buf, format="WEBP", quality=fallback, method=6)
+    return buf.getvalue()
+
+
+@contextmanager
+def count_encodes():
+    counts = {}
+    save = Image.Image.save
+
+    def counting_save(img, fp, format=None, **params):
+        key = f"{img.width}x{img.height} m{params.get('method', '-')}"
+        counts[key] = counts.get(key, 0) + 1
+        return save(img, fp, format, **params)
+
+    Image.Image.save = counting_save
+    try:
+        yield counts
+    finally:
+        Image.Image.save = save
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнивает старый перебор качества WebP и поиск с пробным кодированием: число кодирований, "
+        "время и итоговый размер. Без --file использует синтетические фото."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--file", action="append", default=[], help="Путь к изображению (можно несколько)")
+        parser.add_argument("--size", action="append", default=[], help="ШИРИНАxВЫСОТА синтетического фото")
+        parser.add_argument("--max-kb", type=int, action="append", default=[])
+
+    def handle(self, *args, **opts):
+        images = []
+        for path in opts["file"]:
+            with Image.open(path) as img:
+                images.append((path, img.convert("RGB")))
+        for size in opts["size"] or ([] if images else ["1600x1067", "4000x3000"]):
+            width, height = (int(v) for v in size.lower().split("x"))
+            images.append((f"synthetic {size}", synthetic_photo(width, height)))
+        mixin = ImageOptimizationMixin()
+        for name, img in images:
+            for max_kb in opts["max_kb"] or [300, 800]:
+                row = {}
+                for label, encode in (
+                    ("legacy", lambda: legacy_best_fit(img, max_kb)),
+                    ("search", lambda: mixin._encode_webp_best_fit(img, max_kb)),
+                ):
+                    with count_encodes() as counts:
+                        started = time.perf_counter()
+                        data = encode()
+                        elapsed = time.perf_counter() - started
+                    row[label] = elapsed
+                    detail = ", ".join(f"{k}: {v}" for k, v in sorted(counts.items()))
+                    self.stdout.write(
+                        f"{name}, {max_kb} КБ, {label}: {sum(counts.values())} кодирований ({detail}), "
+                        f"{elapsed:.2f} с, {len(data) / 1024:.0f} КБ"
+                    )
+                self.stdout.write(f"  ускорение: {row['legacy'] / row['search']:.1f}x")
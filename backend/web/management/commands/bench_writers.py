@@ -0,0 +1,37 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from web.synthetic import synthetic_cdr
+from web.validation import RecordValidator
+from web.writers import WRITERS, get_writer
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "Сравнивает скорость записи CallRecord через bulk_create и COPY (строк/с). Данные откатываются."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=100_000)
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument("--writer", choices=sorted(WRITERS) + ["all"], default="all")
+
+    def handle(self, *args, **opts):
+        rows = RecordValidator().validate(synthetic_cdr(opts["rows"])).rows()
+        names = sorted(WRITERS) if opts["writer"] == "all" else [opts["writer"]]
+        for name in names:
+            if name == "copy" and connection.vendor != "postgresql":
+                self.stdout.write(f"{name}: пропущено ({connection.vendor})")
+                continue
+            writer = get_writer(name, batch_size=opts["batch_size"])
+            started = time.perf_counter()
+            try:
+                with transaction.atomic():
+                    written = writer.write(rows)
+                    elapsed = time.perf_counter() - started
+                    raise _Rollback
+            except _Rollback:
+                pass
+            self.stdout.write(f"{name}: {written} строк за {elapsed:.3f} с — {written / elapsed:,.0f} строк/с")
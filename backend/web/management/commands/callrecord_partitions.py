@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+from web import partitions
+
+
+class Command(BaseCommand):
+    help = (
+        "Помесячные секции таблицы звонков (только PostgreSQL). --convert один раз переводит таблицу "
+        "на секционирование (загрузку на это время нужно остановить), --ahead создаёт секции на месяцы "
+        "вперёд, --retain N отсоединяет и удаляет секции старше N месяцев. Дневная статистика при этом "
+        "сохраняется."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--convert", action="store_true", help="Перевести таблицу на секционирование")
+        parser.add_argument("--ahead", type=int, default=3, help="Сколько месяцев вперёд держать секции")
+        parser.add_argument("--retain", type=int, help="Сколько месяцев хранить, включая текущий")
+        parser.add_argument("--detach-only", action="store_true", help="Отсоединять старые секции, не удаляя")
+        parser.add_argument("--concurrently", action="store_true", help="DETACH PARTITION ... CONCURRENTLY")
+        parser.add_argument("--list", action="store_true", help="Показать секции и выйти")
+
+    def handle(self, *args, **opts):
+        if connection.vendor != "postgresql":
+            raise CommandError("Секционирование поддерживается только на PostgreSQL")
+        if opts["convert"]:
+            if partitions.convert(opts["ahead"], log=self.stdout.write):
+                self.stdout.write("Таблица секционирована. Перезапустите воркеры загрузки.")
+        if not partitions.is_partitioned():
+            raise CommandError("Таблица не секционирована, сначала запустите с --convert")
+        if opts["list"]:
+            for month, name in sorted(partitions.list_partitions().items()):
+                self.stdout.write(f"{month:%Y-%m}\t{name}")
+            return
+        for month in partitions.ensure_ahead(opts["ahead"]):
+            self.stdout.write(f"Создана секция {partitions.partition_name(month)}")
+        if opts["retain"] is not None:
+            if opts["retain"] < 1:
+                raise CommandError("--retain должен быть не меньше 1")
+            before = partitions.add_months(partitions.month_of(timezone.localdate()), 1 - opts["retain"])
+            for name in partitions.retire(before, drop=not opts["detach_only"], concurrently=opts["concurrently"]):
+                self.stdout.write(f"{'Отсоединена' if opts['detach_only'] else 'Удалена'} секция {name}")
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from web.uploads import expire_uploads
+
+
+class Command(BaseCommand):
+    help = (
+        "Закрывает сессии докачки (/api/calls/uploads/), в которые дольше CALLS_UPLOAD_SESSION_TTL не приходили "
+        "фрагменты, и удаляет их файлы. Новые сессии делают это и сами."
+    )
+
+    def handle(self, *args, **opts):
+        self.stdout.write(f"Закрыто сессий: {expire_uploads()}")
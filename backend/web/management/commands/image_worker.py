@@ -0,0 +1,32 @@
+from web.images import requeue, work
+from web.models import ImageJob
+from .ingest_worker import Command as IngestWorkerCommand
+
+
+class Command(IngestWorkerCommand):
+    help = (
+        "Запускает пул процессов, которые создают WebP и миниатюры для изображений, сохранённых в отложенном "
+        "режиме (IMAGE_PROCESSING_DEFERRED). С --once обрабатывает очередь до конца и выходит."
+    )
+    work = staticmethod(work)
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument("--retry-failed", action="store_true", help="Вернуть в очередь задачи с ошибкой.")
+        parser.add_argument("--reprocess", type=int, nargs="+", default=[], metavar="ID", help="Повторить задачи по id.")
+        parser.add_argument("--status", action="store_true", help="Показать число задач по состояниям и выйти.")
+
+    def handle(self, *args, **opts):
+        if opts["status"]:
+            for state, _label in ImageJob.STATE_CHOICES:
+                self.stdout.write(f"{state}: {ImageJob.objects.filter(state=state).count()}")
+            return
+        jobs = ImageJob.objects.none()
+        if opts["retry_failed"]:
+            jobs = jobs | ImageJob.objects.filter(state=ImageJob.FAILED)
+        if opts["reprocess"]:
+            jobs = jobs | ImageJob.objects.filter(pk__in=opts["reprocess"]).exclude(state=ImageJob.RUNNING)
+        for job in jobs:
+            requeue(job)
+            self.stdout.write(f"#{job.pk} возвращена в очередь")
+        super().handle(*args, **opts)
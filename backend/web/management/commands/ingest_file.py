@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+from web.ingest import CsvHeaderError
+from web.parallel import CHUNK_BYTES, ingest_file
+from web.rejects import Rejects
+from web.writers import get_writer
+
+
+class Command(BaseCommand):
+    help = "Загружает CSV-файл CallRecord с диска, разбирая его параллельно в нескольких процессах."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument("--processes", type=int, default=None)
+        parser.add_argument("--chunk-mb", type=int, default=CHUNK_BYTES // (1024 * 1024))
+        parser.add_argument("--dedup", action="store_true", help="Пропускать строки, которые уже есть в базе.")
+        parser.add_argument("--max-errors", type=int, default=20, help="Сколько ошибок вывести.")
+
+    def handle(self, *args, **opts):
+        writer = get_writer(dedup=opts["dedup"])
+        rejects = Rejects()
+        try:
+            created, errors = ingest_file(
+                opts["path"], opts["processes"], opts["chunk_mb"] * 1024 * 1024, writer, rejects
+            )
+        except (OSError, CsvHeaderError) as e:
+            raise CommandError(str(e))
+        if errors:
+            for err in errors[: opts["max_errors"]]:
+                self.stderr.write(f"строка {err['line']}: {', '.join(err['errors'])}")
+            more = " (разбор остановлен)" if rejects.aborted else ""
+            raise CommandError(f"Ошибок: {rejects.count}{more}, ничего не загружено")
+        self.stdout.write(f"Загружено строк: {created}")
+        if writer.dedup:
+            self.stdout.write(f"Пропущено дубликатов: {writer.duplicates}")
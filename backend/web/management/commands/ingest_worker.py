@@ -0,0 +1,46 @@
+import multiprocessing
+import signal
+from django.core.management.base import BaseCommand
+from django.db import connections
+from web.jobs import work, worker_name
+
+
+def _stop(signum, frame):
+    raise KeyboardInterrupt
+
+
+def _child(work, once, poll):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    work(worker_name(), once=once, poll=poll)
+
+
+class Command(BaseCommand):
+    help = "Запускает пул процессов, которые забирают задачи загрузки CallRecord из базы и выполняют их."
+    work = staticmethod(work)
+
+    def add_arguments(self, parser):
+        parser.add_argument("--processes", type=int, default=2)
+        parser.add_argument("--poll", type=float, default=2.0, help="Пауза между опросами очереди, сек.")
+        parser.add_argument("--once", action="store_true", help="Выполнить все ожидающие задачи и выйти.")
+
+    def handle(self, *args, **opts):
+        if opts["processes"] <= 1:
+            self.work(worker_name(), once=opts["once"], poll=opts["poll"])
+            return
+        connections.close_all()
+        ctx = multiprocessing.get_context("fork")
+        procs = [
+            ctx.Process(target=_child, args=(self.work, opts["once"], opts["poll"]))
+            for _ in range(opts["processes"])
+        ]
+        for p in procs:
+            p.start()
+        signal.signal(signal.SIGTERM, _stop)
+        try:
+            for p in procs:
+                p.join()
+        except KeyboardInterrupt:
+            for p in procs:
+                p.terminate()
+            for p in procs:
+                p.join()
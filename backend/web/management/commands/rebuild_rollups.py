@@ -0,0 +1,36 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max, Min
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from web.models import CallRecord
+from web.rollups import rebuild_day
+
+
+class Command(BaseCommand):
+    help = (
+        "Пересчитывает дневную статистику (DailyCallStat, DailySrcStat, DailyDstStat) из CallRecord "
+        "за период включительно. Без дат — за весь период, где есть звонки. Каждый день в своей транзакции."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--from", dest="day_from", help="YYYY-MM-DD")
+        parser.add_argument("--to", dest="day_to", help="YYYY-MM-DD")
+
+    def handle(self, *args, **opts):
+        day_from = parse_date(opts["day_from"]) if opts["day_from"] else None
+        day_to = parse_date(opts["day_to"]) if opts["day_to"] else None
+        if day_from is None or day_to is None:
+            bounds = CallRecord.objects.aggregate(first=Min("calldate"), last=Max("calldate"))
+            if bounds["first"] is None:
+                self.stdout.write("Звонков нет")
+                return
+            day_from = day_from or timezone.localdate(bounds["first"])
+            day_to = day_to or timezone.localdate(bounds["last"])
+        if day_from > day_to:
+            raise CommandError("--from позже --to")
+        day = day_from
+        while day <= day_to:
+            rebuild_day(day)
+            day += timedelta(days=1)
+        self.stdout.write(f"Пересчитано дней: {(day_to - day_from).days + 1}")
@@ -0,0 +1,265 @@
+import glob
+import json
+import math
+import os
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from django.db import connection
+
+ENABLED = getattr(settings, "CALLS_METRICS_ENABLED", True)
+# Multiprocess mode: every process keeps its totals in
+# <dir>/metrics-<pid>-<id>.json and a scrape sums all files. The random id
+# keeps a new process that reuses a dead one's pid from overwriting the dead
+# process's totals. Empty the directory when the server starts,
+# like prometheus_client's PROMETHEUS_MULTIPROC_DIR.
+METRICS_DIR = getattr(settings, "CALLS_METRICS_DIR", "")
+
+SECONDS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+ROWS = (0, 1, 10, 100, 1000, 10_000, 100_000, 1_000_000)
+BYTES = (1024, 16 * 1024, 256 * 1024, 1 << 20, 16 << 20, 128 << 20, 1 << 30)
+QUERIES = (1, 2, 5, 10, 25, 50, 100, 250, 1000)
+
+METRICS = {
+    "calls_ingest_stage_seconds": ("histogram", SECONDS, "Время этапа загрузки звонков, с"),
+    "calls_ingest_rows": ("histogram", ROWS, "Строк в запросе загрузки"),
+    "calls_ingest_rejected_rows": ("histogram", ROWS, "Отклонённых строк в запросе загрузки"),
+    "calls_ingest_request_bytes": ("histogram", BYTES, "Размер тела запроса загрузки, байт"),
+    "calls_ingest_db_queries": ("histogram", QUERIES, "Запросов к базе за запрос загрузки"),
+    "calls_ingest_requests_total": ("counter", None, "Запросов загрузки по статусу ответа"),
+}
+
+
+# Every thread writes only to its own dict, so recording takes no lock; a
+# scrape copies and sums the dicts of all threads. A histogram is a list of
+# per-bucket counts, the +Inf count and the sum.
+class Registry:
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._stores = []
+
+    def _store(self):
+        try:
+            return self._local.store
+        except AttributeError:
+            store = self._local.store = {}
+            with self._lock:
+                self._stores.append(store)
+            return store
+
+    def inc(self, name, labels, value=1):
+        store = self._store()
+        key = (name, labels)
+        store[key] = store.get(key, 0) + value
+
+    def observe(self, name, labels, value):
+        store = self._store()
+        key = (name, labels)
+        slots = store.get(key)
+        bounds = METRICS[name][1]
+        if slots is None:
+            slots = store[key] = [0] * (len(bounds) + 2)
+        slots[bisect_left(bounds, value)] += 1
+        slots[-1] += value
+
+    def snapshot(self):
+        with self._lock:
+            stores = list(self._stores)
+        merged = {}
+        for store in stores:
+            for key, value in store.copy().items():
+                _merge(merged, key, value)
+        return merged
+
+    def clear(self):
+        with self._lock:
+            for store in self._stores:
+                store.clear()
+
+
+def _merge(merged, key, value):
+    if isinstance(value, list):
+        have = merged.get(key)
+        merged[key] = list(value) if have is None else [a + b for a, b in zip(have, value)]
+    else:
+        merged[key] = merged.get(key, 0) + value
+
+
+registry = Registry()
+
+
+_PROCESS_ID = uuid.uuid4().hex[:12]
+
+
+def _path():
+    return os.path.join(METRICS_DIR, f"metrics-{os.getpid()}-{_PROCESS_ID}.json")
+
+
+def flush():
+    if not METRICS_DIR:
+        return
+    data = [[name, [list(pair) for pair in labels], value] for (name, labels), value in registry.snapshot().items()]
+    try:
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        tmp = f"{_path()}.{threading.get_ident()}.tmp"
+        with open(tmp, "w") as fh:
+            json.dump(data, fh)
+        os.replace(tmp, _path())
+    except OSError:
+        pass
+
+
+def collect():
+    if not METRICS_DIR:
+        return registry.snapshot()
+    flush()
+    merged = {}
+    for path in glob.glob(os.path.join(METRICS_DIR, "metrics-*.json")):
+        try:
+            with open(path) as fh:
+                data = json.load(fh)
+        except (OSError, ValueError):
+            continue
+        for name, labels, value in data:
+            _merge(merged, (name, tuple(tuple(pair) for pair in labels)), value)
+    return merged
+
+
+def _fmt(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
+
+
+# Prometheus text exposition format 0.0.4.
+def render(samples=None):
+    samples = collect() if samples is None else samples
+    lines = []
+    for name, (kind, bounds, help_text) in METRICS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for (metric, labels), value in sorted(samples.items()):
+            if metric != name:
+                continue
+            if kind == "counter":
+                lines.append(f"{name}{_labels(labels)} {_fmt(value)}")
+                continue
+            cumulative = 0
+            for bound, count in zip(bounds + (math.inf,), value):
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels(labels + (('le', _fmt(bound)),))} {cumulative}")
+            lines.append(f"{name}_sum{_labels(labels)} {_fmt(value[-1])}")
+            lines.append(f"{name}_count{_labels(labels)} {cumulative}")
+    return "\n".join(lines) + "\n"
+
+
+# What one ingest request (or job) spent where. Stages may nest: calldate
+# is part of validate, db is the time inside cursor.execute over the whole
+# request.
+class Timings:
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.stages = {}
+        self.rows = 0
+        self.rejected = 0
+        self.bytes = 0
+        self.queries = 0
+        self.status = "error"
+
+    def add(self, stage, seconds):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def server_timing(self):
+        parts = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.stages.items()]
+        parts.append(f'queries;desc="{self.queries}"')
+        return ", ".join(parts)
+
+
+_current = ContextVar("calls_ingest_timings", default=None)
+
+
+def current():
+    return _current.get()
+
+
+def add_stage(name, seconds):
+    timings = _current.get()
+    if timings is not None:
+        timings.add(name, seconds)
+
+
+def note(rows=0, rejected=0, queries=0):
+    timings = _current.get()
+    if timings is not None:
+        timings.rows += rows
+        timings.rejected += rejected
+        timings.queries += queries
+
+
+# Outside track() this costs one ContextVar lookup.
+@contextmanager
+def stage(name):
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, time.perf_counter() - started)
+
+
+def record(timings):
+    labels = (("endpoint", timings.endpoint),)
+    for name, seconds in timings.stages.items():
+        registry.observe("calls_ingest_stage_seconds", labels + (("stage", name),), seconds)
+    registry.observe("calls_ingest_rows", labels, timings.rows)
+    registry.observe("calls_ingest_rejected_rows", labels, timings.rejected)
+    registry.observe("calls_ingest_request_bytes", labels, timings.bytes)
+    registry.observe("calls_ingest_db_queries", labels, timings.queries)
+    registry.inc("calls_ingest_requests_total", labels + (("status", str(timings.status)),))
+    flush()
+
+
+# Times the block as the "total" stage, counts the queries it sends and
+# their time ("db"), and records everything when it ends.
+@contextmanager
+def track(endpoint):
+    timings = Timings(endpoint)
+    if not ENABLED:
+        yield timings
+        return
+
+    def count(execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            timings.queries += 1
+            timings.add("db", time.perf_counter() - started)
+
+    token = _current.set(timings)
+    started = time.perf_counter()
+    try:
+        with connection.execute_wrapper(count):
+            yield timings
+    finally:
+        timings.add("total", time.perf_counter() - started)
+        _current.reset(token)
+        record(timings)
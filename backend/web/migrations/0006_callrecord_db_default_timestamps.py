@@ -0,0 +1,24 @@
+# Generated by Django 5.2.7 on 2026-10-18 19:47
+
+import django.db.models.functions.datetime
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('web', '0005_alter_callrecord_options'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='callrecord',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, db_default=django.db.models.functions.datetime.Now(), verbose_name='created_at'),
+        ),
+        migrations.AlterField(
+            model_name='callrecord',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_default=django.db.models.functions.datetime.Now(), verbose_name='updated_at'),
+        ),
+    ]
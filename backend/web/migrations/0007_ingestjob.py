@@ -0,0 +1,44 @@
+# Generated by Django 5.2.7 on 2026-10-18 19:51
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('web', '0006_callrecord_db_default_timestamps'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngestJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('state', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], db_index=True, default='pending', max_length=16, verbose_name='state')),
+                ('spool_path', models.CharField(max_length=512, verbose_name='spool_path')),
+                ('size', models.BigIntegerField(default=0, verbose_name='size')),
+                ('offset', models.BigIntegerField(default=0, verbose_name='offset')),
+                ('line', models.PositiveIntegerField(default=0, verbose_name='line')),
+                ('processed', models.PositiveIntegerField(default=0, verbose_name='processed')),
+                ('created_rows', models.PositiveIntegerField(default=0, verbose_name='created_rows')),
+                ('rejected', models.PositiveIntegerField(default=0, verbose_name='rejected')),
+                ('errors', models.JSONField(blank=True, default=list, verbose_name='errors')),
+                ('detail', models.TextField(blank=True, default='', verbose_name='detail')),
+                ('worker', models.CharField(blank=True, default='', max_length=128, verbose_name='worker')),
+                ('heartbeat_at', models.DateTimeField(blank=True, null=True, verbose_name='heartbeat_at')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='started_at')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='finished_at')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='created_at')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='updated_at')),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ingest_jobs', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Задача загрузки',
+                'verbose_name_plural': 'Задачи загрузки',
+                'ordering': ('-id',),
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.7 on 2026-10-18 19:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('web', '0007_ingestjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='callrecord',
+            name='fingerprint',
+            field=models.CharField(blank=True, editable=False, max_length=32, null=True, unique=True, verbose_name='fingerprint'),
+        ),
+        migrations.AddField(
+            model_name='ingestjob',
+            name='dedup',
+            field=models.BooleanField(default=False, verbose_name='dedup'),
+        ),
+        migrations.AddField(
+            model_name='ingestjob',
+            name='duplicates',
+            field=models.PositiveIntegerField(default=0, verbose_name='duplicates'),
+        ),
+    ]
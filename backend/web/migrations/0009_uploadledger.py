@@ -0,0 +1,38 @@
+# Generated by Django 5.2.7 on 2026-10-18 19:59
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('web', '0008_callrecord_fingerprint'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadLedger',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sha256', models.CharField(db_index=True, max_length=64, verbose_name='sha256')),
+                ('size', models.BigIntegerField(default=0, verbose_name='size')),
+                ('name', models.CharField(blank=True, default='', max_length=255, verbose_name='name')),
+                ('source', models.CharField(choices=[('csv', 'CSV'), ('job', 'Job')], default='csv', max_length=16, verbose_name='source')),
+                ('rows_created', models.PositiveIntegerField(default=0, verbose_name='rows_created')),
+                ('duplicates', models.PositiveIntegerField(default=0, verbose_name='duplicates')),
+                ('first_id', models.BigIntegerField(blank=True, null=True, verbose_name='first_id')),
+                ('last_id', models.BigIntegerField(blank=True, null=True, verbose_name='last_id')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='created_at')),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='uploads', to=settings.AUTH_USER_MODEL)),
+                ('job', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ledger', to='web.ingestjob')),
+            ],
+            options={
+                'verbose_name': 'Загруженный файл',
+                'verbose_name_plural': 'Загруженные файлы',
+                'ordering': ('-id',),
+            },
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.7 on 2026-10-18 20:02
+
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('web', '0009_uploadledger'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='callrecord',
+            index=models.Index(fields=['calldate', 'id'], name='web_call_calldate_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='callrecord',
+            index=models.Index(fields=['src', 'calldate', 'id'], name='web_call_src_calldate_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='callrecord',
+            index=models.Index(fields=['dst', 'calldate', 'id'], name='web_call_dst_calldate_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='callrecord',
+            index=django.contrib.postgres.indexes.BrinIndex(fields=['calldate'], name='web_call_calldate_brin'),
+        ),
+        migrations.AlterField(
+            model_name='callrecord',
+            name='dst',
+            field=models.CharField(max_length=64, verbose_name='dst'),
+        ),
+        migrations.AlterField(
+            model_name='callrecord',
+            name='src',
+            field=models.CharField(max_length=64, verbose_name='src'),
+        ),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 5.2.7 on 2026-10-18 20:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('web', '0010_callrecord_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyCallStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('calls', models.IntegerField(default=0, verbose_name='calls')),
+                ('answered', models.IntegerField(default=0, verbose_name='answered')),
+                ('duration', models.BigIntegerField(default=0, verbose_name='duration')),
+                ('billsec', models.BigIntegerField(default=0, verbose_name='billsec')),
+                ('day', models.DateField(unique=True, verbose_name='day')),
+            ],
+            options={
+                'verbose_name': 'Статистика за день',
+                'verbose_name_plural': 'Статистика по дням',
+                'ordering': ('-day',),
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyDstStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='day')),
+                ('calls', models.IntegerField(default=0, verbose_name='calls')),
+                ('answered', models.IntegerField(default=0, verbose_name='answered')),
+                ('duration', models.BigIntegerField(default=0, verbose_name='duration')),
+                ('billsec', models.BigIntegerField(default=0, verbose_name='billsec')),
+                ('dst', models.CharField(max_length=64, verbose_name='dst')),
+            ],
+            options={
+                'verbose_name': 'Статистика dst за день',
+                'verbose_name_plural': 'Статистика dst по дням',
+                'ordering': ('-day',),
+                'indexes': [models.Index(fields=['day'], name='web_dailydststat_day_idx')],
+                'constraints': [models.UniqueConstraint(fields=('dst', 'day'), name='web_dailydststat_dst_day_uniq')],
+            },
+        ),
+        migrations.CreateModel(
+            name='DailySrcStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='day')),
+                ('calls', models.IntegerField(default=0, verbose_name='calls')),
+                ('answered', models.IntegerField(default=0, verbose_name='answered')),
+                ('duration', models.BigIntegerField(default=0, verbose_name='duration')),
+                ('billsec', models.BigIntegerField(default=0, verbose_name='billsec')),
+                ('src', models.CharField(max_length=64, verbose_name='src')),
+            ],
+            options={
+                'verbose_name': 'Статистика src за день',
+                'verbose_name_plural': 'Статистика src по дням',
+                'ordering': ('-day',),
+                'indexes': [models.Index(fields=['day'], name='web_dailysrcstat_day_idx')],
+                'constraints': [models.UniqueConstraint(fields=('src', 'day'), name='web_dailysrcstat_src_day_uniq')],
+            },
+        ),
+    ]
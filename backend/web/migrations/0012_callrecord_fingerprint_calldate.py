@@ -0,0 +1,22 @@
+# Generated by Django 5.2.7 on 2026-10-18 20:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('web', '0011_daily_rollups'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='callrecord',
+            constraint=models.UniqueConstraint(fields=('fingerprint', 'calldate'), name='web_call_fingerprint_uniq'),
+        ),
+        migrations.AlterField(
+            model_name='callrecord',
+            name='fingerprint',
+            field=models.CharField(blank=True, editable=False, max_length=32, null=True, verbose_name='fingerprint'),
+        ),
+    ]
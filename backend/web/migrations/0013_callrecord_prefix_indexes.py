@@ -0,0 +1,21 @@
+# Generated by Django 5.2.7 on 2026-10-18 20:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('web', '0012_callrecord_fingerprint_calldate'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='callrecord',
+            index=models.Index(fields=['src'], name='web_call_src_prefix_idx', opclasses=['varchar_pattern_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='callrecord',
+            index=models.Index(fields=['dst'], name='web_call_dst_prefix_idx', opclasses=['varchar_pattern_ops']),
+        ),
+    ]
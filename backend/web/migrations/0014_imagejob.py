@@ -0,0 +1,42 @@
+# Generated by Django 5.2.7 on 2026-10-18 20:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('web', '0013_callrecord_prefix_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True, verbose_name='key')),
+                ('state', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], db_index=True, default='pending', max_length=16, verbose_name='state')),
+                ('object_id', models.CharField(max_length=64, verbose_name='object_id')),
+                ('field', models.CharField(max_length=64, verbose_name='field')),
+                ('source_name', models.CharField(max_length=512, verbose_name='source_name')),
+                ('source_hash', models.CharField(max_length=64, verbose_name='source_hash')),
+                ('config', models.JSONField(default=list, verbose_name='config')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='attempts')),
+                ('detail', models.TextField(blank=True, default='', verbose_name='detail')),
+                ('worker', models.CharField(blank=True, default='', max_length=128, verbose_name='worker')),
+                ('heartbeat_at', models.DateTimeField(blank=True, null=True, verbose_name='heartbeat_at')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='started_at')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='finished_at')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='created_at')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='updated_at')),
+                ('content_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='contenttypes.contenttype')),
+            ],
+            options={
+                'verbose_name': 'Обработка изображения',
+                'verbose_name_plural': 'Обработка изображений',
+                'ordering': ('-id',),
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.7 on 2026-10-18 20:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('web', '0014_imagejob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingestjob',
+            name='expires_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='expires_at'),
+        ),
+        migrations.AddField(
+            model_name='ingestjob',
+            name='total_size',
+            field=models.BigIntegerField(blank=True, null=True, verbose_name='total_size'),
+        ),
+        migrations.AlterField(
+            model_name='ingestjob',
+            name='state',
+            field=models.CharField(choices=[('uploading', 'Uploading'), ('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], db_index=True, default='pending', max_length=16, verbose_name='state'),
+        ),
+    ]
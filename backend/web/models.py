@@ -1,5 +1,12 @@
+import hashlib
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.postgres.indexes import BrinIndex
+from django.core.exceptions import ValidationError
 from django.db import models
+from django.db.models.functions import Now
 from django.utils import timezone
+from .calldate import localize, parse_calldate
 
 
 class CallRecord(models.Model):
@@ -14,8 +21,8 @@ class CallRecord(models.Model):
     )
 
     calldate = models.DateTimeField()
-    src = models.CharField("src", max_length=64, db_index=True)
-    dst = models.CharField("dst", max_length=64, db_index=True)
+    src = models.CharField("src", max_length=64)
+    dst = models.CharField("dst", max_length=64)
     duration = models.PositiveIntegerField("duration", default=0)
     billsec = models.PositiveIntegerField("billsec", default=0)
     disposition = models.CharField(
@@ -25,17 +32,57 @@ class CallRecord(models.Model):
         default=NO_ANSWER,
     )
     answered = models.BooleanField("answered", default=False)
-    created_at = models.DateTimeField("created_at", auto_now_add=True)
-    updated_at = models.DateTimeField("updated_at", auto_now=True)
+    # Only filled by dedup ingestion; NULLs never collide in the unique index.
+    # The fingerprint already covers calldate, so making calldate part of
+    # the unique key changes nothing except that a table partitioned by
+    # calldate can enforce it.
+    fingerprint = models.CharField("fingerprint", max_length=32, null=True, blank=True, editable=False)
+    created_at = models.DateTimeField("created_at", auto_now_add=True, db_default=Now())
+    updated_at = models.DateTimeField("updated_at", auto_now=True, db_default=Now())
 
     class Meta:
         verbose_name = "Csv Данный"
         verbose_name_plural = "Csv Данные"
         ordering = ("-calldate",)
+        # The btree indexes end in (calldate, id) so every filtered listing
+        # can walk them backwards in keyset order. BRIN keeps wide calldate
+        # range scans cheap on an append-mostly table. The pattern_ops indexes
+        # serve the admin's prefix search (LIKE 'x%') whatever the collation.
+        indexes = [
+            models.Index(fields=["calldate", "id"], name="web_call_calldate_id_idx"),
+            models.Index(fields=["src", "calldate", "id"], name="web_call_src_calldate_idx"),
+            models.Index(fields=["dst", "calldate", "id"], name="web_call_dst_calldate_idx"),
+            BrinIndex(fields=["calldate"], name="web_call_calldate_brin"),
+            models.Index(fields=["src"], name="web_call_src_prefix_idx", opclasses=["varchar_pattern_ops"]),
+            models.Index(fields=["dst"], name="web_call_dst_prefix_idx", opclasses=["varchar_pattern_ops"]),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=["fingerprint", "calldate"], name="web_call_fingerprint_uniq"),
+        ]
 
     def __str__(self):
         return f"{self.calldate} — {self.src} → {self.dst} ({self.disposition})"
 
+    @staticmethod
+    def make_fingerprint(calldate, src, dst, duration, billsec, disposition):
+        key = f"{calldate.timestamp():.6f}|{src}|{dst}|{duration}|{billsec}|{disposition}"
+        return hashlib.blake2b(key.encode(), digest_size=16).hexdigest()
+
+    def _own_fingerprint(self):
+        return self.make_fingerprint(self.calldate, self.src, self.dst, self.duration, self.billsec, self.disposition)
+
+    # The fingerprint is not a form field, so the admin's unique checks skip
+    # it; an edit that turns a deduplicated row into a copy of another one is
+    # reported here instead of failing on the unique index.
+    def clean(self):
+        super().clean()
+        if not self.fingerprint or not self.calldate or isinstance(self.calldate, str):
+            return
+        fingerprint = self._own_fingerprint()
+        clash = CallRecord.objects.filter(fingerprint=fingerprint, calldate=self.calldate).exclude(pk=self.pk)
+        if clash.exists():
+            raise ValidationError("Такой звонок уже загружен")
+
     def save(self, *args, **kwargs):
         if self.disposition:
             disp_lower = self.disposition.strip().lower()
@@ -52,9 +99,208 @@ class CallRecord(models.Model):
                 self.disposition = self.OTHER
                 self.answered = False
 
-        if self.calldate and timezone.is_naive(self.calldate):
-            self.calldate = timezone.make_aware(
-                self.calldate, timezone.get_current_timezone()
-            )
+        if isinstance(self.calldate, str):
+            self.calldate = parse_calldate(self.calldate) or self.calldate
+
+        if self.calldate and not isinstance(self.calldate, str) and timezone.is_naive(self.calldate):
+            self.calldate = localize(self.calldate)
+
+        if self.fingerprint:
+            self.fingerprint = self._own_fingerprint()
 
         super().save(*args, **kwargs)
+
+
+class IngestJob(models.Model):
+    # A resumable upload session (web.uploads) still receiving chunks.
+    UPLOADING = "uploading"
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+    STATE_CHOICES = (
+        (UPLOADING, "Uploading"),
+        (PENDING, "Pending"),
+        (RUNNING, "Running"),
+        (DONE, "Done"),
+        (FAILED, "Failed"),
+    )
+
+    state = models.CharField("state", max_length=16, choices=STATE_CHOICES, default=PENDING, db_index=True)
+    spool_path = models.CharField("spool_path", max_length=512)
+    size = models.BigIntegerField("size", default=0)
+    total_size = models.BigIntegerField("total_size", null=True, blank=True)
+    created_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name="ingest_jobs"
+    )
+    offset = models.BigIntegerField("offset", default=0)
+    line = models.PositiveIntegerField("line", default=0)
+    processed = models.PositiveIntegerField("processed", default=0)
+    created_rows = models.PositiveIntegerField("created_rows", default=0)
+    rejected = models.PositiveIntegerField("rejected", default=0)
+    dedup = models.BooleanField("dedup", default=False)
+    duplicates = models.PositiveIntegerField("duplicates", default=0)
+    errors = models.JSONField("errors", default=list, blank=True)
+    detail = models.TextField("detail", blank=True, default="")
+    worker = models.CharField("worker", max_length=128, blank=True, default="")
+    attempts = models.PositiveSmallIntegerField("attempts", default=0)
+    heartbeat_at = models.DateTimeField("heartbeat_at", null=True, blank=True)
+    started_at = models.DateTimeField("started_at", null=True, blank=True)
+    finished_at = models.DateTimeField("finished_at", null=True, blank=True)
+    expires_at = models.DateTimeField("expires_at", null=True, blank=True)
+    created_at = models.DateTimeField("created_at", auto_now_add=True)
+    updated_at = models.DateTimeField("updated_at", auto_now=True)
+
+    class Meta:
+        verbose_name = "Задача загрузки"
+        verbose_name_plural = "Задачи загрузки"
+        ordering = ("-id",)
+
+    def __str__(self):
+        return f"#{self.pk} {self.state} ({self.processed})"
+
+    @property
+    def throughput(self):
+        if not self.started_at or not self.processed:
+            return 0.0
+        end = self.finished_at or timezone.now()
+        seconds = (end - self.started_at).total_seconds()
+        return round(self.processed / seconds, 1) if seconds > 0 else 0.0
+
+
+class UploadLedger(models.Model):
+    SOURCE_CSV = "csv"
+    SOURCE_JOB = "job"
+
+    SOURCE_CHOICES = (
+        (SOURCE_CSV, "CSV"),
+        (SOURCE_JOB, "Job"),
+    )
+
+    sha256 = models.CharField("sha256", max_length=64, db_index=True)
+    size = models.BigIntegerField("size", default=0)
+    name = models.CharField("name", max_length=255, blank=True, default="")
+    source = models.CharField("source", max_length=16, choices=SOURCE_CHOICES, default=SOURCE_CSV)
+    created_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name="uploads"
+    )
+    job = models.OneToOneField(IngestJob, on_delete=models.SET_NULL, null=True, blank=True, related_name="ledger")
+    rows_created = models.PositiveIntegerField("rows_created", default=0)
+    duplicates = models.PositiveIntegerField("duplicates", default=0)
+    # Bounds of the CallRecord ids this upload inserted. Concurrent uploads
+    # can interleave ids, so the range may also contain other uploads' rows.
+    first_id = models.BigIntegerField("first_id", null=True, blank=True)
+    last_id = models.BigIntegerField("last_id", null=True, blank=True)
+    created_at = models.DateTimeField("created_at", auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Загруженный файл"
+        verbose_name_plural = "Загруженные файлы"
+        ordering = ("-id",)
+
+    def __str__(self):
+        return f"{self.name or self.sha256[:12]} ({self.rows_created})"
+
+    def records(self):
+        if self.first_id is None or self.last_id is None:
+            return CallRecord.objects.none()
+        return CallRecord.objects.filter(id__range=(self.first_id, self.last_id))
+
+    def extend_range(self, first_id, last_id):
+        if first_id is not None:
+            self.first_id = first_id if self.first_id is None else min(self.first_id, first_id)
+        if last_id is not None:
+            self.last_id = last_id if self.last_id is None else max(self.last_id, last_id)
+
+
+# Per-day call counters maintained alongside ingestion (see web.rollups).
+# ``day`` is the local calendar day of calldate in TIME_ZONE.
+class CallStatBase(models.Model):
+    day = models.DateField("day")
+    calls = models.IntegerField("calls", default=0)
+    answered = models.IntegerField("answered", default=0)
+    duration = models.BigIntegerField("duration", default=0)
+    billsec = models.BigIntegerField("billsec", default=0)
+
+    class Meta:
+        abstract = True
+
+
+class DailyCallStat(CallStatBase):
+    day = models.DateField("day", unique=True)
+
+    class Meta:
+        verbose_name = "Статистика за день"
+        verbose_name_plural = "Статистика по дням"
+        ordering = ("-day",)
+
+
+class DailySrcStat(CallStatBase):
+    src = models.CharField("src", max_length=64)
+
+    class Meta:
+        verbose_name = "Статистика src за день"
+        verbose_name_plural = "Статистика src по дням"
+        ordering = ("-day",)
+        constraints = [models.UniqueConstraint(fields=["src", "day"], name="web_dailysrcstat_src_day_uniq")]
+        indexes = [models.Index(fields=["day"], name="web_dailysrcstat_day_idx")]
+
+
+class DailyDstStat(CallStatBase):
+    dst = models.CharField("dst", max_length=64)
+
+    class Meta:
+        verbose_name = "Статистика dst за день"
+        verbose_name_plural = "Статистика dst по дням"
+        ordering = ("-day",)
+        constraints = [models.UniqueConstraint(fields=["dst", "day"], name="web_dailydststat_dst_day_uniq")]
+        indexes = [models.Index(fields=["day"], name="web_dailydststat_day_idx")]
+
+
+# Deferred ImageOptimizationMixin work (see web.images). One job per
+# (object, image field, sha256 of the source); ``key`` is a digest of the
+# three, so saving the same upload again never queues a second encode.
+class ImageJob(models.Model):
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+    STATE_CHOICES = (
+        (PENDING, "Pending"),
+        (RUNNING, "Running"),
+        (DONE, "Done"),
+        (FAILED, "Failed"),
+    )
+
+    key = models.CharField("key", max_length=64, unique=True)
+    state = models.CharField("state", max_length=16, choices=STATE_CHOICES, default=PENDING, db_index=True)
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE, related_name="+")
+    object_id = models.CharField("object_id", max_length=64)
+    field = models.CharField("field", max_length=64)
+    source_name = models.CharField("source_name", max_length=512)
+    source_hash = models.CharField("source_hash", max_length=64)
+    # [renditions, max_kb, thumb_w] as passed to process_images_config.
+    config = models.JSONField("config", default=list)
+    attempts = models.PositiveSmallIntegerField("attempts", default=0)
+    detail = models.TextField("detail", blank=True, default="")
+    worker = models.CharField("worker", max_length=128, blank=True, default="")
+    heartbeat_at = models.DateTimeField("heartbeat_at", null=True, blank=True)
+    started_at = models.DateTimeField("started_at", null=True, blank=True)
+    finished_at = models.DateTimeField("finished_at", null=True, blank=True)
+    created_at = models.DateTimeField("created_at", auto_now_add=True)
+    updated_at = models.DateTimeField("updated_at", auto_now=True)
+
+    class Meta:
+        verbose_name = "Обработка изображения"
+        verbose_name_plural = "Обработка изображений"
+        ordering = ("-id",)
+
+    def __str__(self):
+        return f"#{self.pk} {self.field} {self.state}"
+
+    @staticmethod
+    def make_key(instance, field, source_hash):
+        raw = f"{instance._meta.label_lower}:{instance.pk}:{field}:{source_hash}"
+        return hashlib.sha256(raw.encode()).hexdigest()
@@ -0,0 +1,116 @@
+import base64
+from datetime import datetime
+import json
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+PAGE_SIZE = getattr(settings, "CALLS_PAGE_SIZE", 100)
+MAX_PAGE_SIZE = getattr(settings, "CALLS_MAX_PAGE_SIZE", 1000)
+# Changelists with more rows than this show the planner's estimate.
+EXACT_COUNT_LIMIT = getattr(settings, "CALLS_ADMIN_EXACT_COUNT_LIMIT", 10000)
+
+
+def encode_cursor(calldate, pk):
+    raw = f"{calldate.isoformat()}|{pk}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(value):
+    try:
+        raw = base64.urlsafe_b64decode(value + "=" * (-len(value) % 4)).decode()
+        calldate, pk = raw.rsplit("|", 1)
+        return datetime.fromisoformat(calldate), int(pk)
+    except (ValueError, UnicodeDecodeError):
+        raise NotFound("Неверный курсор")
+
+
+# Rows strictly after (calldate, id) in (-calldate, -id) order. The plain
+# calldate__lte bound is what the index range scan starts from; the OR only
+# drops the few rows that share the boundary calldate.
+def after_cursor(queryset, calldate, pk):
+    return queryset.filter(calldate__lte=calldate).filter(Q(calldate__lt=calldate) | Q(id__lt=pk))
+
+
+# Keyset pagination over (-calldate, -id): the cursor is the last row of the
+# previous page, so every page is an index range scan with LIMIT and costs
+# the same however deep it is. Only forward paging is supported.
+class KeysetPagination(BasePagination):
+    cursor_query_param = "cursor"
+    page_size_query_param = "limit"
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, PAGE_SIZE))
+        except ValueError:
+            size = PAGE_SIZE
+        return max(1, min(size, MAX_PAGE_SIZE))
+
+    def page_queryset(self, queryset, cursor, page_size):
+        queryset = queryset.order_by("-calldate", "-id")
+        if cursor is not None:
+            queryset = after_cursor(queryset, *cursor)
+        return queryset[: page_size + 1]
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        value = request.query_params.get(self.cursor_query_param)
+        cursor = decode_cursor(value) if value else None
+        rows = list(self.page_queryset(queryset, cursor, page_size))
+        self.cursor = cursor
+        self.has_next = len(rows) > page_size
+        rows = rows[:page_size]
+        self.next_cursor = encode_cursor(rows[-1].calldate, rows[-1].pk) if self.has_next else None
+        return rows
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        return Response({"next": self.get_next_link(), "results": data})
+
+
+# Admin paginator that never counts a big table. Up to EXACT_COUNT_LIMIT
+# rows are counted exactly (COUNT over a LIMITed subquery); above that the
+# count comes from pg_class.reltuples for the whole table, or from the
+# planner's row estimate for a filtered changelist.
+class EstimatedCountPaginator(Paginator):
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if connection.vendor != "postgresql":
+            return super().count
+        capped = queryset.order_by()[: EXACT_COUNT_LIMIT + 1].count()
+        if capped <= EXACT_COUNT_LIMIT:
+            return capped
+        with connection.cursor() as cursor:
+            if queryset.query.where:
+                sql, params = queryset.order_by().query.sql_with_params()
+                cursor.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+                plan = cursor.fetchone()[0]
+                if isinstance(plan, str):
+                    plan = json.loads(plan)
+                estimate = plan[0]["Plan"]["Plan Rows"]
+            else:
+                # A partitioned parent has no rows of its own; its
+                # partitions carry the statistics.
+                cursor.execute(
+                    "SELECT CASE WHEN c.relkind = 'p' THEN ("
+                    "SELECT coalesce(sum(greatest(p.reltuples, 0)), 0) FROM pg_inherits i "
+                    "JOIN pg_class p ON p.oid = i.inhrelid WHERE i.inhparent = c.oid"
+                    ") ELSE greatest(c.reltuples, 0) END FROM pg_class c WHERE c.oid = to_regclass(%s)",
+                    [queryset.model._meta.db_table],
+                )
+                estimate = cursor.fetchone()[0]
+        return max(int(estimate), capped)
@@ -0,0 +1,167 @@
+import io
+import mmap
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from django.conf import settings
+from django.db import connections, transaction
+from .ingest import CsvRecordReader
+from .rejects import MAX_ERRORS, Rejects
+from .validation import RecordValidator
+from .writers import BATCH_SIZE, get_writer
+
+CHUNK_BYTES = getattr(settings, "CALLS_INGEST_CHUNK_BYTES", 8 * 1024 * 1024)
+
+
+def _count(mm, needle, begin, end):
+    return mm[begin:end].count(needle)
+
+
+# Splits [start, len(mm)) into ranges of roughly ``chunk_bytes`` that end on a
+# record boundary. A newline only ends a record when the number of quote
+# characters since the range start is even; doubled quotes ("") inside a
+# field keep the parity, so quoted newlines never become split points.
+# Each range carries the physical line number it starts after.
+def split_ranges(mm, start, line, chunk_bytes=CHUNK_BYTES):
+    size = len(mm)
+    ranges = []
+    begin = start
+    while begin < size:
+        target = begin + chunk_bytes
+        end = size
+        if target < size:
+            parity = _count(mm, b'"', begin, target) & 1
+            pos = target
+            while True:
+                nl = mm.find(b"\n", pos)
+                if nl == -1:
+                    break
+                parity ^= _count(mm, b'"', pos, nl) & 1
+                if not parity:
+                    end = nl + 1
+                    break
+                pos = nl + 1
+        ranges.append((begin, end, line))
+        line += _count(mm, b"\n", begin, end)
+        begin = end
+    return ranges
+
+
+# A range is decoded in one go and fed to csv as text, which is much cheaper
+# than the per-line incremental decoding the streaming reader needs.
+class _RangeReader(CsvRecordReader):
+    def _lines(self):
+        return self.stream
+
+
+NOT_UTF8 = "Файл должен быть в кодировке UTF-8"
+
+
+# Runs in a pool process. ``encode`` is a writer's encode() so the rows come
+# back in the form the parent writes them (one COPY string on PostgreSQL)
+# instead of as pickled tuples. The range is validated in batches of
+# BATCH_SIZE rows; once a line is rejected the rows are no longer kept and
+# the rejects are collected up to the usual cap. Bytes that are not UTF-8
+# reject the range, reported on the physical line they are on.
+def parse_range(path, header, begin, end, line, encode=None, max_errors=MAX_ERRORS):
+    with open(path, "rb") as fh, mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        data = mm[begin:end]
+    encode = encode or list
+    rejects = Rejects(max_errors)
+    try:
+        text = data.decode("utf-8")
+    except UnicodeDecodeError as e:
+        rejects.add([(line + data.count(b"\n", 0, e.start) + 1, [NOT_UTF8])])
+        return encode([]), rejects
+    reader = _RangeReader(io.StringIO(text, newline=""), header=header)
+    reader.line = line
+    validator = RecordValidator()
+    rows = []
+    for columns, lines in reader.iter_column_batches(BATCH_SIZE):
+        result = validator.validate_columns(columns, lines)
+        if result.errors:
+            rejects.add(result.errors)
+            rows = []
+            if rejects.should_abort:
+                rejects.aborted = True
+                break
+        elif not rejects.count:
+            rows.extend(result.rows())
+    return encode(rows), rejects
+
+
+def plan(path, chunk_bytes=CHUNK_BYTES):
+    with open(path, "rb") as fh:
+        reader = CsvRecordReader(fh)
+        if reader.offset >= os.fstat(fh.fileno()).st_size:
+            return reader.header, []
+        with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return reader.header, split_ranges(mm, reader.offset, reader.line, chunk_bytes)
+
+
+# With fork, the first submit starts every worker, so a pool started before
+# a transaction opens never forks in the middle of it. The parent's database
+# connections are closed first so no worker inherits their sockets.
+def start_pool(processes=None):
+    connections.close_all()
+    pool = ProcessPoolExecutor(
+        max_workers=processes or os.cpu_count() or 1, mp_context=multiprocessing.get_context("fork")
+    )
+    pool.submit(os.getpid).result()
+    return pool
+
+
+# Yields (payload, rejects) per range in file order. At most
+# ``processes * 2`` ranges are in flight, so memory stays bounded by the
+# window rather than the file size. Without ``pool`` one is started here.
+def iter_file_results(path, processes=None, chunk_bytes=CHUNK_BYTES, encode=None, pool=None):
+    processes = processes or os.cpu_count() or 1
+    header, ranges = plan(path, chunk_bytes)
+    if not ranges:
+        return
+    if pool is None:
+        with start_pool(processes) as pool:
+            yield from _results(pool, processes, path, header, ranges, encode)
+    else:
+        yield from _results(pool, processes, path, header, ranges, encode)
+
+
+def _results(pool, processes, path, header, ranges, encode):
+    todo = iter(ranges)
+    pending = deque()
+    for begin, end, line in todo:
+        pending.append(pool.submit(parse_range, path, header, begin, end, line, encode))
+        if len(pending) >= processes * 2:
+            break
+    while pending:
+        payload, rejects = pending.popleft().result()
+        nxt = next(todo, None)
+        if nxt is not None:
+            pending.append(pool.submit(parse_range, path, header, *nxt, encode))
+        yield payload, rejects
+
+
+# Same all-or-nothing contract as web.ingest.ingest_records, including the
+# capped ``rejects``: reading stops once there are more than max_errors. A
+# header that is not UTF-8 is reported as an error on line 1.
+def ingest_file(path, processes=None, chunk_bytes=CHUNK_BYTES, writer=None, rejects=None):
+    writer = writer or get_writer()
+    processes = processes or os.cpu_count() or 1
+    rejects = rejects if rejects is not None else Rejects()
+    created = 0
+    with start_pool(processes) as pool, transaction.atomic():
+        try:
+            for payload, range_rejects in iter_file_results(path, processes, chunk_bytes, writer.encode, pool):
+                rejects.merge(range_rejects)
+                if rejects.should_abort:
+                    rejects.aborted = True
+                    break
+                if not rejects.count:
+                    created += writer.write_encoded(payload)
+        except UnicodeDecodeError:
+            rejects.add([(1, [NOT_UTF8])])
+        if rejects.failed:
+            transaction.set_rollback(True)
+            return 0, rejects.errors
+    return created, rejects.errors
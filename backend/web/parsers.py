@@ -0,0 +1,136 @@
+import codecs
+import json
+import re
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+CHUNK_SIZE = 64 * 1024
+# A single value (one record, or another top-level key) larger than this is
+# rejected instead of being buffered while waiting for its end.
+MAX_VALUE_BYTES = getattr(settings, "CALLS_BULK_MAX_RECORD_BYTES", 1024 * 1024)
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_decoder = json.JSONDecoder()
+
+
+class RecordsNotAList(ValueError):
+    pass
+
+
+# Walks a {"records": [...], ...} body straight from the request stream and
+# yields (line, record) for each array element as soon as it is complete,
+# so only one read chunk and the current record are held in memory. Other
+# top-level keys end up in ``head`` (before "records", known once open()
+# returns) or ``tail`` (after it, known once iteration ends).
+class JSONRecordStream:
+    def __init__(self, stream, encoding="utf-8", chunk_size=CHUNK_SIZE):
+        self.stream = stream
+        self.decoder = codecs.getincrementaldecoder(encoding)()
+        self.chunk_size = chunk_size
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+        self.head = {}
+        self.tail = {}
+        self._walker = self._walk()
+
+    def _fill(self):
+        if self.eof:
+            return False
+        chunk = self.stream.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+        try:
+            text = self.decoder.decode(chunk, final=self.eof)
+        except UnicodeDecodeError as e:
+            raise ParseError(f"JSON parse error - {e}")
+        self.buf = self.buf[self.pos:] + text
+        self.pos = 0
+        return True
+
+    def _peek(self):
+        while True:
+            self.pos = _WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ""
+
+    def _expect(self, chars):
+        ch = self._peek()
+        if not ch or ch not in chars:
+            found = repr(ch) if ch else "конец данных"
+            raise ParseError(f"JSON parse error - ожидалось {' или '.join(map(repr, chars))}, получено {found}")
+        self.pos += 1
+        return ch
+
+    # raw_decode cannot tell a truncated value from a broken one, so a
+    # failure is retried with more data until the stream ends. A value that
+    # ends exactly at the end of the buffer may be a number cut in half and
+    # is decoded again with the next chunk.
+    def _value(self):
+        self._peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError as e:
+                if len(self.buf) - self.pos > MAX_VALUE_BYTES or not self._fill():
+                    raise ParseError(f"JSON parse error - {e}")
+                continue
+            if end == len(self.buf) and self._fill():
+                continue
+            self.pos = end
+            return value
+
+    def _walk(self):
+        self._expect("{")
+        seen_records = False
+        if self._peek() == "}":
+            self.pos += 1
+        else:
+            while True:
+                key = self._value()
+                if not isinstance(key, str):
+                    raise ParseError("JSON parse error - ожидался ключ")
+                self._expect(":")
+                if key == "records" and not seen_records:
+                    seen_records = True
+                    if self._peek() != "[":
+                        raise RecordsNotAList()
+                    self.pos += 1
+                    yield None
+                    line = 0
+                    if self._peek() == "]":
+                        self.pos += 1
+                    else:
+                        while True:
+                            line += 1
+                            yield line, self._value()
+                            if self._expect(",]") == "]":
+                                break
+                else:
+                    (self.tail if seen_records else self.head)[key] = self._value()
+                if self._expect(",}") == "}":
+                    break
+        if self._peek():
+            raise ParseError("JSON parse error - лишние данные после объекта")
+        if not seen_records:
+            raise RecordsNotAList()
+
+    # Reads up to the opening bracket of "records"; RecordsNotAList when the
+    # key is missing or holds anything but an array.
+    def open(self):
+        next(self._walker)
+        return self
+
+    def __iter__(self):
+        return self._walker
+
+
+class JSONRecordStreamParser(BaseParser):
+    media_type = "application/json"
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get("encoding", settings.DEFAULT_CHARSET)
+        return JSONRecordStream(stream, encoding)
@@ -0,0 +1,238 @@
+import threading
+from datetime import date, datetime, time
+from django.db import IntegrityError, connection, connections, transaction
+from django.utils import timezone
+from .cache import bump_days
+from .models import CallRecord
+
+# Partitions are named after their local (TIME_ZONE) month and cover
+# [first day 00:00, first day of next month 00:00) in that zone.
+PREFIX = f"{CallRecord._meta.db_table}_p"
+LOCK_TIMEOUT = "5s"
+
+_lock = threading.Lock()
+_state = {"partitioned": None, "months": set()}
+
+
+def _table():
+    return connection.ops.quote_name(CallRecord._meta.db_table)
+
+
+def month_of(day):
+    return date(day.year, day.month, 1)
+
+
+def next_month(month):
+    return date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def add_months(month, n):
+    index = month.year * 12 + month.month - 1 + n
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f"{PREFIX}{month:%Y_%m}"
+
+
+def month_bounds(month):
+    tz = timezone.get_current_timezone()
+    start = timezone.make_aware(datetime.combine(month, time.min), tz)
+    end = timezone.make_aware(datetime.combine(next_month(month), time.min), tz)
+    return start, end
+
+
+def is_partitioned(cursor=None):
+    if connection.vendor != "postgresql":
+        return False
+    if cursor is None:
+        with connection.cursor() as cursor:
+            return is_partitioned(cursor)
+    cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", [CallRecord._meta.db_table])
+    row = cursor.fetchone()
+    return bool(row) and row[0] == "p"
+
+
+def list_partitions(cursor=None):
+    if cursor is None:
+        with connection.cursor() as cursor:
+            return list_partitions(cursor)
+    cursor.execute(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = to_regclass(%s) ORDER BY c.relname",
+        [CallRecord._meta.db_table],
+    )
+    months = {}
+    for (name,) in cursor.fetchall():
+        if name.startswith(PREFIX):
+            try:
+                year, month = name[len(PREFIX):].split("_")
+                months[date(int(year), int(month), 1)] = name
+            except ValueError:
+                continue
+    return months
+
+
+# A new partition is created detached and then attached: ATTACH takes only
+# SHARE UPDATE EXCLUSIVE on the parent, which does not conflict with
+# in-flight inserts, so it can run while an ingest transaction is open.
+def create_partition(month, cursor):
+    name = connection.ops.quote_name(partition_name(month))
+    start, end = month_bounds(month)
+    cursor.execute(f"CREATE TABLE IF NOT EXISTS {name} (LIKE {_table()} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+    cursor.execute(
+        f"ALTER TABLE {_table()} ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)", [start, end]
+    )
+
+
+# Called by the writers before a batch goes in. Missing months are created
+# on a separate autocommit connection, so the ingest transaction never holds
+# DDL locks and the partition is visible to it right away.
+def ensure_partitions(days):
+    if connection.vendor != "postgresql" or not days:
+        return
+    months = {month_of(d) for d in days}
+    with _lock:
+        if _state["partitioned"] is None:
+            _state["partitioned"] = is_partitioned()
+        if not _state["partitioned"] or months <= _state["months"]:
+            return
+        _state["months"] = set(list_partitions())
+        missing = sorted(months - _state["months"])
+        if not missing:
+            return
+        side = connections.create_connection(connection.alias)
+        try:
+            with side.cursor() as cursor:
+                cursor.execute(f"SET lock_timeout = '{LOCK_TIMEOUT}'")
+                existing = set(list_partitions(cursor))
+                for month in missing:
+                    if month not in existing:
+                        create_partition(month, cursor)
+        finally:
+            side.close()
+        _state["months"].update(missing)
+
+
+# psycopg2 reports a row that fits no partition as a check violation.
+# copy_expert() is not wrapped by Django, so its errors arrive unwrapped.
+def _no_partition(error):
+    cause = error.__cause__ if isinstance(error, IntegrityError) else error
+    return getattr(cause, "pgcode", None) == "23514" and "no partition of relation" in str(cause)
+
+
+# Runs write() in a savepoint once the partitions for days exist. A month
+# that another process retired is still in this process's cache, so the
+# insert fails; the cache is then dropped, the partitions re-read (and the
+# month recreated) and write() run once more.
+def write_partitioned(days, write):
+    ensure_partitions(days)
+    try:
+        with transaction.atomic():
+            return write()
+    except Exception as e:
+        if not _no_partition(e):
+            raise
+    forget()
+    ensure_partitions(days)
+    with transaction.atomic():
+        return write()
+
+
+def forget():
+    with _lock:
+        _state["partitioned"] = None
+        _state["months"] = set()
+
+
+def ensure_ahead(months_ahead, today=None):
+    first = month_of(today or timezone.localdate())
+    existing = list_partitions()
+    created = []
+    with connection.cursor() as cursor:
+        for i in range(months_ahead + 1):
+            month = add_months(first, i)
+            if month not in existing:
+                create_partition(month, cursor)
+                created.append(month)
+    forget()
+    return created
+
+
+def _month_days(month):
+    day = month
+    end = next_month(month)
+    while day < end:
+        yield day
+        day = date.fromordinal(day.toordinal() + 1)
+
+
+# Detaching and dropping a month is a catalog change, not a DELETE. Rollups
+# are left alone, so daily statistics outlive the raw rows.
+def retire(before, drop=True, concurrently=False):
+    retired = []
+    for month, name in sorted(list_partitions().items()):
+        if month >= before:
+            break
+        qname = connection.ops.quote_name(name)
+        detach = f"ALTER TABLE {_table()} DETACH PARTITION {qname}" + (" CONCURRENTLY" if concurrently else "")
+        with connection.cursor() as cursor:
+            cursor.execute(detach)
+            if drop:
+                cursor.execute(f"DROP TABLE {qname}")
+        bump_days(list(_month_days(month)))
+        retired.append(name)
+    forget()
+    return retired
+
+
+# One-off conversion of a plain web_callrecord into a partitioned one. Runs
+# in a single transaction holding an exclusive lock on the table, so
+# ingestion must be stopped for the duration; rows are copied month by
+# month and the indexes are built once the data is in.
+def convert(months_ahead=3, log=None):
+    log = log or (lambda msg: None)
+    qn = connection.ops.quote_name
+    table = CallRecord._meta.db_table
+    legacy = f"{table}_legacy"
+    seq = f"{table}_id_part_seq"
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"LOCK TABLE {qn(table)} IN ACCESS EXCLUSIVE MODE")
+        if is_partitioned(cursor):
+            log("Таблица уже секционирована")
+            return False
+        cursor.execute(f"ALTER TABLE {qn(table)} RENAME TO {qn(legacy)}")
+        cursor.execute(
+            f"CREATE TABLE {qn(table)} (LIKE {qn(legacy)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS) "
+            f"PARTITION BY RANGE ({qn('calldate')})"
+        )
+        cursor.execute(f"SELECT min(calldate), max(calldate), coalesce(max(id), 0) FROM {qn(legacy)}")
+        first, last, max_id = cursor.fetchone()
+        cursor.execute(f"CREATE SEQUENCE {qn(seq)} OWNED BY {qn(table)}.{qn('id')}")
+        cursor.execute(f"ALTER TABLE {qn(table)} ALTER COLUMN {qn('id')} SET DEFAULT nextval('{seq}')")
+        if max_id:
+            cursor.execute("SELECT setval(%s, %s)", [seq, max_id])
+
+        today = month_of(timezone.localdate())
+        month = month_of(timezone.localdate(first)) if first else today
+        end = max(month_of(timezone.localdate(last)) if last else today, add_months(today, months_ahead))
+        while month <= end:
+            create_partition(month, cursor)
+            start, stop = month_bounds(month)
+            cursor.execute(
+                f"INSERT INTO {qn(table)} SELECT * FROM {qn(legacy)} WHERE calldate >= %s AND calldate < %s",
+                [start, stop],
+            )
+            if cursor.rowcount:
+                log(f"{partition_name(month)}: {cursor.rowcount}")
+            month = next_month(month)
+        cursor.execute(f"DROP TABLE {qn(legacy)}")
+
+        cursor.execute(f"ALTER TABLE {qn(table)} ADD PRIMARY KEY ({qn('id')}, {qn('calldate')})")
+        with connection.schema_editor(atomic=False) as editor:
+            for constraint in CallRecord._meta.constraints:
+                editor.add_constraint(CallRecord, constraint)
+            for index in CallRecord._meta.indexes:
+                editor.add_index(CallRecord, index)
+    forget()
+    return True
@@ -0,0 +1,157 @@
+import json
+import os
+import re
+import time
+import uuid
+from django.conf import settings
+
+# At most this many rejected lines are returned in full; the rest are only
+# counted in error_groups (and written to the report, if one was asked for).
+MAX_ERRORS = getattr(settings, "CALLS_INGEST_MAX_ERRORS", 1000)
+REPORT_DIR = getattr(settings, "CALLS_INGEST_REPORT_DIR", os.path.join(settings.BASE_DIR, "reports"))
+REPORT_TTL = getattr(settings, "CALLS_INGEST_REPORT_TTL", 7 * 24 * 3600)
+
+REPORT_ID = re.compile(r"^[0-9a-f]{32}$")
+
+
+def report_path(owner, report_id):
+    return os.path.join(REPORT_DIR, str(owner), f"{report_id}.ndjson")
+
+
+def find_report(report_id, owner=None):
+    if not REPORT_ID.match(report_id):
+        return None
+    if owner is not None:
+        path = report_path(owner, report_id)
+        return path if os.path.isfile(path) else None
+    try:
+        owners = os.listdir(REPORT_DIR)
+    except OSError:
+        return None
+    for name in owners:
+        path = report_path(name, report_id)
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+# Reports (and .part files left by crashed requests) older than the TTL.
+def prune_reports(now=None):
+    cutoff = (now or time.time()) - REPORT_TTL
+    try:
+        owners = list(os.scandir(REPORT_DIR))
+    except OSError:
+        return
+    for owner in owners:
+        if not owner.is_dir():
+            continue
+        for entry in os.scandir(owner.path):
+            try:
+                if entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+            except OSError:
+                pass
+
+
+# Every rejected line as {"line", "errors", "record"}, one JSON object per
+# line, written while the upload is read. The file is opened on the first
+# reject and only gets its final name in close(), so a half-written report
+# is never served.
+class ErrorReport:
+    def __init__(self, owner):
+        self.id = uuid.uuid4().hex
+        self.path = report_path(owner, self.id)
+        self._fh = None
+
+    def _open(self):
+        prune_reports()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._fh = open(self.path + ".part", "w", encoding="utf-8")
+
+    def write(self, line, msgs, record):
+        if self._fh is None:
+            self._open()
+        self._fh.write(json.dumps({"line": line, "errors": msgs, "record": record}, ensure_ascii=False, default=str))
+        self._fh.write("\n")
+
+    def close(self):
+        if self._fh is None:
+            self._open()
+        self._fh.close()
+        os.replace(self.path + ".part", self.path)
+
+    def discard(self):
+        if self._fh is None:
+            return
+        self._fh.close()
+        try:
+            os.remove(self.path + ".part")
+        except OSError:
+            pass
+
+
+# Collects the rejects of one upload with bounded memory: the first
+# max_errors lines in full plus a count per distinct message. Without
+# accept_valid the upload is rejected anyway, so once the cap is passed
+# there is nothing left to learn and the caller stops reading (unless a
+# full report was asked for).
+class Rejects:
+    def __init__(self, max_errors=MAX_ERRORS, accept_valid=False, report=None):
+        self.max_errors = max_errors
+        self.accept_valid = accept_valid
+        self.report = report
+        self.errors = []
+        self.groups = {}
+        self.count = 0
+        self.aborted = False
+
+    def add(self, errors, records=None, lines=None):
+        if self.report is not None and records is not None:
+            index = {line: i for i, line in enumerate(lines)}
+        for line, msgs in errors:
+            self.count += 1
+            if len(self.errors) < self.max_errors:
+                self.errors.append({"line": line, "errors": msgs})
+            for msg in msgs:
+                group = self.groups.get(msg)
+                if group is None:
+                    self.groups[msg] = [1, line]
+                else:
+                    group[0] += 1
+            if self.report is not None:
+                self.report.write(line, msgs, records[index[line]] if records is not None else None)
+
+    # Folds in the rejects collected in another process (without a report),
+    # keeping the cap on the lines returned in full.
+    def merge(self, other):
+        self.count += other.count
+        self.aborted = self.aborted or other.aborted
+        self.errors.extend(other.errors[: max(self.max_errors - len(self.errors), 0)])
+        for msg, (n, first) in other.groups.items():
+            group = self.groups.get(msg)
+            if group is None:
+                self.groups[msg] = [n, first]
+            else:
+                group[0] += n
+                group[1] = min(group[1], first)
+
+    @property
+    def should_abort(self):
+        return self.count > self.max_errors and not self.accept_valid and self.report is None
+
+    @property
+    def failed(self):
+        return self.aborted or bool(self.count and not self.accept_valid)
+
+    def data(self, report_url=None):
+        groups = sorted(self.groups.items(), key=lambda item: (-item[1][0], item[1][1]))
+        data = {
+            "errors": self.errors,
+            "error_groups": [{"error": msg, "lines": n, "first_line": first} for msg, (n, first) in groups],
+            "rejected": self.count,
+            "truncated": self.count > len(self.errors),
+            "aborted": self.aborted,
+        }
+        if self.report is not None and report_url is not None:
+            data["report"] = report_url
+        return data
@@ -0,0 +1,100 @@
+from datetime import datetime
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from import_export import exceptions, resources
+from import_export.results import RowResult
+from .models import CallRecord
+from .validation import FIELDS, RecordValidator
+from .writers import BATCH_SIZE, get_writer
+
+# Previews of files up to this many rows list every row; bigger files only
+# show the totals and the rejected rows.
+DIFF_ROWS = getattr(settings, "CALLS_IMPORT_DIFF_ROWS", 200)
+
+
+def _cell(value):
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.isoformat(sep=" ")
+    return str(value).strip()
+
+
+# Admin import for call records. The dataset is validated column-wise by
+# RecordValidator and written through the ingest writers in batches, so it
+# normalizes exactly like the API and never loads or diffs instances. A dry
+# run (the admin preview) only validates and touches no tables. Like the
+# API, an import with any rejected row keeps nothing.
+class CallRecordResource(resources.ModelResource):
+    dedup = False
+
+    class Meta:
+        model = CallRecord
+        fields = FIELDS
+        export_order = FIELDS
+        batch_size = BATCH_SIZE
+
+    def get_diff_headers(self):
+        return list(FIELDS)
+
+    def _columns(self, dataset):
+        headers = [(h or "").strip().lower() for h in dataset.headers or ()]
+        missing = [f for f in FIELDS if f not in headers]
+        if missing:
+            raise ValueError(f"Отсутствует столбец: {missing[0]}")
+        return {f: [_cell(v) for v in dataset.get_col(headers.index(f))] for f in FIELDS}
+
+    def import_data_inner(self, dataset, dry_run, raise_errors, using_transactions, collect_failed_rows, **kwargs):
+        result = self.get_result_class()()
+        result.diff_headers = self.get_diff_headers()
+        try:
+            self.before_import(dataset, **kwargs)
+            columns = self._columns(dataset)
+        except Exception as e:
+            self.handle_import_error(result, e, raise_errors)
+            return result
+        result.total_rows = total = len(dataset)
+        if collect_failed_rows:
+            result.add_dataset_headers(dataset.headers)
+
+        validator = RecordValidator()
+        writer = None if dry_run else get_writer(dedup=self.dedup)
+        batch_size = self._meta.batch_size or BATCH_SIZE
+        created = 0
+        with transaction.atomic():
+            for start in range(0, total, batch_size):
+                lines = list(range(start + 1, min(start + batch_size, total) + 1))
+                batch = {f: col[start:start + batch_size] for f, col in columns.items()}
+                checked = validator.validate_columns(batch, lines)
+                for line, msgs in checked.errors:
+                    row = dict(zip(FIELDS, (columns[f][line - 1] for f in FIELDS)))
+                    error = ValidationError(msgs)
+                    result.append_invalid_row(line, row, error)
+                    result.totals[RowResult.IMPORT_TYPE_INVALID] += 1
+                    if collect_failed_rows:
+                        result.append_failed_row(row, error)
+                if total <= DIFF_ROWS:
+                    for values in checked.rows():
+                        row_result = RowResult()
+                        row_result.import_type = RowResult.IMPORT_TYPE_NEW
+                        row_result.diff = [_cell(v) for v in values[: len(FIELDS)]]
+                        result.append_row_result(row_result)
+                if writer is not None and not result.invalid_rows:
+                    created += writer.write(checked.rows())
+            if result.invalid_rows:
+                transaction.set_rollback(True)
+            elif writer is None:
+                result.totals[RowResult.IMPORT_TYPE_NEW] = total
+            else:
+                result.totals[RowResult.IMPORT_TYPE_NEW] = created
+                result.totals[RowResult.IMPORT_TYPE_SKIP] = writer.duplicates
+        if raise_errors and result.invalid_rows:
+            invalid = result.invalid_rows[0]
+            raise exceptions.ImportError(invalid.error, number=invalid.number)
+
+        try:
+            self.after_import(dataset, result, **kwargs)
+        except Exception as e:
+            self.handle_import_error(result, e, raise_errors)
+        return result
@@ -0,0 +1,186 @@
+from datetime import datetime, time, timedelta
+from functools import partial
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from .cache import bump_days
+from .models import CallRecord, DailyCallStat, DailyDstStat, DailySrcStat
+
+ENABLED = getattr(settings, "CALLS_ROLLUPS", True)
+UPSERT_BATCH = 1000
+
+COUNTERS = ("calls", "answered", "duration", "billsec")
+
+
+def _upsert_sql(model, keys, rows):
+    qn = connection.ops.quote_name
+    table = qn(model._meta.db_table)
+    cols = [qn(model._meta.get_field(f).column) for f in keys + COUNTERS]
+    values = ", ".join(["(" + ", ".join(["%s"] * len(cols)) + ")"] * rows)
+    updates = ", ".join(f"{c} = {table}.{c} + EXCLUDED.{c}" for c in cols[len(keys):])
+    conflict = ", ".join(cols[: len(keys)])
+    return f"INSERT INTO {table} ({', '.join(cols)}) VALUES {values} ON CONFLICT ({conflict}) DO UPDATE SET {updates}"
+
+
+# Counter increments for the three rollup tables, accumulated from rows in
+# ROW_FIELDS order. A delta is built next to the insert it describes (in a
+# pool process for parallel ingest) and applied in the insert's transaction.
+class RollupDelta:
+    __slots__ = ("days", "srcs", "dsts")
+
+    def __init__(self):
+        self.days = {}
+        self.srcs = {}
+        self.dsts = {}
+
+    @classmethod
+    def from_rows(cls, rows, tz=None):
+        delta = cls()
+        delta.add_rows(rows, tz)
+        return delta
+
+    def __bool__(self):
+        return bool(self.days)
+
+    def add_rows(self, rows, tz=None):
+        tz = tz or timezone.get_current_timezone()
+        days, srcs, dsts = self.days, self.srcs, self.dsts
+        for calldate, src, dst, duration, billsec, _disposition, answered in rows:
+            day = calldate.astimezone(tz).date()
+            hit = 1 if answered else 0
+            for table, key in ((days, day), (srcs, (day, src)), (dsts, (day, dst))):
+                c = table.get(key)
+                if c is None:
+                    table[key] = [1, hit, duration, billsec]
+                else:
+                    c[0] += 1
+                    c[1] += hit
+                    c[2] += duration
+                    c[3] += billsec
+        return self
+
+    def merge(self, other):
+        for mine, theirs in ((self.days, other.days), (self.srcs, other.srcs), (self.dsts, other.dsts)):
+            for key, inc in theirs.items():
+                c = mine.get(key)
+                if c is None:
+                    mine[key] = list(inc)
+                else:
+                    for i in range(4):
+                        c[i] += inc[i]
+        return self
+
+    def negate(self):
+        for table in (self.days, self.srcs, self.dsts):
+            for c in table.values():
+                for i in range(4):
+                    c[i] = -c[i]
+        return self
+
+    # Keys are applied in sorted order so concurrent batches lock rollup rows
+    # in the same order and cannot deadlock each other. Rows whose count drops
+    # to zero after a delete are removed, so a rebuild gives the same tables.
+    # Once the transaction commits, the cache generations of the touched
+    # days are bumped (also when the tables themselves are turned off).
+    def apply(self):
+        if not self:
+            return
+        transaction.on_commit(partial(bump_days, sorted(self.days)))
+        if not ENABLED:
+            return
+        shrunk = sorted(day for day, c in self.days.items() if c[0] < 0)
+        with transaction.atomic(), connection.cursor() as cursor:
+            for model, keys, table in (
+                (DailyCallStat, ("day",), {(k,): v for k, v in self.days.items()}),
+                (DailySrcStat, ("day", "src"), self.srcs),
+                (DailyDstStat, ("day", "dst"), self.dsts),
+            ):
+                items = sorted(table.items())
+                for i in range(0, len(items), UPSERT_BATCH):
+                    chunk = items[i:i + UPSERT_BATCH]
+                    params = [p for key, inc in chunk for p in (*key, *inc)]
+                    cursor.execute(_upsert_sql(model, keys, len(chunk)), params)
+            if shrunk:
+                for model in (DailyCallStat, DailySrcStat, DailyDstStat):
+                    model.objects.filter(day__in=shrunk, calls__lte=0).delete()
+
+
+def apply_rows(rows):
+    if rows:
+        RollupDelta.from_rows(rows).apply()
+
+
+def day_bounds(day, tz=None):
+    tz = tz or timezone.get_current_timezone()
+    start = timezone.make_aware(datetime.combine(day, time.min), tz)
+    end = timezone.make_aware(datetime.combine(day + timedelta(days=1), time.min), tz)
+    return start, end
+
+
+def _aggregate(queryset, *keys):
+    rows = (
+        queryset.annotate(day=TruncDate("calldate"))
+        .values("day", *keys)
+        .order_by()
+        .annotate(
+            n_calls=Count("id"),
+            n_answered=Count("id", filter=Q(answered=True)),
+            n_duration=Sum("duration"),
+            n_billsec=Sum("billsec"),
+        )
+    )
+    for row in rows:
+        yield {**{k: row[k] for k in ("day", *keys)}, **{f: row[f"n_{f}"] or 0 for f in COUNTERS}}
+
+
+# Recomputes one local day from CallRecord, replacing whatever the rollup
+# tables hold for it.
+def rebuild_day(day):
+    start, end = day_bounds(day)
+    records = CallRecord.objects.filter(calldate__gte=start, calldate__lt=end)
+    with transaction.atomic():
+        transaction.on_commit(partial(bump_days, [day]))
+        for model, keys in ((DailyCallStat, ()), (DailySrcStat, ("src",)), (DailyDstStat, ("dst",))):
+            model.objects.filter(day=day).delete()
+            model.objects.bulk_create(
+                [model(**row) for row in _aggregate(records, *keys)], batch_size=UPSERT_BATCH
+            )
+
+
+GROUPS = ("day", "src", "dst")
+
+
+def _with_rate(row):
+    calls = row["calls"] or 0
+    row["answered_rate"] = round(row["answered"] / calls, 4) if calls else 0.0
+    return row
+
+
+# Answers dashboard questions from the rollup tables only. ``group`` is the
+# result key: per day (optionally for a single src or dst) or per number
+# over the whole range, busiest first.
+def query_stats(day_from, day_to, group="day", src=None, dst=None, limit=100):
+    if group == "src" or (group == "day" and src):
+        qs = DailySrcStat.objects.all()
+    elif group == "dst" or (group == "day" and dst):
+        qs = DailyDstStat.objects.all()
+    else:
+        qs = DailyCallStat.objects.all()
+    qs = qs.filter(day__gte=day_from, day__lte=day_to)
+    if src and qs.model is DailySrcStat:
+        qs = qs.filter(src=src)
+    if dst and qs.model is DailyDstStat:
+        qs = qs.filter(dst=dst)
+    sums = {f"n_{f}": Sum(f) for f in COUNTERS}
+    totals = qs.aggregate(**sums)
+    totals = _with_rate({f: totals[f"n_{f}"] or 0 for f in COUNTERS})
+    if group == "day":
+        rows = [dict(r) for r in qs.values("day", *COUNTERS).order_by("day")]
+    else:
+        rows = [
+            {group: r[group], **{f: r[f"n_{f}"] for f in COUNTERS}}
+            for r in qs.values(group).annotate(**sums).order_by("-n_calls", group)[:limit]
+        ]
+    return [_with_rate(r) for r in rows], totals
@@ -4,5 +4,5 @@ from .models import CallRecord
 class CallRecordSerializer(serializers.ModelSerializer):
     class Meta:
         model = CallRecord
-        fields = ["id", "calldate", "src", "dst", "duration", "billsec"]
-        read_only_fields = ["id"]
\ No newline at end of file
+        fields = ["id", "calldate", "src", "dst", "duration", "billsec", "disposition", "answered"]
+        read_only_fields = ["id"]
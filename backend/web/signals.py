@@ -0,0 +1,42 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+from . import rollups
+from .models import CallRecord
+from .partitions import ensure_partitions
+
+ROLLUP_FIELDS = ("calldate", "src", "dst", "duration", "billsec", "disposition", "answered")
+
+
+def _row(obj):
+    return tuple(getattr(obj, f) for f in ROLLUP_FIELDS)
+
+
+# Writers update rollups (and cache generations) for their batches
+# themselves, bulk inserts send no signals; these receivers cover
+# single-object saves and deletes such as the admin form and row-by-row
+# admin import.
+@receiver(pre_save, sender=CallRecord)
+def remember_rollup_row(sender, instance, raw=False, **kwargs):
+    instance._rollup_old = None
+    if instance.calldate is not None:
+        ensure_partitions([timezone.localdate(instance.calldate)])
+    if not raw and instance.pk is not None:
+        old = CallRecord.objects.filter(pk=instance.pk).values_list(*ROLLUP_FIELDS).first()
+        instance._rollup_old = old
+
+
+@receiver(post_save, sender=CallRecord)
+def update_rollups_on_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    delta = rollups.RollupDelta.from_rows([_row(instance)])
+    old = getattr(instance, "_rollup_old", None)
+    if old is not None:
+        delta.merge(rollups.RollupDelta.from_rows([old]).negate())
+    delta.apply()
+
+
+@receiver(post_delete, sender=CallRecord)
+def update_rollups_on_delete(sender, instance, **kwargs):
+    rollups.RollupDelta.from_rows([_row(instance)]).negate().apply()
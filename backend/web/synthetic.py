@@ -0,0 +1,68 @@
+import random
+from datetime import datetime, timedelta
+from itertools import accumulate
+
+# Seeded CDR records shaped like a call-centre export, as clients send them
+# to POST /api/calls/bulk_create/: chronological local calldate strings, numbers as
+# strings, durations as integers. The same seed, size and start always give
+# the same records, so benchmark runs are comparable.
+
+# Mobile operator and Tashkent landline prefixes, roughly by market share.
+PREFIXES = (
+    ("99890", 18), ("99891", 8), ("99893", 14), ("99894", 8), ("99897", 16),
+    ("99888", 10), ("99899", 6), ("99895", 5), ("99833", 7), ("99871", 8),
+)
+DISPOSITIONS = (("ANSWERED", 62), ("NO ANSWER", 24), ("BUSY", 9), ("FAILED", 5))
+# Share of calls per local hour: quiet nights, a morning and an afternoon peak.
+HOURS = (1, 1, 1, 1, 1, 2, 4, 8, 14, 18, 19, 17, 12, 15, 18, 17, 15, 12, 9, 7, 5, 4, 3, 2)
+START = datetime(2026, 1, 1)
+
+
+def _bad(rec, rnd):
+    kind = rnd.randrange(6)
+    if kind == 0:
+        rec["src"] = ""
+    elif kind == 1:
+        # Day-first dates from a spreadsheet export.
+        d = rec["calldate"]
+        rec["calldate"] = f"{d[8:10]}.{d[5:7]}.{d[:4]}{d[10:]}"
+    elif kind == 2:
+        rec["duration"] = -rec["duration"] - 1
+    elif kind == 3:
+        rec["billsec"] = f"{rec['billsec']}s"
+    elif kind == 4:
+        rec["disposition"] = ""
+    else:
+        rec["dst"] = rec["dst"] * 20
+
+
+# Callers follow a Zipf-like popularity over a pool of n/20 subscribers (a
+# few numbers call very often); 80% of calls go to an internal extension.
+def synthetic_cdr(n, seed=0, bad_rate=0.0, days=30, start=START):
+    rnd = random.Random(seed)
+    prefixes = rnd.choices([p for p, _w in PREFIXES], [w for _p, w in PREFIXES], k=max(100, n // 20))
+    pool = [f"{p}{rnd.randrange(10**6, 10**7)}" for p in prefixes]
+    popularity = list(accumulate(1 / (k + 1) for k in range(len(pool))))
+    callers = rnd.choices(pool, cum_weights=popularity, k=n)
+    dispositions = rnd.choices([d for d, _w in DISPOSITIONS], [w for _d, w in DISPOSITIONS], k=n)
+    hours = rnd.choices(range(24), HOURS, k=n)
+    offsets = sorted(rnd.randrange(days) * 86400 + h * 3600 + rnd.randrange(3600) for h in hours)
+
+    records = []
+    for i in range(n):
+        ring = rnd.randrange(3, 31)
+        answered = dispositions[i] == "ANSWERED"
+        billsec = min(int(rnd.lognormvariate(4.2, 1.1)), 3600) if answered else 0
+        dst = str(rnd.randrange(100, 1000)) if rnd.random() < 0.8 else rnd.choice(pool)
+        rec = {
+            "calldate": (start + timedelta(seconds=offsets[i])).strftime("%Y-%m-%d %H:%M:%S"),
+            "src": callers[i],
+            "dst": dst,
+            "duration": billsec + ring,
+            "billsec": billsec,
+            "disposition": dispositions[i],
+        }
+        if bad_rate and rnd.random() < bad_rate:
+            _bad(rec, rnd)
+        records.append(rec)
+    return records
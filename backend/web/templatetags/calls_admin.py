@@ -0,0 +1,80 @@
+from datetime import date
+from django import template
+from django.contrib.admin.templatetags.admin_list import date_hierarchy
+from django.db.models import Max, Min
+from django.utils import formats
+from django.utils.text import capfirst
+from django.utils.translation import gettext as _
+from web import rollups
+from web.models import DailyCallStat
+
+register = template.Library()
+
+
+# Same drill-down as the admin's date_hierarchy, but the years, months and
+# days on offer come from DailyCallStat instead of DISTINCT date_trunc()
+# over the changelist. Links ignore the other filters, as the rollups do.
+@register.inclusion_tag("admin/date_hierarchy.html")
+def calls_date_hierarchy(cl):
+    if not rollups.ENABLED:
+        return date_hierarchy(cl)
+    field = cl.date_hierarchy
+    year_field, month_field, day_field = f"{field}__year", f"{field}__month", f"{field}__day"
+    year = cl.params.get(year_field)
+    month = cl.params.get(month_field)
+    day = cl.params.get(day_field)
+    days = DailyCallStat.objects.filter(calls__gt=0)
+
+    def link(filters):
+        return cl.get_query_string(filters, [f"{field}__"])
+
+    if not (year or month or day):
+        bounds = days.aggregate(first=Min("day"), last=Max("day"))
+        if bounds["first"] and bounds["first"].year == bounds["last"].year:
+            year = bounds["first"].year
+            if bounds["first"].month == bounds["last"].month:
+                month = bounds["first"].month
+
+    if year and month and day:
+        current = date(int(year), int(month), int(day))
+        return {
+            "show": True,
+            "back": {
+                "link": link({year_field: year, month_field: month}),
+                "title": capfirst(formats.date_format(current, "YEAR_MONTH_FORMAT")),
+            },
+            "choices": [{"title": capfirst(formats.date_format(current, "MONTH_DAY_FORMAT"))}],
+        }
+    if year and month:
+        choices = days.filter(day__year=year, day__month=month).order_by("day").values_list("day", flat=True)
+        return {
+            "show": True,
+            "back": {"link": link({year_field: year}), "title": str(year)},
+            "choices": [
+                {
+                    "link": link({year_field: year, month_field: month, day_field: d.day}),
+                    "title": capfirst(formats.date_format(d, "MONTH_DAY_FORMAT")),
+                }
+                for d in choices
+            ],
+        }
+    if year:
+        return {
+            "show": True,
+            "back": {"link": link({}), "title": _("All dates")},
+            "choices": [
+                {
+                    "link": link({year_field: year, month_field: m.month}),
+                    "title": capfirst(formats.date_format(m, "YEAR_MONTH_FORMAT")),
+                }
+                for m in days.filter(day__year=year).dates("day", "month")
+            ],
+        }
+    return {
+        "show": True,
+        "back": None,
+        "choices": [
+            {"link": link({year_field: str(y.year)}), "title": str(y.year)}
+            for y in days.dates("day", "year")
+        ],
+    }
@@ -1,3 +1,1440 @@
-from django.test import TestCase
+import csv
+import gzip
+import hashlib
+import io
+import json
+import os
+import tempfile
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from functools import partial
+from unittest import mock, skipUnless
+from zoneinfo import ZoneInfo
+import tablib
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
+from django.core.files.base import ContentFile
+from django.core.management import CommandError, call_command
+from django.core.cache import cache
+from django.db import connection, models, transaction
+from django.db.models import Q
+from django.http import QueryDict
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from parler.models import TranslatableModel, TranslatedFields
+from rest_framework.exceptions import ParseError
+from rest_framework.test import APIClient
+from common.optimized.image import ImageOptimizationMixin
+from common.resources.base import TranslatableResource
+from .management.commands.bench_webp import count_encodes, legacy_best_fit, synthetic_photo
+from .calldate import CalldateParser
+from .filters import CallRecordFilter
+from .ledger import DuplicateUpload, find_duplicate
+from .ingest import CsvRecordReader, ingest_records
+from .models import CallRecord, DailyCallStat, DailyDstStat, DailySrcStat, ImageJob, IngestJob, UploadLedger
+from .pagination import EstimatedCountPaginator, KeysetPagination
+from .parsers import JSONRecordStream, RecordsNotAList
+from . import cache as web_cache, images, jobs, metrics, parallel, partitions, rejects, uploads
+from .resources import CallRecordResource
+from .rollups import rebuild_day
+from .synthetic import synthetic_cdr
+from .validation import RecordValidator
+from .writers import WRITERS, BulkCreateWriter, get_writer
 
-# Create your tests here.
+T0 = datetime(2025, 1, 1, 10, 0, tzinfo=dt_timezone.utc)
+
+
+# Test-only models have no migration; their tables exist only while the
+# test class that lists them runs.
+class TemporaryModelsMixin:
+    temporary_models = ()
+
+    @classmethod
+    def setUpClass(cls):
+        with connection.schema_editor() as editor:
+            for model in cls.temporary_models:
+                editor.create_model(model)
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        with connection.schema_editor() as editor:
+            for model in reversed(cls.temporary_models):
+                editor.delete_model(model)
+
+
+def make_records(n, step=60, **kwargs):
+    rows = []
+    for i in range(n):
+        data = {
+            "calldate": T0 + timedelta(seconds=(i // 2) * step),
+            "src": f"10{i % 3}",
+            "dst": f"20{i % 4}",
+            "duration": 10,
+            "billsec": 5,
+            "disposition": CallRecord.ANSWERED if i % 2 else CallRecord.NO_ANSWER,
+            "answered": bool(i % 2),
+        }
+        data.update(kwargs)
+        rows.append(CallRecord(**data))
+    return CallRecord.objects.bulk_create(rows)
+
+
+class CallRecordListTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user("reader", password="x")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        make_records(9)
+
+    def walk(self, url):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids.extend(r["id"] for r in response.data["results"])
+            url = response.data["next"]
+        return ids
+
+    def test_pages_follow_calldate_then_id(self):
+        expected = list(CallRecord.objects.order_by("-calldate", "-id").values_list("id", flat=True))
+        self.assertEqual(self.walk("/api/calls/?limit=2"), expected)
+
+    def test_filters(self):
+        ids = self.walk("/api/calls/?limit=2&src=101&answered=true")
+        expected = CallRecord.objects.filter(src="101", answered=True).order_by("-calldate", "-id")
+        self.assertEqual(ids, list(expected.values_list("id", flat=True)))
+
+        ids = self.walk("/api/calls/?calldate_from=2025-01-01T10:01:00Z&calldate_to=2025-01-01T10:03:00Z")
+        self.assertEqual(len(ids), 4)
+
+    def test_bad_cursor(self):
+        self.assertEqual(self.client.get("/api/calls/?cursor=bogus").status_code, 404)
+
+
+class CallRecordExportTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user("reader", password="x")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        make_records(9)
+
+    def test_csv(self):
+        response = self.client.get("/api/calls/export/?src=101")
+        self.assertEqual(response["Content-Type"], "text/csv")
+        rows = list(csv.DictReader(io.StringIO(b"".join(response.streaming_content).decode())))
+        expected = CallRecord.objects.filter(src="101").order_by("-calldate", "-id")
+        self.assertEqual([int(r["id"]) for r in rows], list(expected.values_list("id", flat=True)))
+        self.assertEqual(datetime.fromisoformat(rows[0]["calldate"]), expected[0].calldate)
+
+    def test_ndjson_gzip(self):
+        response = self.client.get("/api/calls/export/?fmt=ndjson&gzip=1&answered=true")
+        self.assertEqual(response["Content-Type"], "application/gzip")
+        lines = gzip.decompress(b"".join(response.streaming_content)).decode().splitlines()
+        records = [json.loads(line) for line in lines]
+        self.assertEqual(len(records), CallRecord.objects.filter(answered=True).count())
+        self.assertTrue(all(r["answered"] for r in records))
+
+
+class RollupTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user("writer", password="x")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def snapshot(self):
+        return [
+            sorted(model.objects.values_list(*keys, "calls", "answered", "duration", "billsec"))
+            for model, keys in ((DailyCallStat, ("day",)), (DailySrcStat, ("day", "src")), (DailyDstStat, ("day", "dst")))
+        ]
+
+    def test_incremental_matches_rebuild(self):
+        records = [
+            {"calldate": "2025-01-01 23:59:00", "src": "100", "dst": "200", "duration": 5, "billsec": 3, "disposition": "ANSWERED"},
+            {"calldate": "2025-01-02 00:01:00", "src": "100", "dst": "201", "duration": 7, "billsec": 0, "disposition": "NO ANSWER"},
+            {"calldate": "2025-01-02 09:00:00", "src": "101", "dst": "200", "duration": 9, "billsec": 4, "disposition": "ANSWERED"},
+        ]
+        self.client.post("/api/calls/bulk_create/", {"records": records}, format="json")
+        csv_body = "calldate,src,dst,duration,billsec,disposition\n2025-01-02 10:00:00,101,202,1,1,ANSWERED\n"
+        self.client.post("/api/calls/ingest_csv/", data=csv_body.encode(), content_type="text/csv")
+        obj = CallRecord.objects.get(dst="201")
+        obj.calldate = T0
+        obj.save()
+        CallRecord.objects.filter(dst="202").delete()
+        incremental = self.snapshot()
+
+        for day in DailyCallStat.objects.values_list("day", flat=True):
+            rebuild_day(day)
+        self.assertEqual(self.snapshot(), incremental)
+
+        response = self.client.get("/api/calls/stats/?day_from=2025-01-01&day_to=2025-01-02&group=src")
+        self.assertEqual(response.data["totals"]["calls"], 3)
+        self.assertEqual(response.data["results"][0]["src"], "100")
+        response = self.client.get("/api/calls/stats/?day_from=2025-01-01&day_to=2025-01-02&group=src&src=100")
+        self.assertEqual(response.data["totals"]["calls"], 2)
+
+    def test_src_and_dst_filters_do_not_mix(self):
+        for query in ("group=src&dst=200", "group=dst&src=100", "src=100&dst=200"):
+            with self.subTest(query=query):
+                self.assertEqual(self.client.get(f"/api/calls/stats/?{query}").status_code, 400)
+        self.assertEqual(self.client.get("/api/calls/stats/?group=dst&dst=200").status_code, 200)
+
+
+@mock.patch("web.cache.STALE_SECONDS", 0)
+class ResponseCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.enterContext(mock.patch("web.cache.ENABLED", True))
+        self.enterContext(mock.patch("web.cache.CLOCK_SKEW_NS", 0))
+        self.user = get_user_model().objects.create_user("reader", password="x")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def ingest(self, calldate):
+        record = {"calldate": calldate, "src": "100", "dst": "200", "duration": 5, "billsec": 3, "disposition": "ANSWERED"}
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post("/api/calls/bulk_create/", {"records": [record]}, format="json")
+
+    def calls(self, url):
+        return self.client.get(url).data["totals"]["calls"]
+
+    def test_only_touched_days_are_invalidated(self):
+        self.ingest("2025-01-01 10:00:00")
+        self.ingest("2025-02-01 10:00:00")
+        january = "/api/calls/stats/?day_from=2025-01-01&day_to=2025-01-31"
+        february = "/api/calls/stats/?day_to=2025-02-28&day_from=2025-02-01"
+        self.assertEqual((self.calls(january), self.calls(february)), (1, 1))
+
+        self.ingest("2025-02-02 10:00:00")
+        with self.assertNumQueries(0):
+            self.assertEqual(self.calls("/api/calls/stats/?day_to=2025-01-31&day_from=2025-01-01"), 1)
+        self.assertEqual(self.calls(february), 2)
+
+    # Without day_to the window ends today; the next day is a new key.
+    def test_default_window_follows_the_date(self):
+        self.ingest("2025-01-01 10:00:00")
+        with mock.patch("django.utils.timezone.localdate", return_value=date(2025, 1, 30)):
+            self.assertEqual(self.calls("/api/calls/stats/"), 1)
+        with mock.patch("django.utils.timezone.localdate", return_value=date(2025, 1, 31)):
+            self.assertEqual(self.calls("/api/calls/stats/"), 0)
+
+    def test_list_pages_follow_writes(self):
+        self.ingest("2025-01-01 10:00:00")
+        self.assertEqual(len(self.client.get("/api/calls/").data["results"]), 1)
+        self.ingest("2025-01-05 10:00:00")
+        self.assertEqual(len(self.client.get("/api/calls/").data["results"]), 2)
+
+    def test_write_during_query_blocks_only_its_days(self):
+        january = web_cache.span_keys(date(2025, 1, 1), date(2025, 1, 1))
+        computed = []
+
+        def query(written):
+            def compute():
+                computed.append(written)
+                web_cache.bump_days([written])
+                return len(computed), january
+            return compute
+
+        self.assertEqual(web_cache.cached("t", QueryDict("a=1"), query(date(2025, 2, 1))), 1)
+        self.assertEqual(web_cache.cached("t", QueryDict("a=1"), query(date(2025, 2, 1))), 1)
+        self.assertEqual(web_cache.cached("t", QueryDict("a=2"), query(date(2025, 1, 1))), 2)
+        self.assertEqual(web_cache.cached("t", QueryDict("a=2"), query(date(2025, 2, 1))), 3)
+
+    def test_stale_entry_is_served_while_refreshing(self):
+        url = "/api/calls/stats/?day_from=2025-01-01&day_to=2025-01-31"
+        self.ingest("2025-01-01 10:00:00")
+        self.assertEqual(self.calls(url), 1)
+        self.ingest("2025-01-02 10:00:00")
+        with mock.patch("web.cache.STALE_SECONDS", 30), mock.patch("web.cache.threading.Thread") as thread:
+            self.assertEqual(self.calls(url), 1)
+            self.assertEqual(self.calls(url), 1)
+        thread.assert_called_once()
+
+
+class CallRecordAdminTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        user = get_user_model().objects.create_superuser("admin", password="x")
+        self.client.force_login(user)
+        make_records(6)
+        make_records(2, src="5551234", calldate=T0 + timedelta(days=40))
+        for day in {r.calldate.date() for r in CallRecord.objects.all()}:
+            rebuild_day(day)
+
+    def changelist(self, **params):
+        response = self.client.get("/admin/web/callrecord/", params)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_search(self):
+        self.assertEqual(self.changelist(q="555").context["cl"].result_count, 2)
+        self.assertEqual(self.changelist(q="=555").context["cl"].result_count, 0)
+        self.assertEqual(self.changelist(q="no answer").context["cl"].result_count, 4)
+
+    def test_edit_into_stored_duplicate(self):
+        WRITERS["bulk_create"](dedup=True).write(
+            [(T0, src, "200", 5, 3, CallRecord.ANSWERED, True) for src in ("900", "901")]
+        )
+        record = CallRecord.objects.get(src="901")
+        data = {
+            "calldate_0": "2025-01-01", "calldate_1": "15:00:00", "src": "900", "dst": "200", "duration": 5,
+            "billsec": 3, "disposition": CallRecord.ANSWERED, "answered": "on",
+        }
+        response = self.client.post(f"/admin/web/callrecord/{record.pk}/change/", data)
+        self.assertContains(response, "Такой звонок уже загружен")
+        data["src"] = "902"
+        self.assertEqual(self.client.post(f"/admin/web/callrecord/{record.pk}/change/", data).status_code, 302)
+        record.refresh_from_db()
+        self.assertEqual(record.fingerprint, record._own_fingerprint())
+
+    def test_date_hierarchy_from_rollups(self):
+        response = self.changelist()
+        self.assertContains(response, "calldate__month=2&amp;calldate__year=2025")
+        response = self.changelist(calldate__year=2025, calldate__month=2)
+        self.assertEqual(response.context["cl"].result_count, 2)
+
+    def test_facets_cached(self):
+        self.enterContext(mock.patch("web.cache.ENABLED", True))
+        self.enterContext(mock.patch("web.cache.CLOCK_SKEW_NS", 0))
+        self.assertContains(self.changelist(_facets="True"), "(4)")
+        with mock.patch.object(admin.ChoicesFieldListFilter, "get_facet_queryset", side_effect=AssertionError):
+            self.assertContains(self.changelist(_facets="True"), "(4)")
+
+    @skipUnless(connection.vendor == "postgresql", "Estimates need PostgreSQL")
+    def test_estimated_count(self):
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE web_callrecord")
+        with mock.patch("web.pagination.EXACT_COUNT_LIMIT", 3):
+            self.assertEqual(EstimatedCountPaginator(CallRecord.objects.all(), 10).count, 8)
+            self.assertEqual(EstimatedCountPaginator(CallRecord.objects.filter(src="5551234"), 10).count, 2)
+
+
+class CallRecordResourceTests(TestCase):
+    def dataset(self, n, bad=()):
+        data = tablib.Dataset(headers=["calldate", "src", "dst", "duration", "billsec", "disposition"])
+        for i in range(n):
+            data.append(["" if i in bad else f"2025-01-01 10:{i % 60:02d}:00", "101", "202", "10", "5", " answered "])
+        return data
+
+    def import_queries(self, n, dry_run=False):
+        with CaptureQueriesContext(connection) as ctx:
+            result = CallRecordResource().import_data(self.dataset(n), dry_run=dry_run)
+        self.assertFalse(result.has_errors() or result.has_validation_errors())
+        return len(ctx.captured_queries)
+
+    def test_normalizes_like_api(self):
+        result = CallRecordResource().import_data(self.dataset(3))
+        self.assertEqual(result.totals["new"], 3)
+        self.assertEqual(set(CallRecord.objects.values_list("disposition", "answered")), {(CallRecord.ANSWERED, True)})
+
+    # SQLite caps a statement at 999 parameters, so the write sizes stay
+    # within one INSERT there; PostgreSQL sends a whole writer batch at once.
+    def test_query_count_does_not_grow_with_rows(self):
+        self.assertEqual(self.import_queries(10, dry_run=True), self.import_queries(1000, dry_run=True))
+        self.assertEqual(self.import_queries(10), self.import_queries(90))
+
+    def test_preview_writes_nothing_and_reports_invalid_rows(self):
+        result = CallRecordResource().import_data(self.dataset(5, bad={1, 3}), dry_run=True)
+        self.assertEqual([r.number for r in result.invalid_rows], [2, 4])
+        self.assertEqual(len(result.rows), 3)
+        result = CallRecordResource().import_data(self.dataset(5, bad={1}))
+        self.assertTrue(result.has_validation_errors())
+        self.assertFalse(CallRecord.objects.exists())
+
+
+class JSONRecordStreamTests(SimpleTestCase):
+    def stream(self, body, chunk_size=5):
+        return JSONRecordStream(io.BytesIO(body.encode()), chunk_size=chunk_size)
+
+    def test_records_across_chunk_boundaries(self):
+        records = [{"src": "100", "duration": 12345, "disposition": "НЕТ ОТВЕТА"}, {"n": [1, 2.5]}, 7]
+        body = json.dumps({"dedup": True, "records": records, "note": "x"}, ensure_ascii=False, indent=1)
+        for chunk_size in (1, 2, 5, 64):
+            parsed = self.stream(body, chunk_size).open()
+            self.assertEqual(parsed.head, {"dedup": True})
+            self.assertEqual(list(parsed), [(1, records[0]), (2, records[1]), (3, 7)])
+            self.assertEqual(parsed.tail, {"note": "x"})
+
+    def test_buffer_stays_small(self):
+        parsed = self.stream(json.dumps({"records": [{"src": str(i)} for i in range(2000)]}), 64).open()
+        longest = 0
+        for _line, _rec in parsed:
+            longest = max(longest, len(parsed.buf))
+        self.assertLess(longest, 200)
+
+    def test_bad_bodies(self):
+        for body in ('{"records": {}}', '{"other": []}', "{}"):
+            with self.assertRaises(RecordsNotAList):
+                self.stream(body).open()
+        for body in ('{"records": [{"a": 1}, {"a": }]}', '{"records": [1 2]}', '{"records": []} x', '{"records": [1,'):
+            with self.assertRaises(ParseError):
+                list(self.stream(body).open())
+
+
+class BulkCreateStreamTests(TestCase):
+    RECORD = {"calldate": "2025-01-01 10:00:00", "src": "100", "dst": "200", "duration": 5, "billsec": 3,
+              "disposition": "ANSWERED"}
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(get_user_model().objects.create_user("streamer", password="x"))
+
+    def post(self, body, url="/api/calls/bulk_create/"):
+        return self.client.post(url, json.dumps(body), content_type="application/json")
+
+    def test_same_contract(self):
+        bad = dict(self.RECORD, src="", duration="x")
+        response = self.post({"records": [self.RECORD, bad, self.RECORD, bad]})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([e["line"] for e in response.data["errors"]], [2, 4])
+        self.assertEqual(response.data["errors"][0]["errors"], ["src пустой", "duration должен быть целым числом"])
+        self.assertFalse(CallRecord.objects.exists())
+
+        self.assertEqual(self.post({"records": "x"}).data, {"detail": "records должен быть списком"})
+        self.assertEqual(self.post({"records": [self.RECORD] * 3}).data, {"created": 3})
+        deduped = {"dedup": True, "records": [dict(self.RECORD, src="101")]}
+        self.assertEqual(self.post(deduped).data, {"created": 1, "duplicates": 0})
+        self.assertEqual(self.post(deduped).data, {"created": 0, "duplicates": 1})
+        self.assertEqual(self.post({"records": [self.RECORD], "dedup": True}).status_code, 400)
+        self.assertEqual(CallRecord.objects.count(), 4)
+        response = self.client.post("/api/calls/bulk_create/", '{"records": [', content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+
+
+class WriterTests(TestCase):
+    ROWS = [
+        (T0, "100", "200", 5, 3, CallRecord.ANSWERED, True),
+        (T0 + timedelta(days=1), "a\tb\\c", "201", 7, 0, CallRecord.NO_ANSWER, False),
+        (T0 + timedelta(days=1), "101", "line\nbreak", 9, 4, CallRecord.ANSWERED, True),
+    ]
+
+    def check(self, writer):
+        self.assertEqual(writer.write_encoded(writer.encode(self.ROWS[:1])), 1)
+        self.assertEqual(writer.write(self.ROWS[1:]), 2)
+        ids = list(CallRecord.objects.values_list("id", flat=True))
+        self.assertLessEqual(writer.first_id, min(ids))
+        self.assertEqual(writer.last_id, max(ids))
+        stored = CallRecord.objects.order_by("id").values_list(
+            "calldate", "src", "dst", "duration", "billsec", "disposition", "answered"
+        )
+        self.assertEqual(list(stored), self.ROWS)
+        self.assertFalse(CallRecord.objects.filter(Q(created_at__isnull=True) | Q(updated_at__isnull=True)).exists())
+        self.assertEqual(
+            list(DailyCallStat.objects.order_by("day").values_list("calls", "answered", "billsec")),
+            [(1, 1, 3), (2, 1, 4)],
+        )
+
+    def test_bulk_create(self):
+        self.check(WRITERS["bulk_create"](batch_size=1))
+
+    @skipUnless(connection.vendor == "postgresql", "COPY needs PostgreSQL")
+    def test_copy(self):
+        self.check(WRITERS["copy"](batch_size=1))
+
+    # A batch that fails takes the ones before it in the same write() along.
+    @skipUnless(connection.vendor == "postgresql", "COPY needs PostgreSQL")
+    def test_copy_is_all_or_nothing(self):
+        for dedup in (False, True):
+            writer = WRITERS["copy"](batch_size=1, dedup=dedup)
+            copy = writer._copy_batch
+            calls = []
+
+            def failing(*args):
+                calls.append(1)
+                if len(calls) > 1:
+                    raise RuntimeError
+                return copy(*args)
+
+            with mock.patch.object(writer, "_copy_batch", side_effect=failing), self.assertRaises(RuntimeError):
+                writer.write(self.ROWS)
+            self.assertFalse(CallRecord.objects.exists())
+            self.assertEqual(writer.write(self.ROWS), 3)
+            CallRecord.objects.all().delete()
+
+    def test_copy_falls_back_off_postgresql(self):
+        expected = "copy" if connection.vendor == "postgresql" else "bulk_create"
+        self.assertEqual(get_writer("copy").name, expected)
+        self.assertEqual(get_writer("auto").name, expected)
+
+
+class FingerprintDedupTests(TestCase):
+    ROW = (T0, "100", "200", 5, 3, CallRecord.ANSWERED, True)
+
+    def test_fingerprint_covers_every_field(self):
+        make = CallRecord.make_fingerprint
+        base = make(*self.ROW[:6])
+        self.assertEqual(make(T0.astimezone(ZoneInfo("Asia/Tashkent")), *self.ROW[1:6]), base)
+        for i, value in enumerate((T0 + timedelta(seconds=1), "101", "201", 6, 4, CallRecord.OTHER)):
+            changed = list(self.ROW[:6])
+            changed[i] = value
+            self.assertNotEqual(make(*changed), base)
+
+    def test_writer_skips_stored_and_repeated_rows(self):
+        other = (T0, "101", "200", 5, 3, CallRecord.ANSWERED, True)
+        writer = WRITERS["bulk_create"](dedup=True)
+        self.assertEqual(writer.write([self.ROW, other, self.ROW]), 2)
+        self.assertEqual(writer.duplicates, 1)
+        self.assertEqual(writer.write([other, self.ROW]), 0)
+        self.assertEqual(writer.duplicates, 3)
+        self.assertEqual(DailyCallStat.objects.get().calls, 2)
+        # Rows written without dedup have no fingerprint and never collide.
+        self.assertEqual(WRITERS["bulk_create"]().write([self.ROW, self.ROW]), 2)
+        self.assertEqual(CallRecord.objects.filter(fingerprint__isnull=True).count(), 2)
+
+    # Another writer commits one of the rows between the check and the insert.
+    def test_row_stored_after_the_check(self):
+        other = (T0, "101", "200", 5, 3, CallRecord.ANSWERED, True)
+        writer = WRITERS["bulk_create"](dedup=True)
+        check = writer._fresh
+
+        def racing(by_fp):
+            fresh = check(by_fp)
+            if not CallRecord.objects.exists():
+                WRITERS["bulk_create"](dedup=True).write([other])
+            return fresh
+
+        with mock.patch.object(writer, "_fresh", side_effect=racing):
+            self.assertEqual(writer.write([self.ROW, other]), 1)
+        self.assertEqual(writer.duplicates, 1)
+        record = CallRecord.objects.get(src="100")
+        self.assertEqual((writer.first_id, writer.last_id), (record.pk, record.pk))
+        self.assertEqual(DailyCallStat.objects.get().calls, 2)
+
+    def test_csv_reupload(self):
+        client = APIClient()
+        client.force_authenticate(get_user_model().objects.create_user("dedup", password="x"))
+        body = b"calldate,src,dst,duration,billsec,disposition\n2025-01-01 10:00:00,100,200,5,3,ANSWERED\n"
+
+        def post(extra=b""):
+            url = "/api/calls/ingest_csv/?dedup=1&on_duplicate=allow"
+            return client.post(url, data=body + extra, content_type="text/csv").data
+
+        first = post()
+        self.assertEqual((first["created"], first["duplicates"]), (1, 0))
+        second = post(b"2025-01-01 10:05:00,100,200,5,3,ANSWERED\n")
+        self.assertEqual((second["created"], second["duplicates"]), (1, 1))
+        self.assertEqual(CallRecord.objects.count(), 2)
+
+
+class UploadLedgerTests(TestCase):
+    BODY = b"calldate,src,dst,duration,billsec,disposition\n2025-01-01 10:00:00,100,200,5,3,ANSWERED\n"
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(get_user_model().objects.create_user("ledger", password="x"))
+        self.digest = hashlib.sha256(self.BODY).hexdigest()
+
+    def post(self, on_duplicate=None, body=BODY, **headers):
+        query = f"?on_duplicate={on_duplicate}" if on_duplicate else ""
+        return self.client.post(f"/api/calls/ingest_csv/{query}", data=body, content_type="text/csv", **headers)
+
+    def test_on_duplicate(self):
+        first = self.post()
+        self.assertEqual(first.status_code, 201)
+        entry = UploadLedger.objects.get(pk=first.data["upload"])
+        record = CallRecord.objects.get()
+        self.assertEqual((entry.sha256, entry.size, entry.rows_created), (self.digest, len(self.BODY), 1))
+        self.assertEqual((entry.first_id, entry.last_id), (record.pk, record.pk))
+
+        returned = self.post()
+        self.assertEqual((returned.status_code, returned.data["created"]), (200, 0))
+        self.assertEqual(returned.data["duplicate_of"]["id"], entry.pk)
+        self.assertEqual(self.post("reject").status_code, 409)
+        self.assertEqual(self.post("sometimes").status_code, 400)
+        self.assertEqual(self.post("allow").data["created"], 1)
+        self.assertEqual((CallRecord.objects.count(), UploadLedger.objects.count()), (2, 2))
+
+        # A multipart file is hashed first and answered without parsing.
+        with self.assertNumQueries(1):
+            response = self.client.post(
+                "/api/calls/ingest_csv/", {"file": ContentFile(self.BODY, name="cdr.csv")}, format="multipart"
+            )
+        self.assertEqual(response.data["duplicate_of"]["id"], entry.pk)
+
+    # The same file uploaded twice at once: both pass the early check, the
+    # one that records second is rolled back.
+    def test_overlapping_uploads(self):
+        self.post()
+        with mock.patch("web.views.check_duplicate"):
+            response = self.client.post(
+                "/api/calls/ingest_csv/?on_duplicate=reject", {"file": ContentFile(self.BODY, name="cdr.csv")},
+                format="multipart",
+            )
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual((CallRecord.objects.count(), UploadLedger.objects.count()), (1, 1))
+
+        spool = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(mock.patch.object(jobs, "SPOOL_DIR", spool))
+        with mock.patch("web.jobs.check_duplicate"), self.assertRaises(DuplicateUpload):
+            jobs.spool_upload([self.BODY], on_duplicate="reject")
+        self.assertEqual((os.listdir(spool), IngestJob.objects.count()), ([], 0))
+
+    def test_claimed_digest(self):
+        wrong = self.post(HTTP_X_CONTENT_SHA256="0" * 64)
+        self.assertEqual(wrong.status_code, 400)
+        self.assertFalse(CallRecord.objects.exists() or UploadLedger.objects.exists())
+        self.post(HTTP_X_CONTENT_SHA256=self.digest.upper())
+        # A known claimed digest is answered before the body is read.
+        with self.assertNumQueries(1):
+            self.assertEqual(self.post("reject", HTTP_X_CONTENT_SHA256=self.digest).status_code, 409)
+
+    def test_failed_job_is_not_a_duplicate(self):
+        job = IngestJob.objects.create(spool_path="x", state=IngestJob.FAILED)
+        UploadLedger.objects.create(sha256=self.digest, source=UploadLedger.SOURCE_JOB, job=job)
+        self.assertEqual(self.post("reject").status_code, 201)
+
+
+class RecordValidatorTests(SimpleTestCase):
+    RECORD = {"calldate": "2025-01-01 10:00:00", "src": "100", "dst": "200", "duration": "5", "billsec": 3,
+              "disposition": "ANSWERED"}
+
+    def test_normalizes_columns(self):
+        records = [
+            self.RECORD,
+            dict(self.RECORD, src=" 101 ", dst=202, disposition=" no answer "),
+            dict(self.RECORD, calldate="2025-01-01T10:00:00+00:00", disposition="NOANSWER"),
+            dict(self.RECORD, disposition="FAILED"),
+        ]
+        result = RecordValidator().validate(records, first_line=10)
+        self.assertEqual((result.lines, result.errors), ([10, 11, 12, 13], []))
+        tashkent = datetime(2025, 1, 1, 5, 0, tzinfo=dt_timezone.utc)
+        self.assertEqual(result.columns["calldate"], [tashkent, tashkent, T0, tashkent])
+        self.assertEqual(result.columns["src"], ["100", "101", "100", "100"])
+        self.assertEqual(result.columns["dst"], ["200", "202", "200", "200"])
+        self.assertEqual(result.columns["duration"], [5, 5, 5, 5])
+        self.assertEqual(
+            list(zip(result.columns["disposition"], result.columns["answered"])),
+            [(CallRecord.ANSWERED, True), (CallRecord.NO_ANSWER, False), (CallRecord.NO_ANSWER, False),
+             (CallRecord.OTHER, False)],
+        )
+
+    def test_collects_every_error_per_line(self):
+        records = [
+            dict(self.RECORD, calldate="", src="", dst="12345", duration="x", billsec=-1, disposition=""),
+            self.RECORD,
+            dict(self.RECORD, calldate="yesterday"),
+        ]
+        result = RecordValidator(dst_max_length=4).validate(records, lines=[3, 5, 8])
+        self.assertEqual(result.lines, [5])
+        self.assertEqual(result.error_dicts(), [
+            {"line": 3, "errors": [
+                "calldate пустой", "src пустой", "dst слишком длинный", "duration должен быть целым числом",
+                "billsec < 0", "disposition пустой",
+            ]},
+            {"line": 8, "errors": ["Неверный формат calldate"]},
+        ])
+        calldate = datetime(2025, 1, 1, 5, 0, tzinfo=dt_timezone.utc)
+        self.assertEqual(result.rows(), [(calldate, "100", "200", 5, 3, CallRecord.ANSWERED, True)])
+
+
+class CalldateParserTests(SimpleTestCase):
+    def setUp(self):
+        self.berlin = ZoneInfo("Europe/Berlin")
+        self.parser = CalldateParser(self.berlin)
+
+    def utc(self, *args):
+        return datetime(*args, tzinfo=dt_timezone.utc)
+
+    def test_dst_days(self):
+        parse = self.parser.parse
+        self.assertEqual(parse("2025-01-15 12:00:00"), self.utc(2025, 1, 15, 11))
+        self.assertEqual(parse("2025-07-15 12:00:00"), self.utc(2025, 7, 15, 10))
+        # Days with a transition keep the zone itself instead of one offset.
+        self.assertEqual(parse("2025-03-30 01:30:00"), self.utc(2025, 3, 30, 0, 30))
+        self.assertEqual(parse("2025-03-30 03:30:00"), self.utc(2025, 3, 30, 1, 30))
+        self.assertIs(self.parser.tz_for_day(date(2025, 3, 30)), self.berlin)
+        self.assertEqual(parse("2025-10-26 01:30:00"), self.utc(2025, 10, 25, 23, 30))
+        self.assertEqual(parse("2025-10-26 04:00:00"), self.utc(2025, 10, 26, 3))
+        self.assertEqual(parse("2025-07-15T12:00:00+05:00"), self.utc(2025, 7, 15, 7))
+
+    def test_offset_cached_per_day(self):
+        with mock.patch.object(self.parser, "tz_for_day", wraps=self.parser.tz_for_day) as lookup:
+            for minute in range(30):
+                self.parser.parse(f"2025-07-15 12:{minute:02d}:00")
+            self.parser.parse("2025-07-16 12:00:00")
+        self.assertEqual(lookup.call_count, 2)
+
+    def test_mdy_fast_path(self):
+        self.assertEqual(self.parser.detect(["01/02/2025 10:00:00", "", "01/03/2025 11:00:00"]), "mdy")
+        with mock.patch.object(self.parser, "parse_general", wraps=self.parser.parse_general) as general:
+            self.assertEqual(self.parser.parse("01/02/2025 10:00:00"), self.utc(2025, 1, 2, 9))
+            self.assertEqual(self.parser.parse("12-31-2025 10:00"), self.utc(2025, 12, 31, 9))
+            general.assert_not_called()
+            # Single-digit fields and other layouts still parse, the slow way.
+            self.assertEqual(self.parser.parse("1/2/2025 10:00:00"), self.utc(2025, 1, 2, 9))
+            self.assertEqual(self.parser.parse("2025-01-02 10:00:00"), self.utc(2025, 1, 2, 9))
+            self.assertIsNone(self.parser.parse("13/45/2025 10:00:00"))
+            self.assertEqual(general.call_count, 3)
+        mixed = ["2025-01-02 10:00:00", "01/02/2025 10:00:00", "2025-01-03 10:00:00"]
+        self.assertEqual(self.parser.detect(mixed), "ymd")
+
+
+class CsvIngestTests(TestCase):
+    HEADER = "calldate,src,dst,duration,billsec,disposition\r\n"
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(get_user_model().objects.create_user("csv", password="x"))
+
+    def post(self, body, query=""):
+        return self.client.post(f"/api/calls/ingest_csv/{query}", data=body, content_type="text/csv")
+
+    def test_raw_body(self):
+        body = "\ufeff" + self.HEADER + (
+            "2025-01-01 10:00:00,100,200,5,3,ANSWERED\r\n"
+            '2025-01-01 10:01:00," 101 ",200,5,0,NO ANSWER\r\n'
+            "\r\n"
+            "2025-01-01 10:02:00,102,201,0,0,BUSY\r\n"
+        )
+        response = self.post(body.encode())
+        self.assertEqual((response.status_code, response.data["created"]), (201, 3))
+        self.assertEqual(
+            list(CallRecord.objects.order_by("calldate").values_list("src", "disposition", "answered")),
+            [("100", CallRecord.ANSWERED, True), ("101", CallRecord.NO_ANSWER, False), ("102", CallRecord.OTHER, False)],
+        )
+
+    def test_multipart_file(self):
+        body = self.HEADER + "2025-01-01 10:00:00,100,200,5,3,ANSWERED\r\n"
+        response = self.client.post(
+            "/api/calls/ingest_csv/", {"file": ContentFile(body.encode(), name="cdr.csv")}, format="multipart"
+        )
+        self.assertEqual((response.status_code, response.data["created"]), (201, 1))
+
+    def test_rejected_line_keeps_nothing(self):
+        body = self.HEADER + "2025-01-01 10:00:00,100,200,5,3,ANSWERED\r\n2025-01-01 10:01:00,,200,-1,0,ANSWERED\r\n"
+        response = self.post(body.encode())
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["errors"], [{"line": 3, "errors": ["src пустой", "duration < 0"]}])
+        self.assertFalse(CallRecord.objects.exists())
+
+    def test_bad_files(self):
+        self.assertEqual(self.post(b"").data, {"detail": "Файл не передан"})
+        self.assertEqual(self.post(b"\r\n").data, {"detail": "Файл пустой"})
+        self.assertEqual(self.post(b"calldate,src\n").data, {"detail": "Отсутствует столбец: dst"})
+        response = self.post((self.HEADER + "2025-01-01 10:00:00,Иван,200,5,3,ANSWERED\r\n").encode("cp1251"))
+        self.assertEqual((response.status_code, response.data), (400, {"detail": "Файл должен быть в кодировке UTF-8"}))
+
+    def test_written_in_batches(self):
+        body = self.HEADER + "".join(f"2025-01-01 10:0{i}:00,10{i},200,5,3,ANSWERED\r\n" for i in range(5))
+        with mock.patch("web.views.ingest_records", partial(ingest_records, batch_size=2)), mock.patch.object(
+            BulkCreateWriter, "write", autospec=True, side_effect=BulkCreateWriter.write
+        ) as write:
+            self.assertEqual(self.post(body.encode()).data["created"], 5)
+        self.assertEqual([len(call.args[1]) for call in write.call_args_list], [2, 2, 1])
+
+
+class RejectsTests(TestCase):
+    RECORD = BulkCreateStreamTests.RECORD
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user("rejecter", password="x")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        reports = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(mock.patch.object(rejects, "REPORT_DIR", reports))
+
+    def post(self, records, query=""):
+        return self.client.post(f"/api/calls/bulk_create/{query}", json.dumps({"records": records}),
+                                content_type="application/json")
+
+    def test_capped_and_grouped(self):
+        bad = dict(self.RECORD, calldate="01/01/2025")
+        response = self.post([self.RECORD] + [bad] * 99 + [dict(bad, src="")], "?max_errors=5")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([e["line"] for e in response.data["errors"]], [2, 3, 4, 5, 6])
+        self.assertTrue(response.data["truncated"])
+        self.assertEqual(response.data["rejected"], 100)
+        self.assertEqual(response.data["error_groups"], [
+            {"error": "Неверный формат calldate", "lines": 100, "first_line": 2},
+            {"error": "src пустой", "lines": 1, "first_line": 101},
+        ])
+        self.assertEqual(self.post([bad], "?max_errors=x").status_code, 400)
+        self.assertFalse(CallRecord.objects.exists())
+
+    def test_abort_after_cap(self):
+        bad = dict(self.RECORD, calldate="01/01/2025")
+        seen = []
+        numbered = ((seen.append(i) or i, bad) for i in range(1, 101))
+        found = rejects.Rejects(max_errors=15)
+        self.assertEqual(ingest_records(numbered, batch_size=10, rejects=found), (0, found.errors))
+        self.assertTrue(found.aborted)
+        self.assertEqual((len(seen), found.count, len(found.errors)), (20, 20, 15))
+
+    def test_accept_valid_with_report(self):
+        bad = dict(self.RECORD, src="")
+        response = self.post([self.RECORD, bad, self.RECORD, bad], "?accept_valid=1&report=1&max_errors=1")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["created"], 2)
+        self.assertEqual(response.data["rejected"], 2)
+        self.assertEqual(response.data["errors"], [{"line": 2, "errors": ["src пустой"]}])
+        self.assertFalse(response.data["aborted"])
+        self.assertEqual(CallRecord.objects.count(), 2)
+
+        download = self.client.get(response.data["report"])
+        self.assertEqual(download["Content-Type"], "application/x-ndjson")
+        lines = [json.loads(line) for line in b"".join(download.streaming_content).splitlines()]
+        self.assertEqual([(r["line"], r["record"]["src"]) for r in lines], [(2, ""), (4, "")])
+
+        other = APIClient()
+        other.force_authenticate(get_user_model().objects.create_user("other", password="x"))
+        self.assertEqual(other.get(response.data["report"]).status_code, 404)
+        self.assertEqual(self.client.get("/api/calls/reports/../").status_code, 404)
+
+
+class IngestJobTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user("uploader", password="x")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        spool = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(mock.patch.object(jobs, "SPOOL_DIR", spool))
+        rows = [f"2025-01-01 10:{i // 60:02d}:{i % 60:02d},{100 + i},200,5,3,ANSWERED\n" for i in range(30)]
+        rows[4] = "not-a-date,104,200,5,3,ANSWERED\n"
+        self.body = ("calldate,src,dst,duration,billsec,disposition\n" + "".join(rows)).encode()
+
+    def spool(self):
+        response = self.client.post(
+            "/api/calls/jobs/", {"file": ContentFile(self.body, name="cdr.csv")}, format="multipart"
+        )
+        self.assertEqual(response.status_code, 202)
+        return IngestJob.objects.get(pk=response.data["job"])
+
+    def make_stale(self, job):
+        IngestJob.objects.filter(pk=job.pk).update(heartbeat_at=T0)
+
+    def test_spool_run_and_status(self):
+        job = self.spool()
+        self.assertTrue(os.path.isfile(job.spool_path))
+        self.assertEqual(self.client.get(f"/api/calls/jobs/{job.pk}/").data["state"], IngestJob.PENDING)
+
+        claimed = jobs.claim_job("w1")
+        self.assertEqual((claimed.pk, claimed.worker, claimed.attempts), (job.pk, "w1", 1))
+        self.assertIsNone(jobs.claim_job("w2"))
+        jobs.run_job(claimed, batch_size=10)
+
+        data = self.client.get(f"/api/calls/jobs/{job.pk}/").data
+        self.assertEqual((data["state"], data["created"], data["rejected"]), (IngestJob.DONE, 29, 1))
+        self.assertEqual(data["errors"][0]["line"], 6)
+        self.assertFalse(os.path.exists(job.spool_path))
+        other = APIClient()
+        other.force_authenticate(get_user_model().objects.create_user("other", password="x"))
+        self.assertEqual(other.get(f"/api/calls/jobs/{job.pk}/").status_code, 404)
+
+    def test_resume_after_crash(self):
+        self.spool()
+        commit = jobs._commit_batch
+        calls = []
+
+        def crash_on_second(*args):
+            calls.append(1)
+            if len(calls) == 2:
+                raise KeyboardInterrupt
+            commit(*args)
+
+        with mock.patch.object(jobs, "_commit_batch", crash_on_second), self.assertRaises(KeyboardInterrupt):
+            jobs.run_job(jobs.claim_job("w1"), batch_size=10)
+        self.assertEqual(CallRecord.objects.count(), 9)
+        self.assertIsNone(jobs.claim_job("w2"))
+
+        self.make_stale(IngestJob.objects.get())
+        job = jobs.run_job(jobs.claim_job("w2"), batch_size=10)
+        self.assertEqual((job.state, job.attempts, job.created_rows, job.rejected), (IngestJob.DONE, 2, 29, 1))
+        self.assertEqual(CallRecord.objects.count(), 29)
+
+    def test_reclaimed_job_is_fenced(self):
+        self.spool()
+        slow = jobs.claim_job("w1")
+        self.make_stale(slow)
+        fresh = jobs.claim_job("w2")
+        jobs.run_job(slow, batch_size=10)
+        self.assertEqual(CallRecord.objects.count(), 0)
+        self.assertEqual(IngestJob.objects.get().state, IngestJob.RUNNING)
+
+        jobs.run_job(fresh, batch_size=10)
+        self.assertEqual(CallRecord.objects.count(), 29)
+        self.assertEqual(IngestJob.objects.get().state, IngestJob.DONE)
+
+    def test_attempts_cap(self):
+        job = self.spool()
+        for _ in range(jobs.MAX_ATTEMPTS):
+            self.assertIsNotNone(jobs.claim_job("w"))
+            self.make_stale(job)
+        self.assertIsNone(jobs.claim_job("w"))
+        job.refresh_from_db()
+        self.assertEqual((job.state, job.attempts), (IngestJob.FAILED, jobs.MAX_ATTEMPTS))
+
+
+class ParallelIngestTests(TestCase):
+    HEADER = "calldate,src,dst,duration,billsec,disposition,note\n"
+
+    def write(self, text):
+        fh = tempfile.NamedTemporaryFile("wb", suffix=".csv", delete=False)
+        self.addCleanup(os.remove, fh.name)
+        with fh:
+            fh.write(text if isinstance(text, bytes) else text.encode())
+        return fh.name
+
+    def test_split_ranges_skips_quoted_newlines(self):
+        data = b'a,"x\ny\n""z""\nw"\nb,c\n' * 20
+        ranges = parallel.split_ranges(data, 0, 1, chunk_bytes=7)
+        self.assertEqual(ranges[0][0], 0)
+        self.assertEqual(ranges[-1][1], len(data))
+        for (begin, end, line), nxt in zip(ranges, ranges[1:] + [(len(data), None, None)]):
+            self.assertEqual(end, nxt[0])
+            self.assertEqual(data.count(b'"', 0, end) % 2, 0)
+            self.assertEqual(line, 1 + data.count(b"\n", 0, begin))
+
+    # Small ranges put quoted newlines next to every split point; the error
+    # lines must match a serial read of the same file.
+    def test_error_lines_match_serial_read(self):
+        rows = []
+        for i in range(60):
+            calldate = "bad" if i % 7 == 3 else f"2025-01-01 10:{i // 60:02d}:{i % 60:02d}"
+            rows.append(f'{calldate},{100 + i},200,5,3,ANSWERED,"a\nb ""{i}"""\n')
+        path = self.write(self.HEADER + "".join(rows))
+        with open(path, "rb") as fh:
+            _created, serial = ingest_records(CsvRecordReader(fh), 1000, WRITERS["bulk_create"](), RecordValidator())
+        self.assertTrue(serial)
+
+        created, errors = parallel.ingest_file(path, processes=2, chunk_bytes=64)
+        self.assertEqual((created, errors), (0, serial))
+        self.assertFalse(CallRecord.objects.exists())
+
+    # Ranges hold more rows than one validation batch; all of them are kept.
+    def test_range_spans_several_batches(self):
+        rows = "".join(f"2025-01-01 10:00:{i:02d},{100 + i},200,5,3,ANSWERED,x\n" for i in range(7))
+        with mock.patch.object(parallel, "BATCH_SIZE", 2):
+            created, errors = parallel.ingest_file(self.write(self.HEADER + rows), processes=1)
+        self.assertEqual((created, errors), (7, []))
+        self.assertEqual(CallRecord.objects.count(), 7)
+
+    def test_rejects_are_capped(self):
+        path = self.write(self.HEADER + "bad,100,200,5,3,ANSWERED,x\n" * 40)
+        capped = rejects.Rejects(max_errors=3)
+        created, errors = parallel.ingest_file(path, processes=2, chunk_bytes=64, rejects=capped)
+        self.assertEqual((created, [e["line"] for e in errors]), (0, [2, 3, 4]))
+        self.assertTrue(capped.aborted)
+        self.assertLess(capped.count, 40)
+
+    def test_not_utf8_is_an_error(self):
+        body = self.HEADER + "2025-01-01 10:00:00,100,200,5,3,ANSWERED,x\n" * 3
+        path = self.write(body.encode() + "2025-01-01 10:00:00,100,200,5,3,ANSWERED,ж\n".encode("cp1251"))
+        self.assertEqual(
+            parallel.ingest_file(path, processes=2, chunk_bytes=64),
+            (0, [{"line": 5, "errors": [parallel.NOT_UTF8]}]),
+        )
+        self.assertEqual(
+            parallel.ingest_file(self.write("дата\n".encode("cp1251")), processes=1),
+            (0, [{"line": 1, "errors": [parallel.NOT_UTF8]}]),
+        )
+
+
+class UploadSessionTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(get_user_model().objects.create_user("uploader", password="x"))
+        spool = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(mock.patch.object(uploads, "SPOOL_DIR", spool))
+        rows = [f'2025-01-01 10:{i // 60:02d}:{i % 60:02d},{100 + i},200,5,3,ANSWERED,"a\nb"\n' for i in range(40)]
+        self.body = ("calldate,src,dst,duration,billsec,disposition,note\n" + "".join(rows)).encode()
+
+    def put(self, url, start, end):
+        return self.client.generic(
+            "PUT", url, self.body[start:end], content_type="application/octet-stream",
+            HTTP_CONTENT_RANGE=f"bytes {start}-{end - 1}/{len(self.body)}",
+        )
+
+    def test_resumable_upload(self):
+        digest = hashlib.sha256(self.body).hexdigest()
+        created = self.client.post("/api/calls/uploads/", {"name": "cdr.csv", "sha256": digest}, format="json")
+        self.assertEqual(created.status_code, 201)
+        url = created["Location"]
+        third = len(self.body) // 3
+        # An open session only declares the digest; it is not a duplicate yet.
+        self.assertIsNone(find_duplicate(digest))
+
+        self.assertEqual(self.put(url, 0, third).data["offset"], third)
+        self.assertGreater(CallRecord.objects.count(), 0)
+        self.assertEqual(self.put(url, 0, third).data["offset"], third)
+        ahead = self.put(url, 2 * third, len(self.body))
+        self.assertEqual((ahead.status_code, ahead.data["pending"]), (202, [[2 * third, len(self.body)]]))
+        self.assertEqual(self.client.post(f"{url}finalize/").status_code, 409)
+        self.assertEqual(self.put(url, third - 10, 2 * third).data["offset"], len(self.body))
+
+        done = self.client.post(f"{url}finalize/")
+        self.assertEqual((done.data["state"], done.data["created"], done.data["rejected"]), ("done", 40, 0))
+        self.assertEqual(CallRecord.objects.count(), 40)
+        self.assertEqual(UploadLedger.objects.get(job=done.data["upload"]).sha256, digest)
+        self.assertEqual(self.client.post(f"{url}finalize/").data["state"], "done")
+        self.assertEqual(os.listdir(uploads.SPOOL_DIR), [])
+
+        again = self.client.post("/api/calls/uploads/?on_duplicate=reject", {"sha256": digest}, format="json")
+        self.assertEqual(again.status_code, 409)
+
+    def test_empty_chunk(self):
+        url = self.client.post("/api/calls/uploads/", {}, format="json")["Location"]
+        response = self.client.generic(
+            "PUT", url, b"", content_type="application/octet-stream", HTTP_CONTENT_RANGE="bytes 0-99/1000"
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(IngestJob.objects.get().size, 0)
+
+    def test_digest_mismatch_fails_the_session(self):
+        digest = hashlib.sha256(b"other").hexdigest()
+        url = self.client.post("/api/calls/uploads/", {"sha256": digest}, format="json")["Location"]
+        self.put(url, 0, len(self.body))
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f"{url}finalize/")
+        self.assertEqual(response.status_code, 400)
+        job = IngestJob.objects.get()
+        self.assertEqual((job.state, job.detail), (IngestJob.FAILED, "sha256 файла не совпадает с заявленным"))
+        self.assertIsNone(find_duplicate(digest))
+        self.assertEqual(self.client.post(f"{url}finalize/").status_code, 409)
+        self.assertEqual(os.listdir(uploads.SPOOL_DIR), [])
+
+    def test_chunks_kept_until_commit(self):
+        url = self.client.post("/api/calls/uploads/", {}, format="json")["Location"]
+        self.put(url, 200, 300)
+        with mock.patch.object(uploads, "ingest_spooled", side_effect=RuntimeError), self.assertRaises(RuntimeError):
+            self.put(url, 0, 200)
+        job = IngestJob.objects.get()
+        self.assertEqual((job.size, len(uploads.pending_chunks(job))), (0, 2))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.put(url, 0, 200).data["offset"], 300)
+        self.assertEqual(os.listdir(uploads.SPOOL_DIR), [os.path.basename(job.spool_path)])
+
+    def test_expired_session(self):
+        url = self.client.post("/api/calls/uploads/", {}, format="json")["Location"]
+        self.put(url, 0, 100)
+        IngestJob.objects.update(expires_at=datetime(2025, 1, 1, tzinfo=dt_timezone.utc))
+        self.assertEqual(uploads.expire_uploads(), 1)
+        self.assertEqual(IngestJob.objects.get().state, IngestJob.FAILED)
+        self.assertEqual(os.listdir(uploads.SPOOL_DIR), [])
+        self.assertEqual(self.put(url, 100, 200).status_code, 409)
+
+
+class IngestMetricsTests(TestCase):
+    def setUp(self):
+        metrics.registry.clear()
+        self.user = get_user_model().objects.create_user("loader", password="x")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def post(self, records):
+        return self.client.post("/api/calls/bulk_create/", {"records": records}, format="json")
+
+    def test_server_timing_and_histograms(self):
+        records = [{"calldate": "2025-01-01 10:00:00", "src": "100", "dst": "200", "duration": 5,
+                    "billsec": 3, "disposition": "ANSWERED"}]
+        response = self.post(records * 3)
+        self.assertEqual(response.status_code, 201)
+        stages = [part.split(";")[0] for part in response["Server-Timing"].split(", ")]
+        for name in ("parse", "validate", "calldate", "write", "db", "total", "queries"):
+            self.assertIn(name, stages)
+        self.assertEqual(self.post(records + [{"src": ""}]).status_code, 400)
+
+        text = metrics.render()
+        self.assertIn('calls_ingest_requests_total{endpoint="bulk_create",status="201"} 1', text)
+        self.assertIn('calls_ingest_requests_total{endpoint="bulk_create",status="400"} 1', text)
+        self.assertIn('calls_ingest_rows_sum{endpoint="bulk_create"} 5', text)
+        self.assertIn('calls_ingest_rejected_rows_sum{endpoint="bulk_create"} 1', text)
+        self.assertIn('calls_ingest_stage_seconds_count{endpoint="bulk_create",stage="write"} 1', text)
+
+    def test_endpoint_requires_staff_or_token(self):
+        self.assertEqual(self.client.get("/api/metrics/").status_code, 403)
+        anonymous = APIClient()
+        with mock.patch("web.views.METRICS_TOKEN", "s3cret"):
+            self.assertEqual(anonymous.get("/api/metrics/", HTTP_AUTHORIZATION="Bearer wrong").status_code, 403)
+            response = anonymous.get("/api/metrics/", HTTP_AUTHORIZATION="Bearer s3cret")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/plain; version=0.0.4"))
+        self.user.is_staff = True
+        self.user.save()
+        self.assertEqual(self.client.get("/api/metrics/").status_code, 200)
+
+    def test_multiprocess_files_are_summed(self):
+        with tempfile.TemporaryDirectory() as tmp, mock.patch("web.metrics.METRICS_DIR", tmp):
+            other = [["calls_ingest_requests_total", [["endpoint", "job"], ["status", "done"]], 2]]
+            # A dead process that had the same pid.
+            with open(os.path.join(tmp, f"metrics-{os.getpid()}-0123456789ab.json"), "w") as fh:
+                json.dump(other, fh)
+            metrics.registry.inc("calls_ingest_requests_total", (("endpoint", "job"), ("status", "done")))
+            text = metrics.render()
+            self.assertEqual(len(os.listdir(tmp)), 2)
+        self.assertIn('calls_ingest_requests_total{endpoint="job",status="done"} 3', text)
+
+
+class TranslatedThing(TranslatableModel):
+    code = models.CharField(max_length=20)
+    translations = TranslatedFields(title=models.CharField(max_length=100, default=""))
+
+    class Meta:
+        app_label = "web"
+
+
+class TranslatedThingResource(TranslatableResource):
+    TRANSLATION_FIELDS = ("title",)
+    alternate_key = "code"
+
+    class Meta:
+        model = TranslatedThing
+        fields = ("id", "code", "translations")
+
+    def dehydrate_translations(self, obj):
+        return json.dumps(self.get_translations_dict(obj, self.TRANSLATION_FIELDS))
+
+
+class TranslatableResourceTests(TemporaryModelsMixin, TestCase):
+    temporary_models = (TranslatedThing, TranslatedThing._parler_meta.root.model)
+
+    def setUp(self):
+        cache.clear()
+
+    def translation_queries(self, func):
+        table = TranslatedThing._parler_meta.root.model._meta.db_table
+        with CaptureQueriesContext(connection) as ctx:
+            result = func()
+        return result, len([q for q in ctx.captured_queries if table in q["sql"]])
+
+    def dataset(self, codes, title):
+        data = tablib.Dataset(headers=["id", "code", "translations"])
+        for code in codes:
+            data.append(["", code, json.dumps({"ru": {"title": f"{title} {code}"}, "en": {"title": code}})])
+        return data
+
+    def test_export_prefetches_translations(self):
+        for n in range(30):
+            thing = TranslatedThing(code=f"c{n}")
+            thing.set_current_language("ru")
+            thing.title = f"т{n}"
+            thing.save()
+        with CaptureQueriesContext(connection) as ctx:
+            data = TranslatedThingResource().export(TranslatedThing.objects.filter(code__in=["c1", "c2"]))
+        small = len(ctx.captured_queries)
+        with CaptureQueriesContext(connection) as ctx:
+            data = TranslatedThingResource().export(TranslatedThing.objects.all())
+        self.assertEqual(len(ctx.captured_queries), small)
+        self.assertEqual(json.loads(data.dict[5]["translations"]), {"ru": {"title": "т5"}})
+
+    def test_import_writes_translations_in_batches(self):
+        result, small = self.translation_queries(
+            lambda: TranslatedThingResource().import_data(self.dataset(["a", "b"], "x"))
+        )
+        self.assertFalse(result.has_errors())
+        _result, large = self.translation_queries(
+            lambda: TranslatedThingResource().import_data(self.dataset([f"n{i}" for i in range(40)], "x"))
+        )
+        self.assertEqual(small, large)
+        thing = TranslatedThing.objects.get(code="n7")
+        self.assertEqual(thing.safe_translation_getter("title", language_code="ru"), "x n7")
+        self.assertEqual(thing.safe_translation_getter("title", language_code="en"), "n7")
+
+
+    def test_overridden_hook_is_batched(self):
+        class Upper(TranslatedThingResource):
+            def apply_translation(self, instance, lang_code, payload):
+                return None if lang_code == "en" else {"title": payload["title"].upper()}
+
+        _result, small = self.translation_queries(lambda: Upper().import_data(self.dataset(["a", "b"], "x")))
+        _result, large = self.translation_queries(
+            lambda: Upper().import_data(self.dataset([f"n{i}" for i in range(40)], "x"))
+        )
+        self.assertEqual(small, large)
+        thing = TranslatedThing.objects.get(code="n7")
+        self.assertEqual(thing.safe_translation_getter("title", language_code="ru"), "X N7")
+        self.assertFalse(thing.translations.filter(language_code="en").exists())
+
+class WebpBestFitTests(SimpleTestCase):
+    def setUp(self):
+        self.img = synthetic_photo(640, 480)
+        self.mixin = ImageOptimizationMixin()
+
+    def test_fits_budget_with_one_final_encode(self):
+        with count_encodes() as counts:
+            data = self.mixin._encode_webp_best_fit(self.img, 40)
+        self.assertLessEqual(len(data), 40 * 1024)
+        self.assertEqual(counts.get("640x480 m6"), 1)
+        self.assertGreaterEqual(len(data), len(legacy_best_fit(self.img, 40)) * 0.9)
+
+    def test_cache_skips_encoding(self):
+        with tempfile.TemporaryDirectory() as tmp, mock.patch("common.optimized.image.WEBP_CACHE_DIR", tmp):
+            first = self.mixin._encode_webp_best_fit(self.img, 40, "abc")
+            with count_encodes() as counts:
+                self.assertEqual(self.mixin._encode_webp_best_fit(self.img, 40, "abc"), first)
+            self.assertEqual(counts, {})
+
+
+    # The search is told 95 fits; the final encodes then bisect down to the
+    # lowest quality instead of stepping through every other one.
+    def test_overshoot_is_bisected(self):
+        budget = len(self.mixin._encode_webp(self.img, 31, 6))
+        with mock.patch.object(self.mixin, "_webp_search_quality", return_value=95), count_encodes() as counts:
+            data = self.mixin._encode_webp_best_fit(self.img, budget / 1024)
+        self.assertLessEqual(len(data), budget)
+        self.assertLessEqual(counts["640x480 m6"], 8)
+
+    def test_cache_key_includes_qualities(self):
+        class Coarse(ImageOptimizationMixin):
+            WEBP_QUALITIES = (80, 50)
+
+        with mock.patch("common.optimized.image.WEBP_CACHE_DIR", "cache"):
+            self.assertNotEqual(Coarse()._webp_cache_path("abc", 40), self.mixin._webp_cache_path("abc", 40))
+
+
+class ImageRenditionTests(SimpleTestCase):
+    class Photo(ImageOptimizationMixin):
+        _image_field_names = ["image"]
+
+        def __init__(self):
+            self.image = self.thumb = self.small = None
+            super().__init__()
+
+    def source(self, fmt, name):
+        buf = io.BytesIO()
+        synthetic_photo(1600, 1200).save(buf, fmt)
+        return ContentFile(buf.getvalue(), name=name)
+
+    def test_new_upload_decoded_once(self):
+        photo = self.Photo()
+        photo.image = self.source("JPEG", "a.jpg")
+        with mock.patch.object(photo, "_image_to_pil", wraps=photo._image_to_pil) as decode:
+            photo.process_images_config([("image", [("thumb", 300), ("small", 100)], 500, 0)])
+        decode.assert_called_once()
+        self.assertEqual(photo.image.name, "a.webp")
+        self.assertEqual(Image.open(photo.thumb).size, (300, 225))
+        self.assertEqual(Image.open(photo.small).size, (100, 75))
+
+    # Saving the same JPEG again takes the WebP from the cache, so only the
+    # renditions need decoding and libjpeg decodes at 1/4 scale.
+    def test_cached_upload_uses_jpeg_draft(self):
+        tmp = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(mock.patch("common.optimized.image.WEBP_CACHE_DIR", tmp))
+        data = self.source("JPEG", "a.jpg").read()
+        decoded = []
+        decode = ImageOptimizationMixin._image_to_pil
+
+        def record(photo, *args, **kwargs):
+            img = decode(photo, *args, **kwargs)
+            decoded.append(img.size)
+            return img
+
+        photos = []
+        with mock.patch.object(self.Photo, "_image_to_pil", record):
+            for _ in range(2):
+                photo = self.Photo()
+                photo.image = ContentFile(data, name="a.jpg")
+                photo.process_images_config([("image", "thumb", 500, 300)])
+                photos.append(photo)
+        self.assertEqual(decoded, [(1600, 1200), (400, 300)])
+        self.assertEqual(photos[1].image.read(), photos[0].image.read())
+        self.assertEqual(Image.open(photos[1].thumb).size, (300, 225))
+
+    def test_missing_thumbnail_of_webp(self):
+        photo = self.Photo()
+        photo.image = self.source("WEBP", "a.webp")
+        photo.process_images_config([("image", "thumb", 500, 300)])
+        self.assertEqual(photo.image.name, "a.webp")
+        self.assertEqual(photo.thumb.name, "thumb_a.webp")
+
+
+class Picture(ImageOptimizationMixin, models.Model):
+    IMAGE_DEFERRED = True
+    _image_field_names = ["image"]
+
+    image = models.ImageField(upload_to="pictures")
+    thumb = models.ImageField(upload_to="pictures", blank=True)
+
+    class Meta:
+        app_label = "web"
+
+    def save(self, *args, **kwargs):
+        self.process_images_config([("image", "thumb", 500, 120)])
+        super().save(*args, **kwargs)
+
+
+class DeferredImageTests(TemporaryModelsMixin, TestCase):
+    temporary_models = (Picture,)
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        ContentType.objects.clear_cache()
+
+    def upload(self):
+        buf = io.BytesIO()
+        synthetic_photo(800, 600).save(buf, "JPEG")
+        return ContentFile(buf.getvalue(), name="a.jpg")
+
+    def test_saved_as_is_then_swapped_by_worker(self):
+        picture = Picture(image=self.upload())
+        picture.save()
+        original = picture.image.path
+        self.assertTrue(picture.image.name.endswith(".jpg"))
+        self.assertFalse(picture.thumb)
+        Picture.objects.get().save()
+        job = ImageJob.objects.get()
+        self.assertEqual(job.state, ImageJob.PENDING)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            images.work(once=True)
+        picture.refresh_from_db()
+        job.refresh_from_db()
+        self.assertEqual((job.state, job.detail), (ImageJob.DONE, ""))
+        self.assertTrue(picture.image.name.endswith(".webp"))
+        self.assertEqual(Image.open(picture.thumb.path).width, 120)
+        self.assertFalse(os.path.exists(original))
+
+    def files(self):
+        return sorted(os.listdir(os.path.join(settings.MEDIA_ROOT, "pictures")))
+
+    # Without deferral the encoded files are written on commit; a new
+    # upload removes the renditions of the one it replaces.
+    def test_files_written_on_commit(self):
+        self.enterContext(mock.patch.object(Picture, "IMAGE_DEFERRED", False))
+        with self.captureOnCommitCallbacks(execute=True), self.assertRaises(RuntimeError), transaction.atomic():
+            Picture(image=self.upload()).save()
+            raise RuntimeError
+        self.assertFalse(os.path.exists(os.path.join(settings.MEDIA_ROOT, "pictures")))
+
+        picture = Picture(image=self.upload())
+        with self.captureOnCommitCallbacks(execute=True):
+            picture.save()
+        self.assertEqual(self.files(), ["a.webp", "thumb_a.webp"])
+        picture = Picture.objects.get()
+        picture.image = self.upload()
+        with self.captureOnCommitCallbacks(execute=True):
+            picture.save()
+        self.assertNotEqual(picture.thumb.name, "pictures/thumb_a.webp")
+        self.assertEqual(self.files(), sorted(["a.webp", os.path.basename(picture.image.name),
+                                               os.path.basename(picture.thumb.name)]))
+        self.assertEqual(Image.open(picture.thumb.path).width, 120)
+
+    def test_failed_enqueue_rolls_back_save(self):
+        with mock.patch("web.images.enqueue", side_effect=RuntimeError), self.assertRaises(RuntimeError):
+            Picture(image=self.upload()).save()
+        self.assertFalse(Picture.objects.exists())
+
+    def test_replaced_image_is_not_overwritten(self):
+        picture = Picture(image=self.upload())
+        picture.save()
+        Picture.objects.filter(pk=picture.pk).update(image="pictures/other.webp")
+        images.work(once=True)
+        job = ImageJob.objects.get()
+        self.assertEqual((job.state, job.detail), (ImageJob.DONE, "Изображение уже заменено"))
+        self.assertEqual(Picture.objects.get().image.name, "pictures/other.webp")
+
+
+class IngestBenchmarkTests(TestCase):
+    def test_synthetic_cdr_is_seeded(self):
+        records = synthetic_cdr(1000, seed=3, bad_rate=0.05)
+        self.assertEqual(records, synthetic_cdr(1000, seed=3, bad_rate=0.05))
+        self.assertNotEqual(records, synthetic_cdr(1000, seed=4, bad_rate=0.05))
+        self.assertTrue(20 <= len(RecordValidator().validate(records).errors) <= 80)
+        self.assertFalse(RecordValidator().validate(synthetic_cdr(1000, seed=3)).errors)
+
+    def test_report_and_baseline(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "baseline.json")
+            call_command("bench_ingest", rows=[300], repeat=1, output=path, stdout=io.StringIO())
+            with open(path) as fh:
+                report = json.load(fh)
+            self.assertEqual([r["stage"] for r in report["results"]], ["parse", "validate", "construct", "write"])
+            self.assertGreater(report["results"][-1]["queries"], 0)
+            self.assertFalse(CallRecord.objects.exists())
+
+            for r in report["results"]:
+                r["rows_per_s"] *= 1000
+            with open(path, "w") as fh:
+                json.dump(report, fh)
+            with self.assertRaises(CommandError):
+                call_command("bench_ingest", rows=[300], repeat=1, baseline=path, stdout=io.StringIO())
+
+
+@skipUnless(connection.vendor == "postgresql", "EXPLAIN checks need PostgreSQL")
+class CallRecordQueryPlanTests(TestCase):
+    # With seq scans priced out the planner still falls back to one when no
+    # index can serve the query, so these assert that a usable index exists.
+    def setUp(self):
+        make_records(200)
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE web_callrecord")
+            cursor.execute("SET enable_seqscan = off")
+
+    def tearDown(self):
+        with connection.cursor() as cursor:
+            cursor.execute("RESET enable_seqscan")
+
+    def plan(self, params, cursor=None):
+        qs = CallRecordFilter(params, queryset=CallRecord.objects.all()).qs
+        return KeysetPagination().page_queryset(qs, cursor, 100).explain()
+
+    def assertIndexed(self, params, cursor=None):
+        plan = self.plan(params, cursor)
+        self.assertNotIn("Seq Scan", plan, plan)
+        self.assertNotIn("Sort", plan, plan)
+
+    def test_first_page(self):
+        self.assertIndexed({})
+
+    def test_deep_page(self):
+        self.assertIndexed({}, (T0 + timedelta(minutes=30), 60))
+
+    def test_src_and_dst(self):
+        self.assertIndexed({"src": "101"}, (T0 + timedelta(minutes=30), 60))
+        self.assertIndexed({"dst": "202"})
+
+    def test_calldate_range(self):
+        plan = self.plan({"calldate_from": "2025-01-01T10:10:00Z", "calldate_to": "2025-01-01T11:00:00Z"})
+        self.assertNotIn("Seq Scan", plan, plan)
+
+
+@skipUnless(connection.vendor == "postgresql", "Partitioning needs PostgreSQL")
+class PartitionTests(TestCase):
+    def setUp(self):
+        make_records(20)
+        make_records(20, calldate=T0 + timedelta(days=40))
+        partitions.convert(months_ahead=0)
+
+    def tearDown(self):
+        partitions.forget()
+
+    def test_rows_kept_and_split_by_month(self):
+        months = partitions.list_partitions()
+        self.assertIn(datetime(2025, 1, 1).date(), months)
+        self.assertIn(datetime(2025, 2, 1).date(), months)
+        self.assertEqual(CallRecord.objects.count(), 40)
+        last_id = CallRecord.objects.order_by("-id").values_list("id", flat=True).first()
+        (record,) = make_records(1)
+        self.assertGreater(record.pk, last_id)
+
+    # Another process retires a month this process has cached; the next
+    # write recreates it instead of failing.
+    def test_month_retired_elsewhere_is_recreated(self):
+        march = date(2025, 3, 1)
+        row = (T0 + timedelta(days=60), "100", "200", 10, 5, CallRecord.ANSWERED, True)
+        for name, writer_class in WRITERS.items():
+            with self.subTest(writer=name):
+                writer = writer_class()
+                self.assertEqual(writer.write([row]), 1)
+                with connection.cursor() as cursor:
+                    table = connection.ops.quote_name(partitions.partition_name(march))
+                    cursor.execute(f"ALTER TABLE {partitions._table()} DETACH PARTITION {table}")
+                    cursor.execute(f"DROP TABLE {table}")
+                self.assertEqual(writer.write([row]), 1)
+                self.assertIn(march, partitions.list_partitions())
+
+    def test_month_query_reads_one_partition(self):
+        qs = CallRecordFilter(
+            {"calldate_from": "2025-01-01T00:00:00Z", "calldate_to": "2025-01-10T00:00:00Z"},
+            queryset=CallRecord.objects.all(),
+        ).qs
+        plan = KeysetPagination().page_queryset(qs, None, 100).explain()
+        self.assertIn(partitions.partition_name(datetime(2025, 1, 1).date()), plan)
+        self.assertNotIn(partitions.partition_name(datetime(2025, 2, 1).date()), plan)
@@ -0,0 +1,233 @@
+import glob
+import os
+import shutil
+import uuid
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from .ingest import CsvHeaderError
+from .jobs import CHUNK_SIZE, SPOOL_DIR, ingest_spooled
+from .ledger import ON_DUPLICATE_ALLOW, check_duplicate, hash_file, record_upload
+from .models import IngestJob, UploadLedger
+
+# Resumable uploads: a session is an IngestJob in the "uploading" state whose
+# spool file grows chunk by chunk. Every chunk that extends the file is
+# ingested right away, so finalize only has the last record left to do.
+SESSION_TTL = getattr(settings, "CALLS_UPLOAD_SESSION_TTL", 24 * 3600)
+MAX_CHUNK_BYTES = getattr(settings, "CALLS_UPLOAD_MAX_CHUNK_BYTES", 64 * 1024 * 1024)
+# Chunks that arrive ahead of the received offset wait next to the spool
+# file until the gap is filled; at most this many per session.
+MAX_PENDING_CHUNKS = getattr(settings, "CALLS_UPLOAD_MAX_PENDING_CHUNKS", 16)
+
+EXPIRED = "Сессия загрузки истекла"
+
+
+class UploadClosed(Exception):
+    def __init__(self, job):
+        super().__init__(job.detail or "Загрузка уже завершена")
+        self.job = job
+
+
+class UploadConflict(ValueError):
+    pass
+
+
+class DigestMismatch(ValueError):
+    pass
+
+
+def _remove_paths(paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def _remove_files(job):
+    _remove_paths([job.spool_path] + glob.glob(glob.escape(job.spool_path) + ".*"))
+
+
+def _chunk_files(job):
+    chunks = []
+    for path in glob.glob(glob.escape(job.spool_path) + ".*.chunk"):
+        start = int(path[len(job.spool_path) + 1:].split(".", 1)[0])
+        chunks.append((start, start + os.path.getsize(path), path))
+    return sorted(chunks)
+
+
+# Chunk files already merged may linger until their removal after commit.
+def pending_chunks(job):
+    return [chunk for chunk in _chunk_files(job) if chunk[1] > job.size]
+
+
+def _close(job, state, detail=""):
+    now = timezone.now()
+    job.state = state
+    job.detail = detail[:1000]
+    job.finished_at = now
+    job.expires_at = None
+    job.save(update_fields=["state", "detail", "finished_at", "expires_at", "updated_at"])
+
+
+# Sessions nobody has sent a chunk to for SESSION_TTL fail and lose their
+# files. Rows ingested before that stay, as with a failed job.
+def expire_uploads(now=None):
+    now = now or timezone.now()
+    expired = 0
+    for job in IngestJob.objects.filter(state=IngestJob.UPLOADING, expires_at__lt=now):
+        updated = IngestJob.objects.filter(pk=job.pk, state=IngestJob.UPLOADING, expires_at__lt=now).update(
+            state=IngestJob.FAILED, detail=EXPIRED, finished_at=now, expires_at=None, updated_at=now
+        )
+        if updated:
+            _remove_files(job)
+            expired += 1
+    return expired
+
+
+def create_upload(user=None, name="", total_size=None, sha256=None, dedup=False, on_duplicate=ON_DUPLICATE_ALLOW):
+    expire_uploads()
+    check_duplicate(sha256, on_duplicate)
+    os.makedirs(SPOOL_DIR, exist_ok=True)
+    path = os.path.join(SPOOL_DIR, f"{uuid.uuid4().hex}.csv")
+    open(path, "wb").close()
+    now = timezone.now()
+    with transaction.atomic():
+        job = IngestJob.objects.create(
+            state=IngestJob.UPLOADING, spool_path=path, total_size=total_size, created_by=user, dedup=dedup,
+            started_at=now, expires_at=now + timedelta(seconds=SESSION_TTL),
+        )
+        # The digest is filled in from the spool file on finalize.
+        record_upload(
+            sha256 or "", total_size or 0, name=name[:255], source=UploadLedger.SOURCE_JOB, created_by=user, job=job
+        )
+    return job
+
+
+def _lock(pk):
+    job = IngestJob.objects.select_for_update().get(pk=pk)
+    if job.state == IngestJob.UPLOADING and job.expires_at and job.expires_at < timezone.now():
+        _close(job, IngestJob.FAILED, EXPIRED)
+        transaction.on_commit(lambda: _remove_files(job))
+    return job
+
+
+# Stores bytes start.. of the file. A chunk that is already fully received
+# is acknowledged without reading it; one that overlaps the received end
+# only adds its new tail; one beyond it waits for the gap. A body cut short
+# by a dropped connection keeps what arrived. Returns the locked-and-saved
+# job, whose ``size`` is the offset to continue from.
+def receive_chunk(job, start, length, stream, total=None):
+    if job.state != IngestJob.UPLOADING:
+        raise UploadClosed(job)
+    limit = total if job.total_size is None else job.total_size
+    if limit is not None and start + length > limit:
+        raise UploadConflict("Фрагмент выходит за размер файла")
+    if start + length <= job.size:
+        return job
+    if start > job.size and len(pending_chunks(job)) >= MAX_PENDING_CHUNKS:
+        raise UploadConflict("Слишком много фрагментов впереди полученных данных")
+    path = f"{job.spool_path}.{start}.{uuid.uuid4().hex}.chunk"
+    received = 0
+    try:
+        with open(path + ".part", "wb") as fh:
+            while received < length:
+                data = stream.read(min(CHUNK_SIZE, length - received))
+                if not data:
+                    break
+                fh.write(data)
+                received += len(data)
+    except OSError:
+        pass
+    if received:
+        os.replace(path + ".part", path)
+    else:
+        os.remove(path + ".part")
+    return _merge(job.pk, total)
+
+
+def _merge(pk, total=None):
+    try:
+        with transaction.atomic():
+            job = _lock(pk)
+            if job.state == IngestJob.UPLOADING:
+                _append(job, total)
+                ingest_spooled(job)
+    except (CsvHeaderError, UnicodeDecodeError) as e:
+        _fail(pk, e)
+    if job.state != IngestJob.UPLOADING:
+        raise UploadClosed(job)
+    return job
+
+
+# Merged chunk files are removed only once the new size is committed; if
+# the transaction rolls back they are merged again by the next request.
+def _append(job, total):
+    size = job.size
+    merged = []
+    with open(job.spool_path, "r+b") as out:
+        # Anything past the saved size is from a request that did not
+        # commit; its sender will send it again.
+        out.seek(size)
+        out.truncate()
+        for start, end, path in _chunk_files(job):
+            if start > size:
+                break
+            if end > size:
+                with open(path, "rb") as src:
+                    src.seek(size - start)
+                    shutil.copyfileobj(src, out, CHUNK_SIZE)
+                size = end
+            merged.append(path)
+    transaction.on_commit(lambda: _remove_paths(merged))
+    job.size = size
+    if job.total_size is None:
+        job.total_size = total
+    job.expires_at = timezone.now() + timedelta(seconds=SESSION_TTL)
+    job.save(update_fields=["size", "total_size", "expires_at", "updated_at"])
+
+
+def _fail(pk, error):
+    with transaction.atomic():
+        job = _lock(pk)
+        if job.state == IngestJob.UPLOADING:
+            detail = "Файл должен быть в кодировке UTF-8" if isinstance(error, UnicodeDecodeError) else str(error)
+            _close(job, IngestJob.FAILED, detail)
+            transaction.on_commit(lambda: _remove_files(job))
+    raise error
+
+
+# Idempotent: finalizing a finished session again returns it unchanged.
+# A file whose sha256 differs from the declared one fails the session; the
+# rows ingested from its earlier chunks stay, as with a failed job.
+def finalize_upload(pk):
+    try:
+        with transaction.atomic():
+            job = _lock(pk)
+            if job.state == IngestJob.UPLOADING:
+                _finish(job)
+    except (CsvHeaderError, UnicodeDecodeError, DigestMismatch) as e:
+        _fail(pk, e)
+    if job.state != IngestJob.DONE:
+        raise UploadClosed(job)
+    _remove_files(job)
+    return job
+
+
+def _finish(job):
+    if pending_chunks(job):
+        raise UploadConflict("Не все фрагменты получены")
+    if job.total_size is not None and job.size != job.total_size:
+        raise UploadConflict("Файл получен не полностью")
+    ledger = UploadLedger.objects.filter(job=job).first()
+    with open(job.spool_path, "rb") as fh:
+        digest, size = hash_file(fh)
+    if ledger is not None and ledger.sha256 and ledger.sha256 != digest:
+        raise DigestMismatch("sha256 файла не совпадает с заявленным")
+    ingest_spooled(job, final=True)
+    if ledger is not None:
+        ledger.sha256 = digest
+        ledger.size = size
+        ledger.save(update_fields=["sha256", "size"])
+    _close(job, IngestJob.DONE)
@@ -1,8 +1,23 @@
 from django.urls import path
-from .views import BulkCallsCreateView
+from .views import (
+    BulkCallsCreateView, CallRecordExportView, CallRecordListView, CallStatsView, CallsCsvIngestView,
+    ErrorReportView, IngestJobCreateView, IngestJobDetailView, MetricsView, UploadFinalizeView,
+    UploadSessionCreateView, UploadSessionView,
+)
 
 app_name = "web"
 
 urlpatterns = [
+    path("calls/", CallRecordListView.as_view(), name="callrecord_list"),
+    path("calls/export/", CallRecordExportView.as_view(), name="callrecord_export"),
+    path("calls/stats/", CallStatsView.as_view(), name="callrecord_stats"),
     path("calls/bulk_create/", BulkCallsCreateView.as_view(), name="callrecord_bulk_create"),
+    path("calls/ingest_csv/", CallsCsvIngestView.as_view(), name="callrecord_ingest_csv"),
+    path("calls/reports/<str:report_id>/", ErrorReportView.as_view(), name="callrecord_error_report"),
+    path("calls/jobs/", IngestJobCreateView.as_view(), name="ingestjob_create"),
+    path("calls/jobs/<int:pk>/", IngestJobDetailView.as_view(), name="ingestjob_detail"),
+    path("calls/uploads/", UploadSessionCreateView.as_view(), name="upload_create"),
+    path("calls/uploads/<int:pk>/", UploadSessionView.as_view(), name="upload_detail"),
+    path("calls/uploads/<int:pk>/finalize/", UploadFinalizeView.as_view(), name="upload_finalize"),
+    path("metrics/", MetricsView.as_view(), name="metrics"),
 ]
@@ -0,0 +1,159 @@
+from . import metrics
+from .calldate import CalldateParser
+from .models import CallRecord
+
+FIELDS = ("calldate", "src", "dst", "duration", "billsec", "disposition")
+
+
+class ValidationResult:
+    __slots__ = ("columns", "lines", "errors")
+
+    def __init__(self, columns, lines, errors):
+        self.columns = columns
+        self.lines = lines
+        self.errors = errors
+
+    def rows(self):
+        c = self.columns
+        return list(zip(c["calldate"], c["src"], c["dst"], c["duration"], c["billsec"], c["disposition"], c["answered"]))
+
+    def error_dicts(self):
+        return [{"line": line, "errors": msgs} for line, msgs in self.errors]
+
+
+# Validates a whole batch column by column with the rules BulkCallsCreateView
+# has always applied. Limits are resolved once per validator and the
+# disposition lookup is memoized across batches.
+class RecordValidator:
+    def __init__(self, src_max_length=None, dst_max_length=None, tz=None):
+        opts = CallRecord._meta
+        self.src_max_length = src_max_length or opts.get_field("src").max_length
+        self.dst_max_length = dst_max_length or opts.get_field("dst").max_length
+        self.calldate_parser = CalldateParser(tz)
+        self._dispositions = {}
+
+    def normalize_disposition(self, value):
+        hit = self._dispositions.get(value) if type(value) is str else None
+        if hit is None:
+            disp = str(value).strip().lower()
+            if disp == "answered" or "answered" in disp:
+                hit = (CallRecord.ANSWERED, True)
+            elif disp == "no answer" or "no answer" in disp or "noanswer" in disp:
+                hit = (CallRecord.NO_ANSWER, False)
+            else:
+                hit = (CallRecord.OTHER, False)
+            if type(value) is str and len(self._dispositions) < 1024:
+                self._dispositions[value] = hit
+        return hit
+
+    def _calldates(self, col, fail):
+        parser = self.calldate_parser
+        parser.detect(col)
+        parse = parser.parse
+        out = [None] * len(col)
+        for i, v in enumerate(col):
+            if not v:
+                fail(i, "calldate пустой")
+                continue
+            dt = parse(v)
+            if dt is None:
+                fail(i, "Неверный формат calldate")
+                continue
+            out[i] = dt
+        return out
+
+    def _numbers(self, col, name, max_length, fail):
+        if all(col):
+            strs = [v if type(v) is str else str(v) for v in col]
+            if max(map(len, strs), default=0) <= max_length:
+                return strs
+        else:
+            strs = [v if type(v) is str else str(v) for v in col]
+        for i, v in enumerate(col):
+            if not v:
+                fail(i, f"{name} пустой")
+            elif len(strs[i]) > max_length:
+                fail(i, f"{name} слишком длинный")
+        return strs
+
+    def _ints(self, col, name, fail):
+        try:
+            ints = [int(v) for v in col]
+        except Exception:
+            ints = None
+        if ints is not None and (not ints or min(ints) >= 0):
+            return ints
+        out = [0] * len(col)
+        for i, v in enumerate(col):
+            try:
+                n = int(v)
+            except Exception:
+                fail(i, f"{name} должен быть целым числом")
+                continue
+            if n < 0:
+                fail(i, f"{name} < 0")
+            out[i] = n
+        return out
+
+    def _dispositions_col(self, col, fail):
+        lookup = self.normalize_disposition
+        if all(col):
+            return [lookup(v) for v in col]
+        out = [None] * len(col)
+        for i, v in enumerate(col):
+            if not v:
+                fail(i, "disposition пустой")
+            else:
+                out[i] = lookup(v)
+        return out
+
+    def validate_columns(self, columns, lines):
+        with metrics.stage("validate"):
+            result = self._validate_columns(columns, lines)
+        metrics.note(rows=len(result.lines) + len(result.errors), rejected=len(result.errors))
+        return result
+
+    def _validate_columns(self, columns, lines):
+        bad = {}
+
+        def fail(i, msg):
+            msgs = bad.get(i)
+            if msgs is None:
+                bad[i] = [msg]
+            else:
+                msgs.append(msg)
+
+        with metrics.stage("calldate"):
+            calldates = self._calldates(columns["calldate"], fail)
+        srcs = self._numbers(columns["src"], "src", self.src_max_length, fail)
+        dsts = self._numbers(columns["dst"], "dst", self.dst_max_length, fail)
+        durations = self._ints(columns["duration"], "duration", fail)
+        billsecs = self._ints(columns["billsec"], "billsec", fail)
+        dispositions = self._dispositions_col(columns["disposition"], fail)
+
+        if bad:
+            keep = [i for i in range(len(lines)) if i not in bad]
+            pick = lambda col: [col[i] for i in keep]  # noqa: E731
+            calldates, srcs, dsts = pick(calldates), pick(srcs), pick(dsts)
+            durations, billsecs, dispositions = pick(durations), pick(billsecs), pick(dispositions)
+            errors = [(lines[i], bad[i]) for i in sorted(bad)]
+            lines = pick(lines)
+        else:
+            errors = []
+
+        normalized = {
+            "calldate": calldates,
+            "src": [s.strip() for s in srcs],
+            "dst": [s.strip() for s in dsts],
+            "duration": durations,
+            "billsec": billsecs,
+            "disposition": [d[0] for d in dispositions],
+            "answered": [d[1] for d in dispositions],
+        }
+        return ValidationResult(normalized, lines, errors)
+
+    def validate(self, records, lines=None, first_line=1):
+        columns = {f: [r.get(f) for r in records] for f in FIELDS}
+        if lines is None:
+            lines = list(range(first_line, first_line + len(records)))
+        return self.validate_columns(columns, lines)
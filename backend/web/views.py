@@ -1,103 +1,564 @@
-from django.utils import timezone
-from django.utils.dateparse import parse_datetime
+import hmac
+import re
+from datetime import timedelta
+from urllib.parse import urlencode
+from django.conf import settings
 from django.db import transaction
-from rest_framework.generics import CreateAPIView
+from django.http import FileResponse, HttpResponse, QueryDict
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from django_filters.rest_framework import DjangoFilterBackend
+from rest_framework.generics import CreateAPIView, ListAPIView
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from .models import CallRecord
+from rest_framework.parsers import JSONParser, MultiPartParser
+from . import metrics
+from .jobs import iter_stream_chunks, spool_upload
+from .cache import ALL as CACHE_ALL, cached, span_keys
+from .export import FORMATS, export_response
+from .filters import CallRecordFilter
+from .models import CallRecord, IngestJob, UploadLedger
+from .pagination import KeysetPagination
+from .rollups import GROUPS, query_stats
 from .serializers import CallRecordSerializer
-from rest_framework.permissions import IsAuthenticated
+from .ingest import CsvHeaderError, ingest_records, iter_csv_records
+from .uploads import (
+    MAX_CHUNK_BYTES, DigestMismatch, UploadClosed, UploadConflict, create_upload, finalize_upload, pending_chunks,
+    receive_chunk,
+)
+from .rejects import MAX_ERRORS, ErrorReport, Rejects, find_report
+from .parsers import JSONRecordStream, JSONRecordStreamParser, RecordsNotAList
+from .ledger import (
+    ON_DUPLICATE_CHOICES, ON_DUPLICATE_REJECT, ON_DUPLICATE_RETURN, DuplicateUpload, HashingReader,
+    check_duplicate, hash_file, ledger_data, record_upload,
+)
+from .writers import get_writer
+from rest_framework.authentication import get_authorization_header
+from rest_framework.permissions import BasePermission, IsAdminUser, IsAuthenticated
 from UserAuth.auth import InMemoryTokenAuthentication
 
-class BulkCallsCreateView(APIView):
+METRICS_TOKEN = getattr(settings, "CALLS_METRICS_TOKEN", "")
+# bulk_create reads JSON bodies record by record instead of through
+# JSONParser (see web.parsers).
+BULK_STREAM_JSON = getattr(settings, "CALLS_BULK_CREATE_STREAM_JSON", True)
+
+def _flag(request, name):
+    return str(request.query_params.get(name, "")).lower() in ("1", "true", "yes")
+
+
+def _created_response(created, writer, entry=None, rejects=None):
+    data = {"created": created}
+    if writer.dedup:
+        data["duplicates"] = writer.duplicates
+    if entry is not None:
+        data["upload"] = entry.pk
+    if rejects is not None and (rejects.count or rejects.report is not None):
+        data.update(_rejects_data(rejects))
+    return Response(data, status=status.HTTP_201_CREATED)
+
+
+# ?max_errors=N (at most CALLS_INGEST_MAX_ERRORS) rejected lines are
+# returned in full, ?accept_valid=1 keeps the valid rows, ?report=1 writes
+# every reject to an NDJSON file served by ErrorReportView.
+def _rejects(request):
+    raw = request.query_params.get("max_errors")
+    max_errors = MAX_ERRORS
+    if raw not in (None, ""):
+        try:
+            max_errors = int(raw)
+        except ValueError:
+            return None
+        if max_errors < 0:
+            return None
+        max_errors = min(max_errors, MAX_ERRORS)
+    report = ErrorReport(request.user.pk) if _flag(request, "report") else None
+    return Rejects(max_errors, accept_valid=_flag(request, "accept_valid"), report=report)
+
+
+def _rejects_data(rejects):
+    url = None
+    if rejects.report is not None:
+        url = reverse("web:callrecord_error_report", args=[rejects.report.id])
+    return rejects.data(url)
+
+
+def _rejected_response(rejects):
+    return Response(_rejects_data(rejects), status=status.HTTP_400_BAD_REQUEST)
+
+
+_BAD_MAX_ERRORS = {"detail": f"max_errors: целое число от 0 до {MAX_ERRORS}"}
+
+
+def _on_duplicate(request):
+    value = request.query_params.get("on_duplicate", ON_DUPLICATE_RETURN)
+    return value if value in ON_DUPLICATE_CHOICES else None
+
+
+# Ingest views run inside metrics.track(): stage timings, rows, bytes and
+# queries go to the /api/metrics/ histograms and back in Server-Timing.
+class IngestMetricsMixin:
+    metrics_endpoint = None
+    metrics_methods = ("POST",)
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method not in self.metrics_methods:
+            return super().dispatch(request, *args, **kwargs)
+        with metrics.track(self.metrics_endpoint) as timings:
+            try:
+                timings.bytes = int(request.META.get("CONTENT_LENGTH") or 0)
+            except ValueError:
+                pass
+            response = super().dispatch(request, *args, **kwargs)
+            timings.status = response.status_code
+        if metrics.ENABLED:
+            response["Server-Timing"] = timings.server_timing()
+        return response
+
+
+def _duplicate_response(entry, on_duplicate):
+    if on_duplicate == ON_DUPLICATE_REJECT:
+        return Response(
+            {"detail": "Этот файл уже загружался", "duplicate_of": ledger_data(entry)},
+            status=status.HTTP_409_CONFLICT,
+        )
+    return Response({"created": 0, "duplicate_of": ledger_data(entry)}, status=status.HTTP_200_OK)
+
+
+class BulkCallsCreateView(IngestMetricsMixin, APIView):
     authentication_classes = [InMemoryTokenAuthentication]
     permission_classes = [IsAuthenticated]
+    metrics_endpoint = "bulk_create"
+
+    def get_parsers(self):
+        parsers = super().get_parsers()
+        if not BULK_STREAM_JSON:
+            return parsers
+        return [JSONRecordStreamParser()] + [p for p in parsers if not isinstance(p, JSONParser)]
+
     def post(self, request):
-        records = request.data.get("records")
+        with metrics.stage("parse"):
+            data = request.data
+        if isinstance(data, JSONRecordStream):
+            return self.post_stream(request, data)
+        records = data.get("records")
         if not isinstance(records, list):
             return Response({"detail": "records должен быть списком"}, status=status.HTTP_400_BAD_REQUEST)
-        errors = []
-        instances = []
-        for idx, rec in enumerate(records):
-            line = idx + 1
-            line_errors = []
-            calldate = rec.get("calldate")
-            src = rec.get("src")
-            dst = rec.get("dst")
-            duration = rec.get("duration")
-            billsec = rec.get("billsec")
-            disposition = rec.get("disposition", "")
-
-            if not calldate:
-                line_errors.append("calldate пустой")
-            else:
-                dt = parse_datetime(calldate)
-                if dt is None:
-                    dt = parse_datetime(str(calldate).replace(" ", "T"))
-                if dt is None:
-                    line_errors.append("Неверный формат calldate")
-                else:
-                    if timezone.is_naive(dt):
-                        dt = timezone.make_aware(dt, timezone.get_current_timezone())
-
-            if not src:
-                line_errors.append("src пустой")
-            elif len(str(src)) > 64:
-                line_errors.append("src слишком длинный")
-
-            if not dst:
-                line_errors.append("dst пустой")
-            elif len(str(dst)) > 64:
-                line_errors.append("dst слишком длинный")
+        rejects = _rejects(request)
+        if rejects is None:
+            return Response(_BAD_MAX_ERRORS, status=status.HTTP_400_BAD_REQUEST)
+        writer = get_writer(dedup=_flag(request, "dedup") or request.data.get("dedup") is True)
+        created, _errors = ingest_records(enumerate(records, 1), writer=writer, rejects=rejects)
+        if rejects.failed:
+            return _rejected_response(rejects)
+        return _created_response(created, writer, rejects=rejects)
+
+    # Validated and written batch by batch while the body is still being
+    # read; any rejected record rolls everything back, as above. A body
+    # "dedup" flag only counts before "records" (or as ?dedup=1): after it
+    # the rows are already written without deduplication.
+    def post_stream(self, request, body):
+        try:
+            body.open()
+        except RecordsNotAList:
+            return Response({"detail": "records должен быть списком"}, status=status.HTTP_400_BAD_REQUEST)
+        rejects = _rejects(request)
+        if rejects is None:
+            return Response(_BAD_MAX_ERRORS, status=status.HTTP_400_BAD_REQUEST)
+        writer = get_writer(dedup=_flag(request, "dedup") or body.head.get("dedup") is True)
+        with transaction.atomic():
+            created, _errors = ingest_records(body, writer=writer, rejects=rejects)
+            if rejects.failed:
+                return _rejected_response(rejects)
+            if body.tail.get("dedup") is True and not writer.dedup:
+                transaction.set_rollback(True)
+                return Response(
+                    {"detail": "dedup нужно передавать до records или параметром ?dedup=1"},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+        return _created_response(created, writer, rejects=rejects)
+
+
+class CallsCsvIngestView(IngestMetricsMixin, APIView):
+    authentication_classes = [InMemoryTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+    parser_classes = [MultiPartParser]
+    metrics_endpoint = "ingest_csv"
+
+    # Multipart files are already on disk, so they are hashed before parsing
+    # and a known file is answered without touching it. A raw body is hashed
+    # while it streams (or checked up front if the client sends
+    # X-Content-SHA256) and a late match rolls the insert back. The check is
+    # repeated by record_upload under a lock, for identical uploads that
+    # overlap.
+    def post(self, request):
+        on_duplicate = _on_duplicate(request)
+        if on_duplicate is None:
+            return Response({"detail": "on_duplicate: return, reject или allow"}, status=status.HTTP_400_BAD_REQUEST)
+        claimed = request.headers.get("X-Content-SHA256", "").strip().lower() or None
+        name = ""
+        digest = size = None
+        if request.content_type.startswith("multipart/"):
+            upload = request.FILES.get("file")
+            if upload is None:
+                return Response({"detail": "Файл не передан"}, status=status.HTTP_400_BAD_REQUEST)
+            digest, size = hash_file(upload.file)
+            name = upload.name or ""
+            stream = upload.file
+        elif request.stream is not None:
+            stream = HashingReader(request.stream)
+        else:
+            return Response({"detail": "Файл не передан"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            check_duplicate(digest or claimed, on_duplicate)
+        except DuplicateUpload as e:
+            return _duplicate_response(e.entry, on_duplicate)
 
+        rejects = _rejects(request)
+        if rejects is None:
+            return Response(_BAD_MAX_ERRORS, status=status.HTTP_400_BAD_REQUEST)
+        writer = get_writer(dedup=_flag(request, "dedup"))
+        with transaction.atomic():
             try:
-                d = int(duration)
-                if d < 0:
-                    line_errors.append("duration < 0")
-            except Exception:
-                line_errors.append("duration должен быть целым числом")
+                created, _errors = ingest_records(iter_csv_records(stream), writer=writer, rejects=rejects)
+            except CsvHeaderError as e:
+                return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            except UnicodeDecodeError:
+                return Response({"detail": "Файл должен быть в кодировке UTF-8"}, status=status.HTTP_400_BAD_REQUEST)
+
+            if rejects.failed:
+                return _rejected_response(rejects)
+
+            if digest is None:
+                digest, size = stream.hexdigest(), stream.size
+                if claimed and claimed != digest:
+                    transaction.set_rollback(True)
+                    return Response({"detail": "X-Content-SHA256 не совпадает с телом запроса"}, status=status.HTTP_400_BAD_REQUEST)
 
             try:
-                b = int(billsec)
-                if b < 0:
-                    line_errors.append("billsec < 0")
-            except Exception:
-                line_errors.append("billsec должен быть целым числом")
-
-            if not disposition:
-                line_errors.append("disposition пустой")
-
-            if line_errors:
-                errors.append({"line": line, "errors": line_errors})
-            else:
-                disp = str(disposition).strip().lower()
-                if disp == "answered" or "answered" in disp:
-                    norm_disp = CallRecord.ANSWERED
-                    answered_flag = True
-                elif disp == "no answer" or "no answer" in disp or "noanswer" in disp:
-                    norm_disp = CallRecord.NO_ANSWER
-                    answered_flag = False
-                else:
-                    norm_disp = CallRecord.OTHER
-                    answered_flag = False
-
-                instances.append(
-                    CallRecord(
-                        calldate=dt,
-                        src=str(src).strip(),
-                        dst=str(dst).strip(),
-                        duration=int(duration),
-                        billsec=int(billsec),
-                        disposition=norm_disp,
-                        answered=answered_flag,
-                    )
+                entry = record_upload(
+                    digest, size, writer, created, on_duplicate=on_duplicate, name=name,
+                    source=UploadLedger.SOURCE_CSV, created_by=request.user,
                 )
+            except DuplicateUpload as e:
+                transaction.set_rollback(True)
+                return _duplicate_response(e.entry, on_duplicate)
 
-        if errors:
-            return Response({"errors": errors}, status=status.HTTP_400_BAD_REQUEST)
+        return _created_response(created, writer, entry, rejects)
 
-        with transaction.atomic():
-            CallRecord.objects.bulk_create(instances)
 
-        return Response({"created": len(instances)}, status=status.HTTP_201_CREATED)
+class IngestJobCreateView(IngestMetricsMixin, APIView):
+    authentication_classes = [InMemoryTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+    parser_classes = [MultiPartParser]
+    metrics_endpoint = "job_upload"
+
+    def post(self, request):
+        on_duplicate = _on_duplicate(request)
+        if on_duplicate is None:
+            return Response({"detail": "on_duplicate: return, reject или allow"}, status=status.HTTP_400_BAD_REQUEST)
+        name = ""
+        if request.content_type.startswith("multipart/"):
+            upload = request.FILES.get("file")
+            chunks = upload.chunks() if upload else None
+            name = upload.name if upload else ""
+        else:
+            chunks = iter_stream_chunks(request.stream) if request.stream is not None else None
+        if chunks is None:
+            return Response({"detail": "Файл не передан"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            with metrics.stage("spool"):
+                job = spool_upload(
+                    chunks, user=request.user, dedup=_flag(request, "dedup"), on_duplicate=on_duplicate,
+                    name=name or "",
+                )
+        except DuplicateUpload as e:
+            return _duplicate_response(e.entry, on_duplicate)
+        except CsvHeaderError as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except UnicodeDecodeError:
+            return Response({"detail": "Файл должен быть в кодировке UTF-8"}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({"job": job.pk, "state": job.state}, status=status.HTTP_202_ACCEPTED)
+
+
+def _user_jobs(user):
+    qs = IngestJob.objects.all()
+    return qs if user.is_staff else qs.filter(created_by=user)
+
+
+class IngestJobDetailView(APIView):
+    authentication_classes = [InMemoryTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, pk):
+        job = _user_jobs(request.user).filter(pk=pk).first()
+        if job is None:
+            return Response({"detail": "Задача не найдена"}, status=status.HTTP_404_NOT_FOUND)
+        return Response(
+            {
+                "job": job.pk,
+                "state": job.state,
+                "processed": job.processed,
+                "created": job.created_rows,
+                "duplicates": job.duplicates,
+                "rejected": job.rejected,
+                "throughput": job.throughput,
+                "errors": job.errors,
+                "detail": job.detail,
+                "created_at": job.created_at,
+                "started_at": job.started_at,
+                "finished_at": job.finished_at,
+            },
+            status=status.HTTP_200_OK,
+        )
+
+
+# Reports are kept per user; staff can fetch anyone's.
+class ErrorReportView(APIView):
+    authentication_classes = [InMemoryTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, report_id):
+        path = find_report(report_id, None if request.user.is_staff else request.user.pk)
+        if path is None:
+            return Response({"detail": "Отчёт не найден"}, status=status.HTTP_404_NOT_FOUND)
+        return FileResponse(
+            open(path, "rb"), as_attachment=True, filename=f"rejects-{report_id}.ndjson",
+            content_type="application/x-ndjson",
+        )
+
+
+_CONTENT_RANGE = re.compile(r"^bytes (\d+)-(\d+)/(\d+|\*)$")
+
+
+def _upload_data(job):
+    pending = pending_chunks(job) if job.state == IngestJob.UPLOADING else []
+    return {
+        "upload": job.pk,
+        "state": job.state,
+        "offset": job.size,
+        "size": job.total_size,
+        "pending": [[start, end] for start, end, _path in pending],
+        "ingested": job.offset,
+        "processed": job.processed,
+        "created": job.created_rows,
+        "duplicates": job.duplicates,
+        "rejected": job.rejected,
+        "detail": job.detail,
+        "expires_at": job.expires_at,
+    }
+
+
+def _upload_response(job, code=status.HTTP_200_OK):
+    response = Response(_upload_data(job), status=code)
+    response["Upload-Offset"] = str(job.size)
+    return response
+
+
+def _closed_response(job):
+    return Response(
+        {"detail": job.detail or "Загрузка уже завершена", "state": job.state, "offset": job.size},
+        status=status.HTTP_409_CONFLICT,
+    )
+
+
+# Resumable upload of a large CSV: POST creates a session (JSON body with
+# optional name, size, sha256, dedup), each chunk is a PUT with
+# Content-Range: bytes start-end/total, GET (or HEAD) tells how much was
+# received, finalize ingests the rest. Progress and errors are also on
+# /api/calls/jobs/<id>/, a session is an IngestJob.
+class UploadSessionCreateView(APIView):
+    authentication_classes = [InMemoryTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+    parser_classes = [JSONParser]
+
+    def post(self, request):
+        on_duplicate = _on_duplicate(request)
+        if on_duplicate is None:
+            return Response({"detail": "on_duplicate: return, reject или allow"}, status=status.HTTP_400_BAD_REQUEST)
+        data = request.data if isinstance(request.data, dict) else {}
+        size = data.get("size")
+        if size is not None and (type(size) is not int or size < 0):
+            return Response({"detail": "size должен быть целым числом >= 0"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            job = create_upload(
+                user=request.user, name=str(data.get("name") or ""), total_size=size,
+                sha256=str(data.get("sha256") or "").strip().lower() or None,
+                dedup=_flag(request, "dedup") or data.get("dedup") is True, on_duplicate=on_duplicate,
+            )
+        except DuplicateUpload as e:
+            return _duplicate_response(e.entry, on_duplicate)
+        response = _upload_response(job, status.HTTP_201_CREATED)
+        response["Location"] = reverse("web:upload_detail", args=[job.pk])
+        return response
+
+
+class UploadSessionView(IngestMetricsMixin, APIView):
+    authentication_classes = [InMemoryTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+    metrics_endpoint = "upload"
+    metrics_methods = ("PUT",)
+
+    def get(self, request, pk):
+        job = _user_jobs(request.user).filter(pk=pk).first()
+        if job is None:
+            return Response({"detail": "Загрузка не найдена"}, status=status.HTTP_404_NOT_FOUND)
+        return _upload_response(job)
+
+    # A chunk ahead of the received offset is kept and answered with 202;
+    # the client may go on sending and fill the gap later.
+    def put(self, request, pk):
+        match = _CONTENT_RANGE.match(request.headers.get("Content-Range", ""))
+        if match is None or int(match[2]) < int(match[1]):
+            return Response(
+                {"detail": "Нужен заголовок Content-Range: bytes начало-конец/размер"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        start, length = int(match[1]), int(match[2]) - int(match[1]) + 1
+        total = None if match[3] == "*" else int(match[3])
+        if length > MAX_CHUNK_BYTES:
+            return Response(
+                {"detail": f"Фрагмент больше {MAX_CHUNK_BYTES} байт"}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+            )
+        job = _user_jobs(request.user).filter(pk=pk).first()
+        if job is None:
+            return Response({"detail": "Загрузка не найдена"}, status=status.HTTP_404_NOT_FOUND)
+        if request.stream is None:
+            return Response({"detail": "Фрагмент не передан"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            job = receive_chunk(job, start, length, request.stream, total)
+        except UploadClosed as e:
+            return _closed_response(e.job)
+        except UploadConflict as e:
+            return Response({"detail": str(e), "offset": job.size}, status=status.HTTP_409_CONFLICT)
+        except CsvHeaderError as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except UnicodeDecodeError:
+            return Response({"detail": "Файл должен быть в кодировке UTF-8"}, status=status.HTTP_400_BAD_REQUEST)
+        return _upload_response(job, status.HTTP_202_ACCEPTED if job.size < start else status.HTTP_200_OK)
+
+
+class UploadFinalizeView(IngestMetricsMixin, APIView):
+    authentication_classes = [InMemoryTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+    metrics_endpoint = "upload"
+
+    def post(self, request, pk):
+        job = _user_jobs(request.user).filter(pk=pk).first()
+        if job is None:
+            return Response({"detail": "Загрузка не найдена"}, status=status.HTTP_404_NOT_FOUND)
+        try:
+            job = finalize_upload(job.pk)
+        except UploadClosed as e:
+            return _closed_response(e.job)
+        except UploadConflict as e:
+            return Response({"detail": str(e), "offset": job.size}, status=status.HTTP_409_CONFLICT)
+        except (CsvHeaderError, DigestMismatch) as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except UnicodeDecodeError:
+            return Response({"detail": "Файл должен быть в кодировке UTF-8"}, status=status.HTTP_400_BAD_REQUEST)
+        return _upload_response(job)
+
+
+class CallRecordListView(ListAPIView):
+    authentication_classes = [InMemoryTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+    serializer_class = CallRecordSerializer
+    pagination_class = KeysetPagination
+    filter_backends = [DjangoFilterBackend]
+    filterset_class = CallRecordFilter
+    queryset = CallRecord.objects.only(*CallRecordSerializer.Meta.fields)
+
+    # A page only changes when rows land on a day between its last row and
+    # its upper bound (the cursor or calldate_to); an unbounded end depends
+    # on every write.
+    def _dependencies(self, page, paginator):
+        bounds = self.filterset_class(self.request.query_params).form
+        bounds.is_valid()
+        upper = paginator.cursor[0] if paginator.cursor else bounds.cleaned_data.get("calldate_to")
+        lower = page[-1].calldate if paginator.has_next else bounds.cleaned_data.get("calldate_from")
+        if upper is None or lower is None:
+            return [CACHE_ALL]
+        return span_keys(timezone.localdate(lower), timezone.localdate(upper))
+
+    def list(self, request, *args, **kwargs):
+        def compute():
+            paginator = self.pagination_class()
+            page = paginator.paginate_queryset(self.filter_queryset(self.get_queryset()), request, self)
+            data = list(self.get_serializer(page, many=True).data)
+            return (data, paginator.next_cursor), self._dependencies(page, paginator)
+
+        data, self.paginator.next_cursor = cached("calls", request.query_params, compute)
+        self.paginator.request = request
+        return self.paginator.get_paginated_response(data)
+
+
+class CallRecordExportView(APIView):
+    authentication_classes = [InMemoryTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        fmt = request.query_params.get("fmt", "csv")
+        if fmt not in FORMATS:
+            return Response({"detail": "fmt: csv или ndjson"}, status=status.HTTP_400_BAD_REQUEST)
+        filterset = CallRecordFilter(request.query_params, queryset=CallRecord.objects.all(), request=request)
+        if not filterset.is_valid():
+            return Response(filterset.errors, status=status.HTTP_400_BAD_REQUEST)
+        return export_response(filterset.qs, fmt, compress=_flag(request, "gzip"))
+
+
+class CallStatsView(APIView):
+    authentication_classes = [InMemoryTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        params = request.query_params
+        try:
+            day_to = parse_date(params["day_to"]) if params.get("day_to") else timezone.localdate()
+            day_from = parse_date(params["day_from"]) if params.get("day_from") else day_to - timedelta(days=29)
+            limit = min(int(params.get("limit", 100)), 1000)
+        except ValueError:
+            day_from = day_to = limit = None
+        if day_from is None or day_to is None or limit is None or limit < 1 or day_from > day_to:
+            return Response({"detail": "Неверные day_from, day_to или limit"}, status=status.HTTP_400_BAD_REQUEST)
+        group = params.get("group", "day")
+        if group not in GROUPS:
+            return Response({"detail": "group: day, src или dst"}, status=status.HTTP_400_BAD_REQUEST)
+        src, dst = params.get("src"), params.get("dst")
+        # Rollups are kept per src and per dst, never per pair, so the other
+        # side's filter could only be ignored.
+        if (src and dst) or (src and group == "dst") or (dst and group == "src"):
+            return Response(
+                {"detail": "src и dst нельзя сочетать друг с другом или с группировкой по другому полю"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        def compute():
+            rows, totals = query_stats(day_from, day_to, group, src, dst, limit)
+            return (rows, totals), span_keys(day_from, day_to)
+
+        # Keyed on the resolved window: a request without day_to means a
+        # different window after midnight.
+        resolved = {"day_from": day_from, "day_to": day_to, "group": group, "src": src or "", "dst": dst or "",
+                    "limit": limit}
+        rows, totals = cached("stats", QueryDict(urlencode(resolved)), compute)
+        return Response({"day_from": day_from, "day_to": day_to, "group": group, "totals": totals, "results": rows})
+
+
+# For scrapers: Authorization: Bearer <CALLS_METRICS_TOKEN>.
+class HasMetricsToken(BasePermission):
+    def has_permission(self, request, view):
+        auth = get_authorization_header(request).split()
+        if not METRICS_TOKEN or len(auth) != 2 or auth[0].lower() != b"bearer":
+            return False
+        return hmac.compare_digest(auth[1], METRICS_TOKEN.encode())
+
+
+class MetricsView(APIView):
+    authentication_classes = [InMemoryTokenAuthentication]
+    permission_classes = [IsAdminUser | HasMetricsToken]
+
+    def get(self, request):
+        return HttpResponse(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
@@ -0,0 +1,241 @@
+import io
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Max, Min
+from . import metrics
+from .models import CallRecord
+from .partitions import write_partitioned
+from .rollups import RollupDelta, apply_rows
+
+# Order of the tuples produced by ValidationResult.rows().
+ROW_FIELDS = ("calldate", "src", "dst", "duration", "billsec", "disposition", "answered")
+BATCH_SIZE = getattr(settings, "CALLS_INGEST_BATCH_SIZE", 5000)
+DEDUP_RETRIES = getattr(settings, "CALLS_DEDUP_RETRIES", 3)
+
+
+class _IdRange:
+    first_id = None
+    last_id = None
+
+    def _track(self, first_id, last_id):
+        if first_id is not None and (self.first_id is None or first_id < self.first_id):
+            self.first_id = first_id
+        if last_id is not None and (self.last_id is None or last_id > self.last_id):
+            self.last_id = last_id
+
+
+# With dedup=True every row gets a fingerprint and rows whose fingerprint is
+# already stored (or repeated within the batch) are skipped and counted in
+# ``duplicates``; write() returns the number of rows actually inserted.
+# first_id/last_id bound the ids of everything the writer inserted.
+# The daily rollups for the inserted rows are updated in the same
+# transaction as the insert.
+class BulkCreateWriter(_IdRange):
+    name = "bulk_create"
+
+    def __init__(self, batch_size=BATCH_SIZE, dedup=False):
+        self.batch_size = batch_size
+        self.dedup = dedup
+        self.duplicates = 0
+
+    def write(self, rows):
+        with metrics.stage("write"), transaction.atomic():
+            if self.dedup:
+                return self._write_dedup(rows)
+            return self._write(rows)
+
+    def _write(self, rows):
+        rollup = RollupDelta.from_rows(rows)
+        instances = [CallRecord(**dict(zip(ROW_FIELDS, row))) for row in rows]
+        write_partitioned(rollup.days, lambda: CallRecord.objects.bulk_create(instances, batch_size=self.batch_size))
+        rollup.apply()
+        if instances and instances[0].pk is not None:
+            self._track(instances[0].pk, instances[-1].pk)
+        elif instances:
+            self._track_by_max(len(instances))
+        return len(instances)
+
+    def _track_by_max(self, count):
+        last = CallRecord.objects.order_by("-id").values_list("id", flat=True).first()
+        if last is not None:
+            self._track(last - count + 1, last)
+
+    def _write_dedup(self, rows):
+        make = CallRecord.make_fingerprint
+        by_fp = {}
+        for row in rows:
+            by_fp.setdefault(make(*row[:6]), row)
+        # A concurrent writer may commit some of the same fingerprints between
+        # the check and the insert; the insert then fails as a whole and the
+        # check runs again, so only rows this writer inserted are counted.
+        for attempt in range(DEDUP_RETRIES):
+            fresh = self._fresh(by_fp)
+            rollup = RollupDelta.from_rows([row for _fp, row in fresh])
+            instances = [CallRecord(fingerprint=fp, **dict(zip(ROW_FIELDS, row))) for fp, row in fresh]
+            try:
+                write_partitioned(rollup.days, lambda: CallRecord.objects.bulk_create(instances, batch_size=self.batch_size))
+                break
+            except IntegrityError:
+                if attempt == DEDUP_RETRIES - 1:
+                    raise
+        rollup.apply()
+        self.duplicates += len(rows) - len(instances)
+        if instances and instances[0].pk is not None:
+            self._track(min(i.pk for i in instances), max(i.pk for i in instances))
+        elif instances:
+            bounds = CallRecord.objects.filter(fingerprint__in=[i.fingerprint for i in instances]).aggregate(
+                first=Min("id"), last=Max("id")
+            )
+            self._track(bounds["first"], bounds["last"])
+        return len(instances)
+
+    def _fresh(self, by_fp):
+        existing = set()
+        fps = list(by_fp)
+        for i in range(0, len(fps), self.batch_size):
+            existing.update(
+                CallRecord.objects.filter(fingerprint__in=fps[i:i + self.batch_size]).values_list("fingerprint", flat=True)
+            )
+        return [(fp, row) for fp, row in by_fp.items() if fp not in existing]
+
+    # encode() may run in another process; write_encoded() takes its output.
+    def encode(self, rows):
+        return rows
+
+    def write_encoded(self, payload):
+        return self.write(payload)
+
+
+def _escape(s):
+    if "\\" in s or "\t" in s or "\n" in s or "\r" in s:
+        return s.replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+    return s
+
+
+# created_at/updated_at are left out of the COPY column list so PostgreSQL
+# fills them from their db_default. In dedup mode rows are copied into a
+# temporary staging table first and moved over with an anti-join on the
+# fingerprint index plus ON CONFLICT DO NOTHING, and the rollups are
+# computed from the rows the merge actually returns.
+class CopyWriter(_IdRange):
+    name = "copy"
+    STAGE_TABLE = "web_callrecord_stage"
+
+    def __init__(self, batch_size=BATCH_SIZE, dedup=False):
+        self.batch_size = batch_size
+        self.dedup = dedup
+        self.duplicates = 0
+        qn = connection.ops.quote_name
+        opts = CallRecord._meta
+        fields = ROW_FIELDS + ("fingerprint",) if dedup else ROW_FIELDS
+        qcols = [qn(opts.get_field(f).column) for f in fields]
+        cols = ", ".join(qcols)
+        table = qn(opts.db_table)
+        self.seq_sql = f"pg_get_serial_sequence('{table}', '{opts.pk.column}')"
+        if not dedup:
+            self.sql = f"COPY {table} ({cols}) FROM STDIN"
+            return
+        stage = qn(self.STAGE_TABLE)
+        fp = qn(opts.get_field("fingerprint").column)
+        calldate = qn(opts.get_field("calldate").column)
+        defs = ", ".join(f"{qn(opts.get_field(f).column)} {opts.get_field(f).db_type(connection)}" for f in fields)
+        self.stage_sql = f"CREATE TEMP TABLE IF NOT EXISTS {stage} ({defs}) ON COMMIT DROP"
+        self.sql = f"COPY {stage} ({cols}) FROM STDIN"
+        self.merge_sql = (
+            f"INSERT INTO {table} ({cols}) "
+            f"SELECT DISTINCT ON (s.{fp}) {', '.join('s.' + c for c in qcols)} FROM {stage} s "
+            f"WHERE NOT EXISTS (SELECT 1 FROM {table} t WHERE t.{fp} = s.{fp} AND t.{calldate} = s.{calldate}) "
+            f"ON CONFLICT ({fp}, {calldate}) DO NOTHING "
+            f"RETURNING {', '.join(qcols[:len(ROW_FIELDS)])}"
+        )
+        self.truncate_sql = f"TRUNCATE {stage}"
+
+    # COPY does not return ids. One nextval() taken before the first copy is
+    # a lower bound for everything this session inserts afterwards, and
+    # currval() after each copy is the upper bound.
+    # copy_expert bypasses Django's execute wrappers, so each COPY is
+    # counted for the metrics by hand.
+    def _copy(self, buf, count, rollup):
+        with metrics.stage("write"):
+            return write_partitioned(rollup.days, lambda: self._copy_batch(buf, count, rollup))
+
+    def _copy_batch(self, buf, count, rollup):
+        buf.seek(0)
+        with connection.cursor() as cursor:
+            if self.first_id is None:
+                cursor.execute(f"SELECT nextval({self.seq_sql})")
+                self.first_id = cursor.fetchone()[0]
+            if self.dedup:
+                cursor.execute(self.stage_sql)
+                cursor.copy_expert(self.sql, buf)
+                metrics.note(queries=1)
+                cursor.execute(self.merge_sql)
+                merged = cursor.fetchall()
+                inserted = len(merged)
+                cursor.execute(self.truncate_sql)
+                self.duplicates += count - inserted
+                apply_rows(merged)
+            else:
+                cursor.copy_expert(self.sql, buf)
+                metrics.note(queries=1)
+                inserted = count
+                rollup.apply()
+            cursor.execute(f"SELECT currval({self.seq_sql})")
+            self._track(None, cursor.fetchone()[0])
+        return inserted
+
+    # All batches of a call commit together; in dedup mode the stage table
+    # (ON COMMIT DROP) also has to outlive each statement.
+    def write(self, rows):
+        total = 0
+        with transaction.atomic():
+            for i in range(0, len(rows), self.batch_size):
+                total += self._write_encoded(self.encode(rows[i:i + self.batch_size]))
+        return total
+
+    # Renders validated rows (see ROW_FIELDS) straight to COPY text so the
+    # work can be done in a worker process and shipped back as one string,
+    # together with the rollup delta for those rows. In dedup mode the delta
+    # only tells which partitions the batch needs; the rollups are taken from
+    # what the merge returns.
+    def encode(self, rows):
+        with metrics.stage("encode"):
+            return self._encode(rows)
+
+    def _encode(self, rows):
+        esc = _escape
+        if self.dedup:
+            make = CallRecord.make_fingerprint
+            text = "".join(
+                f"{calldate.isoformat()}\t{esc(src)}\t{esc(dst)}\t{duration}\t{billsec}\t{disposition}\t{'t' if answered else 'f'}"
+                f"\t{make(calldate, src, dst, duration, billsec, disposition)}\n"
+                for calldate, src, dst, duration, billsec, disposition, answered in rows
+            )
+        else:
+            text = "".join(
+                f"{calldate.isoformat()}\t{esc(src)}\t{esc(dst)}\t{duration}\t{billsec}\t{disposition}\t{'t' if answered else 'f'}\n"
+                for calldate, src, dst, duration, billsec, disposition, answered in rows
+            )
+        return len(rows), text, RollupDelta.from_rows(rows)
+
+    def write_encoded(self, payload):
+        with transaction.atomic():
+            return self._write_encoded(payload)
+
+    def _write_encoded(self, payload):
+        count, text, rollup = payload
+        if not count:
+            return 0
+        return self._copy(io.StringIO(text), count, rollup)
+
+
+WRITERS = {w.name: w for w in (BulkCreateWriter, CopyWriter)}
+
+
+def get_writer(name=None, **kwargs):
+    name = name or getattr(settings, "CALLS_INGEST_WRITER", "auto")
+    if name == "auto":
+        name = CopyWriter.name if connection.vendor == "postgresql" else BulkCreateWriter.name
+    if name == CopyWriter.name and connection.vendor != "postgresql":
+        name = BulkCreateWriter.name
+    return WRITERS[name](**kwargs)